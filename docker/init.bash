@@ -44,6 +44,9 @@ gosu "${UWSGI_USER}" python manage.py migrate bossoidc2 0003_keycloak_usertype -
 echo 'Running migrations...'
 gosu "${UWSGI_USER}" python manage.py migrate --noinput
 
+echo 'Creating MongoDB indexes…'
+gosu "${UWSGI_USER}" python manage.py sync_mongo_indexes
+
 echo 'Creating superuser…'
 gosu "${UWSGI_USER}" python manage.py create_kobo_superuser
 
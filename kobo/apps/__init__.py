@@ -3,6 +3,7 @@ import kombu.exceptions
 from django.apps import AppConfig
 from django.core.checks import register, Tags
 
+from kpi.utils.mongo_index_checker import check_mongo_indexes
 from kpi.utils.two_database_configuration_checker import \
     TwoDatabaseConfigurationChecker
 
@@ -19,3 +20,4 @@ class KpiConfig(AppConfig):
 
 
 register(TwoDatabaseConfigurationChecker().as_check(), Tags.database)
+register(check_mongo_indexes, Tags.database)
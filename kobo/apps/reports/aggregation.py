@@ -0,0 +1,418 @@
+# coding: utf-8
+"""
+Compute report statistics with MongoDB aggregation pipelines instead of
+streaming every submission into formpack.
+
+Only questions whose statistics can be derived from the number of
+submissions per response are supported (see `AGGREGATABLE_TYPES`); the
+output mimics formpack's `AutoReport` so both can be mixed in one report.
+"""
+from collections import Counter, OrderedDict, defaultdict
+from math import sqrt
+from typing import Optional
+
+from kpi.utils.mongo_helper import MongoHelper
+
+NUMERIC_TYPES = ('integer', 'decimal')
+SELECT_TYPES = ('select_one', 'select_multiple')
+AGGREGATABLE_TYPES = SELECT_TYPES + NUMERIC_TYPES
+
+# Keys a submission can store its version in, see `FUZZY_VERSION_PATTERN`
+VERSION_ID_KEYS = [
+    f'{prefix}version{suffix}'
+    for prefix in ('_', '__')
+    for suffix in ('', '_', '__', '_001', '__001', '__002', '__003')
+]
+# Value of `lang` to display choice names instead of labels
+UNTRANSLATED = '_xml'
+# Placeholder used by formpack for statistics which cannot be computed
+NOT_COMPUTABLE = '*'
+
+
+class SurveyField:
+    """
+    Question of the latest deployed version of a form, as stored in Mongo.
+    `previous_root_xpaths` holds the top level keys of the responses of
+    previous versions of the form which stored the question elsewhere.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        type_: str,
+        xpath: str,
+        root_xpath: str,
+        in_repeat: bool,
+        choices: Optional[OrderedDict] = None,
+    ):
+        self.name = name
+        self.type = type_
+        self.xpath = xpath
+        # Top level key which contains the response in Mongo, i.e. the
+        # outermost repeat group or `xpath` itself
+        self.root_xpath = root_xpath
+        self.in_repeat = in_repeat
+        # Choice names and their labels
+        self.choices = choices or OrderedDict()
+        self.previous_root_xpaths = set()
+        # Whether previous versions of the form stored the question elsewhere
+        # or with another type. Its responses are then under several keys,
+        # which MongoDB pipelines do not aggregate.
+        self.changed_across_versions = False
+
+    @property
+    def root_xpaths(self) -> list:
+        """
+        Top level keys which contain the responses of all versions
+        """
+        return [self.root_xpath] + sorted(
+            self.previous_root_xpaths - {self.root_xpath}
+        )
+
+    @property
+    def mongo_key(self) -> str:
+        return MongoHelper.encode(self.xpath)
+
+    def get_label(self, value: str, lang: Optional[str] = None) -> str:
+        if lang == UNTRANSLATED or value not in self.choices:
+            return value
+        labels = self.choices[value]
+        if lang not in labels:
+            # Default to the first translation
+            return next(iter(labels.values()), value)
+        return labels[lang]
+
+
+def get_survey_fields(asset) -> dict:
+    """
+    Return `SurveyField` objects of the latest deployed version of `asset`
+    by name. Questions are compared with their namesakes in previous deployed
+    versions (like formpack does), see `SurveyField.changed_across_versions`
+    """
+    versions = asset.deployed_versions.iterator()
+    latest_version = next(versions, None)
+    if not latest_version:
+        return {}
+
+    survey_fields = _get_version_survey_fields(latest_version.version_content)
+    for version in versions:
+        previous_fields = _get_version_survey_fields(version.version_content)
+        for name, previous_field in previous_fields.items():
+            field = survey_fields.get(name)
+            if field is None:
+                continue
+            if (
+                previous_field.xpath != field.xpath
+                or previous_field.type != field.type
+            ):
+                field.changed_across_versions = True
+                field.previous_root_xpaths.add(previous_field.root_xpath)
+
+    return survey_fields
+
+
+def _get_version_survey_fields(content: dict) -> dict:
+    translations = content.get('translations') or [None]
+    choices_by_list_name = defaultdict(OrderedDict)
+    for choice in content.get('choices', []):
+        name = choice.get('name', choice.get('$autovalue'))
+        labels = choice.get('label') or []
+        choices_by_list_name[choice.get('list_name')][name] = {
+            translation: (labels[index] if index < len(labels) else name)
+            for index, translation in enumerate(translations)
+        }
+
+    survey_fields = {}
+    group_stack = []
+    repeat_depth = 0
+    for row in content.get('survey', []):
+        row_type = row.get('type')
+        row_name = row.get('$autoname', row.get('name'))
+        if row_type in ('begin_group', 'begin_repeat'):
+            group_stack.append((row_name, row_type == 'begin_repeat'))
+            if row_type == 'begin_repeat':
+                repeat_depth += 1
+            continue
+        if row_type in ('end_group', 'end_repeat'):
+            if group_stack and group_stack.pop()[1]:
+                repeat_depth -= 1
+            continue
+        if not row_name:
+            continue
+
+        path = [name for name, _ in group_stack] + [row_name]
+        root_length = len(path)
+        for index, (_, is_repeat) in enumerate(group_stack):
+            if is_repeat:
+                root_length = index + 1
+                break
+        survey_fields[row_name] = SurveyField(
+            name=row_name,
+            type_=row_type,
+            xpath='/'.join(path),
+            root_xpath='/'.join(path[:root_length]),
+            in_repeat=repeat_depth > 0,
+            choices=choices_by_list_name.get(row.get('select_from_list_name')),
+        )
+
+    return survey_fields
+
+
+def get_aggregatable_fields(
+    survey_fields: dict, field_types: dict, split_by: Optional[str] = None
+) -> list:
+    """
+    Return the `SurveyField` objects whose statistics can be computed by
+    MongoDB. `field_types` maps the names of the questions of the report to
+    their types, as seen by formpack across all versions of the form.
+    """
+    if split_by:
+        split_by_field = survey_fields.get(split_by)
+        if (
+            not split_by_field
+            or split_by_field.in_repeat
+            or split_by_field.changed_across_versions
+        ):
+            return []
+        # Crosstabs of numeric questions are left to formpack
+        supported_types = SELECT_TYPES
+    else:
+        supported_types = AGGREGATABLE_TYPES
+
+    return [
+        survey_fields[name]
+        for name, field_type in field_types.items()
+        if field_type in supported_types
+        and name in survey_fields
+        and survey_fields[name].type == field_type
+        and not survey_fields[name].in_repeat
+        and not survey_fields[name].changed_across_versions
+    ]
+
+
+def get_aggregated_stats(
+    asset,
+    user: 'auth.User',
+    fields: list,
+    split_by_field: Optional[SurveyField] = None,
+    lang: Optional[str] = None,
+    columnar_cache: Optional['ColumnarSubmissionCache'] = None,
+) -> dict:
+    """
+    Return the statistics of `fields` (`SurveyField` objects) by question
+    name, computed with one aggregation pipeline on the submissions `user` is
+    allowed to access.
+
+    MongoDB counts the submissions per response (and per response of
+    `split_by_field`); frequencies, percentages and numeric summaries are
+    derived from these counts. The counts are read from `columnar_cache`
+    instead when it is provided and able to answer.
+    """
+    if not fields:
+        return {}
+
+    groups_by_field = None
+    if columnar_cache is not None:
+        groups_by_field = columnar_cache.get_groups_by_field(
+            user, fields, split_by_field
+        )
+    if groups_by_field is None:
+        groups_by_field = _get_groups_by_field(
+            asset, user, fields, split_by_field
+        )
+
+    stats = {}
+    for field, groups in zip(fields, groups_by_field):
+        if split_by_field:
+            stats[field.name] = _get_disaggregated_stats(
+                field, groups, split_by_field, lang
+            )
+        elif field.type in NUMERIC_TYPES:
+            stats[field.name] = _get_numeric_stats(field, groups)
+        else:
+            stats[field.name] = _get_select_stats(field, groups, lang)
+
+    return stats
+
+
+def _get_base_stats(groups: list) -> dict:
+    not_provided = sum(count for value, _, count in groups if value is None)
+    provided = sum(count for value, _, count in groups if value is not None)
+    return {
+        'total_count': not_provided + provided,
+        'not_provided': not_provided,
+        'provided': provided,
+        'show_graph': False,
+    }
+
+
+def _get_disaggregated_stats(
+    field: SurveyField,
+    groups: list,
+    split_by_field: SurveyField,
+    lang: Optional[str],
+) -> dict:
+    stats = _get_base_stats(groups)
+    total = stats['total_count']
+    splitters = list(split_by_field.choices.keys())
+    counters = OrderedDict()
+    for value, splitter, count in groups:
+        if value is None:
+            continue
+        for choice in _get_choices(field, value):
+            counters.setdefault(choice, Counter())[splitter] += count
+
+    values = []
+    for choice, counter in sorted(
+        counters.items(), key=lambda item: -sum(item[1].values())
+    ):
+        labels = [split_by_field.get_label(s, lang) for s in splitters]
+        frequencies = [counter[s] for s in splitters]
+        values.append(
+            (
+                field.get_label(choice, lang),
+                {
+                    'frequency': list(zip(labels, frequencies)),
+                    'percentage': [
+                        (label, _get_percentage(frequency, total))
+                        for label, frequency in zip(labels, frequencies)
+                    ],
+                },
+            )
+        )
+
+    stats.update({'values': values, 'show_graph': True})
+    return stats
+
+
+def _get_choices(field: SurveyField, value) -> list:
+    if field.type == 'select_multiple':
+        return str(value).split()
+    return [value]
+
+
+def _get_numeric_stats(field: SurveyField, groups: list) -> dict:
+    stats = _get_base_stats(groups)
+    counts = []
+    for value, _, count in groups:
+        if value is None:
+            continue
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            # Consider invalid numbers as not provided
+            stats['provided'] -= count
+            stats['not_provided'] += count
+            continue
+        if field.type == 'integer' and number.is_integer():
+            number = int(number)
+        counts.append((number, count))
+
+    median = mode = mean = stdev = NOT_COMPUTABLE
+    total = sum(count for _, count in counts)
+    if total:
+        # `counts` is sorted by decreasing count, first occurrence first
+        mode = counts[0][0]
+        mean = sum(number * count for number, count in counts) / total
+        if total > 1:
+            stdev = sqrt(
+                sum(count * (number - mean) ** 2 for number, count in counts)
+                / (total - 1)
+            )
+        median = _get_median(sorted(counts), total)
+
+    stats.update({'median': median, 'mode': mode, 'mean': mean, 'stdev': stdev})
+    return stats
+
+
+def _get_groups_by_field(
+    asset,
+    user: 'auth.User',
+    fields: list,
+    split_by_field: Optional[SurveyField],
+) -> list:
+    group_id = {}
+    if split_by_field:
+        group_id['split'] = f'${split_by_field.mongo_key}'
+
+    facets = {}
+    for index, field in enumerate(fields):
+        facets[f'f{index}'] = [
+            {
+                '$group': {
+                    '_id': {**group_id, 'value': f'${field.mongo_key}'},
+                    'count': {'$sum': 1},
+                    # Sort responses with the same count by first occurrence,
+                    # like formpack does
+                    'first': {'$min': '$_id'},
+                }
+            },
+            {'$sort': {'count': -1, 'first': 1}},
+        ]
+
+    results = asset.deployment.aggregate_submissions(
+        user, [{'$facet': facets}]
+    )
+    results = results[0] if results else {}
+
+    return [
+        [
+            (group['_id'].get('value'), group['_id'].get('split'), group['count'])
+            for group in results.get(f'f{index}', [])
+        ]
+        for index in range(len(fields))
+    ]
+
+
+def _get_median(sorted_counts: list, total: int):
+    """
+    Return the median of the numbers of `sorted_counts`, a sorted list of
+    (number, count) tuples whose counts sum up to `total`
+    """
+    lower_index = (total - 1) // 2
+    upper_index = total // 2
+    lower = upper = None
+    position = 0
+    for number, count in sorted_counts:
+        if lower is None and lower_index < position + count:
+            lower = number
+        if upper_index < position + count:
+            upper = number
+            break
+        position += count
+    if lower == upper:
+        return lower
+    return (lower + upper) / 2
+
+
+def _get_percentage(count: int, total: int) -> float:
+    if not total:
+        return 0.0
+    return round(count * 100.0 / total, 2)
+
+
+def _get_select_stats(
+    field: SurveyField, groups: list, lang: Optional[str]
+) -> dict:
+    stats = _get_base_stats(groups)
+    total = stats['total_count']
+    # Groups are sorted by decreasing count, thus the order of first
+    # occurrence is kept for choices with the same count once re-sorted
+    counter = Counter()
+    for value, _, count in groups:
+        if value is None:
+            continue
+        for choice in _get_choices(field, value):
+            counter[choice] += count
+
+    frequency = []
+    percentage = []
+    for choice, count in counter.most_common():
+        label = field.get_label(choice, lang)
+        frequency.append((label, count))
+        percentage.append((label, _get_percentage(count, total)))
+
+    stats.update(
+        {'frequency': frequency, 'percentage': percentage, 'show_graph': True}
+    )
+    return stats
@@ -0,0 +1,562 @@
+# coding: utf-8
+"""
+Optional columnar cache of the submissions of a form: Parquet files queried
+with DuckDB, to compute report statistics and filtered counts without
+scanning MongoDB.
+
+The cache is enabled with `ANALYTICS_CACHE_ENABLED` and needs `pyarrow` and
+`duckdb`. Each process host keeps its own copy under `ANALYTICS_CACHE_ROOT`,
+which Celery workers build: they must share it with the web processes (e.g.
+run on the same host).
+Responses are stored as strings, like in MongoDB, so that filters behave the
+same way on both.
+"""
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import socket
+import time
+from contextlib import contextmanager
+from itertools import islice
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import cache
+
+try:
+    import duckdb
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    duckdb = pa = pq = None
+
+from kpi.constants import PERM_VIEW_SUBMISSIONS
+from kpi.utils.log import logging
+from kpi.utils.mongo_helper import MongoHelper
+from .aggregation import get_survey_fields
+
+
+class ColumnarCacheError(Exception):
+    """
+    The cache cannot answer, e.g. the query is not supported or the cache is
+    being built. Callers should fall back on MongoDB.
+    """
+
+
+class ColumnarSubmissionCache:
+    """
+    Parquet copy of the top level responses of the submissions of `asset`,
+    refreshed incrementally with the submissions received since the last
+    refresh (`_id` watermark).
+
+    The cache is rebuilt from scratch when the form is redeployed, when
+    submissions are written through KPI, when some have been deleted or
+    modified since (e.g. edited with Enketo, see
+    `get_submission_last_modified()` of the deployment back end), or when it
+    is older than `ANALYTICS_CACHE_MAX_AGE`.
+    """
+
+    META_COLUMNS = (
+        '_id',
+        '_uuid',
+        '_submission_time',
+        '_submitted_by',
+        '_validation_status.uid',
+    )
+    STATE_FILENAME = 'state.json'
+    LOCK_TIMEOUT = 60 * 60  # seconds
+    # Previous copies are kept this long after being replaced, for the
+    # processes which still read them
+    STALE_DIRECTORY_GRACE_PERIOD = 10 * 60  # seconds
+    COMPARISON_OPERATORS = {
+        '$gt': '>',
+        '$gte': '>=',
+        '$lt': '<',
+        '$lte': '<=',
+    }
+
+    def __init__(
+        self, asset: 'kpi.models.Asset', watermark: Optional[str] = None
+    ):
+        self.asset = asset
+        self.deployment = asset.deployment
+        # Submission watermark the cache must be as recent as to answer, if
+        # any. See `get_groups_by_field()`
+        self.watermark = watermark
+        self.root = os.path.join(
+            settings.ANALYTICS_CACHE_ROOT, self.deployment.mongo_userform_id
+        )
+
+    @classmethod
+    def is_enabled(cls) -> bool:
+        return settings.ANALYTICS_CACHE_ENABLED and duckdb is not None
+
+    @property
+    def columns(self) -> list[str]:
+        """
+        Mongo keys of the cached responses: metadata, then the questions of
+        the latest deployed version which are not in a repeat group
+        """
+        columns = list(self.META_COLUMNS)
+        for field in get_survey_fields(self.asset).values():
+            if not field.in_repeat and field.mongo_key not in columns:
+                columns.append(field.mongo_key)
+        return columns
+
+    def count(self, query: dict) -> int:
+        """
+        Return the number of cached submissions matching the MongoDB `query`
+        """
+        state = self.refresh()
+        if not state['parts']:
+            return 0
+        where, params = self._to_sql(query, state['columns'])
+        sql = f'SELECT count(*) FROM {self._get_source(state)} WHERE {where}'
+        return self._execute(sql, params)[0][0]
+
+    def get_groups_by_field(
+        self,
+        user: 'auth.User',
+        fields: list,
+        split_by_field: Optional['SurveyField'] = None,
+    ) -> Optional[list]:
+        """
+        Return the `(value, split value, count)` tuples of each of `fields`
+        over the submissions `user` is allowed to access (see
+        `get_value_counts()`), or `None` if the cache cannot answer, e.g. it
+        is older than `self.watermark`
+        """
+        query = self.get_query(user)
+        split_column = split_by_field.mongo_key if split_by_field else None
+        try:
+            if (
+                self.watermark is not None
+                and self.refresh().get('watermark') != self.watermark
+            ):
+                raise ColumnarCacheError('Columnar cache is outdated')
+            return [
+                self.get_value_counts(field.mongo_key, split_column, query)
+                for field in fields
+            ]
+        except ColumnarCacheError as e:
+            logging.info(f'Columnar cache skipped: {e}')
+            return None
+
+    def get_query(
+        self,
+        user: 'auth.User',
+        partial_perm=PERM_VIEW_SUBMISSIONS,
+        **mongo_query_params,
+    ) -> dict:
+        """
+        Return the MongoDB query matching the submissions `user` is allowed
+        to access, narrowed down by `mongo_query_params` if any
+        """
+        params = self.deployment.validate_submission_list_params(
+            user,
+            validate_count=True,
+            partial_perm=partial_perm,
+            **mongo_query_params,
+        )
+        params.pop('count_cache_version')
+        return MongoHelper.get_query(
+            self.deployment.mongo_userform_id, **params
+        )
+
+    def get_value_counts(
+        self,
+        column: str,
+        split_column: Optional[str] = None,
+        query: Optional[dict] = None,
+    ) -> list[tuple]:
+        """
+        Return the number of cached submissions matching the MongoDB `query`
+        per response to `column` (and per response to `split_column`), as
+        `(value, split value, count)` tuples sorted by decreasing count, then
+        by first occurrence
+        """
+        state = self.refresh()
+        if column not in state['columns'] or (
+            split_column and split_column not in state['columns']
+        ):
+            raise ColumnarCacheError(f'`{column}` is not cached')
+        if not state['parts']:
+            return []
+
+        where, params = self._to_sql(query or {}, state['columns'])
+        split = self._quote(split_column) if split_column else 'NULL'
+        sql = (
+            f'SELECT {self._quote(column)}, {split}, count(*) AS count, '
+            f'min("_id") AS first '
+            f'FROM {self._get_source(state)} WHERE {where} '
+            f'GROUP BY 1, 2 ORDER BY count DESC, first ASC'
+        )
+        return [
+            (value, split_value, count)
+            for value, split_value, count, _ in self._execute(sql, params)
+        ]
+
+    def build(self):
+        """
+        Build the cache from scratch. Called by Celery, see `refresh()`
+        """
+        try:
+            with self._lock() as locked:
+                if not locked:
+                    return
+                previous_state = self._read_state()
+                state = self._build(self._get_version())
+                self._write_state(state)
+                if previous_state:
+                    # Start the grace period of the previous copy
+                    previous_directory = os.path.join(
+                        self.root, previous_state['directory']
+                    )
+                    if os.path.isdir(previous_directory):
+                        os.utime(previous_directory)
+                self._remove_stale_directories(state)
+        finally:
+            cache.delete(self._build_queued_key)
+
+    def refresh(self) -> dict:
+        """
+        Bring the cache up to date and return its state.
+
+        New submissions are appended right away. Building the cache, i.e.
+        copying all submissions, is left to Celery: `ColumnarCacheError` is
+        raised meanwhile, so that callers fall back on MongoDB.
+        """
+        if not self.is_enabled():
+            raise ColumnarCacheError('Columnar cache is not enabled')
+
+        state = self._read_state()
+        version = self._get_version()
+        if state and not self._must_refresh(state, version):
+            return state
+
+        if not state or self._must_rebuild(state, version):
+            return self._queue_build(version)
+
+        with self._lock() as locked:
+            if not locked:
+                # Another worker is refreshing the cache. Answer with the
+                # current one.
+                return state
+
+            if self._has_modified_submissions(state, version):
+                rebuild = True
+            else:
+                state = self._append(state, version)
+                # Submissions received since the last one appended are not
+                # expected in the cache
+                if state['count'] != self._count_mongo_submissions(
+                    state['last_id']
+                ):
+                    # Some submissions have been deleted
+                    rebuild = True
+                else:
+                    rebuild = False
+                    self._write_state(state)
+
+        if rebuild:
+            return self._queue_build(version)
+        return state
+
+    def _append(self, state: dict, version: dict) -> dict:
+        state = {**state, **version, 'parts': list(state['parts'])}
+        directory = os.path.join(self.root, state['directory'])
+        schema = pa.schema(
+            [
+                (column, pa.int64() if column == '_id' else pa.string())
+                for column in state['columns']
+            ]
+        )
+        projection = {
+            column.split('.')[0]: 1 for column in state['columns']
+        }
+
+        with MongoHelper.analytics_workload():
+            cursor = (
+                MongoHelper.get_instances_collection()
+                .find(
+                    {
+                        MongoHelper.USERFORM_ID: self.deployment.mongo_userform_id,
+                        '_id': {'$gt': state['last_id']},
+                    },
+                    projection,
+                    max_time_ms=MongoHelper.get_max_time_ms(),
+                )
+                .sort('_id', 1)
+                .batch_size(MongoHelper.DEFAULT_BATCHSIZE)
+            )
+            while True:
+                documents = list(
+                    islice(cursor, settings.ANALYTICS_CACHE_BATCH_SIZE)
+                )
+                if not documents:
+                    break
+                table = pa.Table.from_pylist(
+                    [
+                        self._to_row(document, state['columns'])
+                        for document in documents
+                    ],
+                    schema=schema,
+                )
+                filename = f'part-{len(state["parts"]):06d}.parquet'
+                temporary_path = os.path.join(directory, f'.{filename}')
+                pq.write_table(table, temporary_path)
+                os.replace(temporary_path, os.path.join(directory, filename))
+                state['parts'].append(filename)
+                state['count'] += len(documents)
+                state['last_id'] = documents[-1]['_id']
+
+        return state
+
+    def _build(self, version: dict) -> dict:
+        directory = str(time.time_ns())
+        os.makedirs(os.path.join(self.root, directory))
+        logging.info(
+            f'Building columnar cache of {self.deployment.mongo_userform_id}'
+        )
+        state = {
+            'directory': directory,
+            'columns': self.columns,
+            'parts': [],
+            'count': 0,
+            'last_id': -1,
+            'built_at': time.time(),
+        }
+        return self._append(state, version)
+
+    def _column_to_sql(
+        self, column: str, condition, columns: list
+    ) -> tuple[str, list]:
+        quoted_column = self._quote(column)
+        if not isinstance(condition, dict):
+            if condition is None:
+                return f'{quoted_column} IS NULL', []
+            return f'{quoted_column} = ?', [self._to_param(column, condition)]
+
+        clauses = []
+        params = []
+        for operator, operand in condition.items():
+            if operator in self.COMPARISON_OPERATORS:
+                clauses.append(
+                    f'{quoted_column} {self.COMPARISON_OPERATORS[operator]} ?'
+                )
+                params.append(self._to_param(column, operand))
+            elif operator == MongoHelper.IN_OPERATOR:
+                if not isinstance(operand, list):
+                    raise ColumnarCacheError(f'Unsupported `{operator}`')
+                values = [
+                    self._to_param(column, value)
+                    for value in operand
+                    if value is not None
+                ]
+                in_clauses = []
+                if values:
+                    placeholders = ', '.join('?' for _ in values)
+                    in_clauses.append(f'{quoted_column} IN ({placeholders})')
+                    params.extend(values)
+                if None in operand:
+                    in_clauses.append(f'{quoted_column} IS NULL')
+                clauses.append(f'({" OR ".join(in_clauses) or "FALSE"})')
+            elif operator == '$exists':
+                clauses.append(
+                    f'{quoted_column} IS {"NOT " if operand else ""}NULL'
+                )
+            else:
+                raise ColumnarCacheError(f'Unsupported operator `{operator}`')
+
+        return ' AND '.join(clauses) or 'TRUE', params
+
+    @property
+    def _build_queued_key(self) -> str:
+        return f'columnar_cache_build:{socket.gethostname()}:{self.root}'
+
+    def _count_mongo_submissions(self, last_id: int) -> int:
+        with MongoHelper.analytics_workload():
+            return MongoHelper.get_instances_collection().count_documents(
+                {
+                    MongoHelper.USERFORM_ID: self.deployment.mongo_userform_id,
+                    '_id': {'$lte': last_id},
+                },
+                maxTimeMS=MongoHelper.get_max_time_ms(),
+            )
+
+    def _execute(self, sql: str, params: list) -> list:
+        try:
+            with duckdb.connect() as connection:
+                return connection.execute(sql, params).fetchall()
+        except duckdb.Error as e:
+            # E.g. the files have been replaced meanwhile
+            raise ColumnarCacheError(f'Columnar cache cannot be read: {e}')
+
+    def _get_source(self, state: dict) -> str:
+        directory = os.path.join(self.root, state['directory'])
+        paths = ', '.join(
+            "'{}'".format(os.path.join(directory, part).replace("'", "''"))
+            for part in state['parts']
+        )
+        return f'read_parquet([{paths}])'
+
+    def _get_version(self) -> dict:
+        version = self.asset.latest_deployed_version
+        return {
+            'schema': version.uid if version else None,
+            'generation': self.deployment.get_submission_cache_generation(),
+            'version': self.deployment.submission_count_cache_version,
+            'last_modified': self.deployment.get_submission_last_modified(),
+            'watermark': self.deployment.get_submission_watermark(),
+        }
+
+    def _has_modified_submissions(self, state: dict, version: dict) -> bool:
+        """
+        Return whether submissions of the cache have been modified since it
+        was refreshed. Submissions received since also change
+        `last_modified`, they are appended
+        """
+        if 'last_modified' not in state:
+            # Built before it was recorded
+            return True
+        if (
+            state['last_modified'] == version['last_modified']
+            or state['last_id'] < 0
+        ):
+            return False
+        return self.deployment.has_modified_submissions(
+            state['last_modified'], state['last_id']
+        )
+
+    @contextmanager
+    def _lock(self):
+        lock_key = f'columnar_cache:{socket.gethostname()}:{self.root}'
+        locked = cache.add(lock_key, True, self.LOCK_TIMEOUT)
+        try:
+            yield locked
+        finally:
+            if locked:
+                cache.delete(lock_key)
+
+    def _must_rebuild(self, state: dict, version: dict) -> bool:
+        return (
+            state['schema'] != version['schema']
+            or state['generation'] != version['generation']
+            or len(state['parts']) >= settings.ANALYTICS_CACHE_MAX_PARTS
+            or time.time() - state['built_at'] > settings.ANALYTICS_CACHE_MAX_AGE
+        )
+
+    def _must_refresh(self, state: dict, version: dict) -> bool:
+        return (
+            version['version'] is None
+            or state['version'] != version['version']
+            or state.get('last_modified') != version['last_modified']
+            or self._must_rebuild(state, version)
+        )
+
+    @staticmethod
+    def _quote(column: str) -> str:
+        escaped_column = column.replace('"', '""')
+        return f'"{escaped_column}"'
+
+    def _queue_build(self, version: dict) -> dict:
+        if cache.add(self._build_queued_key, True, self.LOCK_TIMEOUT):
+            from kpi.tasks import (
+                build_columnar_cache_in_background,
+            )  # avoid circular imports
+            build_columnar_cache_in_background.delay(self.asset.uid)
+
+        # The build may be over already, e.g. if Celery runs tasks eagerly
+        state = self._read_state()
+        if state and not self._must_refresh(state, version):
+            return state
+        raise ColumnarCacheError('Columnar cache is being built')
+
+    def _read_state(self) -> Optional[dict]:
+        try:
+            with open(os.path.join(self.root, self.STATE_FILENAME)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _remove_stale_directories(self, state: dict):
+        """
+        Remove the copies other than the one of `state` which have not been
+        modified (or replaced, see `build()`) for
+        `STALE_DIRECTORY_GRACE_PERIOD` seconds
+        """
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if name == state['directory'] or not os.path.isdir(path):
+                continue
+            if (
+                time.time() - os.path.getmtime(path)
+                >= self.STALE_DIRECTORY_GRACE_PERIOD
+            ):
+                shutil.rmtree(path, ignore_errors=True)
+
+    def _to_param(self, column: str, value):
+        # Responses are strings, do not let DuckDB cast them to compare them
+        # with other types, MongoDB would not
+        expected_type = int if column == '_id' else str
+        if type(value) is not expected_type:
+            raise ColumnarCacheError(f'Unsupported value for `{column}`')
+        return value
+
+    @staticmethod
+    def _to_row(document: dict, columns: list) -> dict:
+        row = {}
+        for column in columns:
+            value = document
+            for key in column.split('.'):
+                value = value.get(key) if isinstance(value, dict) else None
+            if column != '_id' and value is not None and not isinstance(
+                value, str
+            ):
+                value = (
+                    json.dumps(value, default=str)
+                    if isinstance(value, (dict, list))
+                    else str(value)
+                )
+            row[column] = value
+        return row
+
+    def _to_sql(self, query: dict, columns: list) -> tuple[str, list]:
+        """
+        Translate the MongoDB `query` into a SQL condition and its
+        parameters. Only the operators MongoDB filters of the API are usually
+        made of are supported.
+        """
+        clauses = []
+        params = []
+        for key, value in query.items():
+            if key in (MongoHelper.AND_OPERATOR, MongoHelper.OR_OPERATOR):
+                if not isinstance(value, list) or not value:
+                    raise ColumnarCacheError(f'Unsupported `{key}`')
+                sub_clauses = []
+                for sub_query in value:
+                    sub_clause, sub_params = self._to_sql(sub_query, columns)
+                    sub_clauses.append(f'({sub_clause})')
+                    params.extend(sub_params)
+                joiner = ' AND ' if key == MongoHelper.AND_OPERATOR else ' OR '
+                clauses.append(f'({joiner.join(sub_clauses)})')
+            elif key == MongoHelper.USERFORM_ID:
+                if value != self.deployment.mongo_userform_id:
+                    raise ColumnarCacheError('Query targets another form')
+            elif key in columns:
+                clause, column_params = self._column_to_sql(key, value, columns)
+                clauses.append(clause)
+                params.extend(column_params)
+            else:
+                raise ColumnarCacheError(f'`{key}` is not cached')
+
+        return ' AND '.join(clauses) or 'TRUE', params
+
+    def _write_state(self, state: dict):
+        path = os.path.join(self.root, self.STATE_FILENAME)
+        temporary_path = f'{path}.tmp'
+        with open(temporary_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(temporary_path, path)
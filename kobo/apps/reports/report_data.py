@@ -1,12 +1,26 @@
 # coding: utf-8
+import hashlib
+import json
 from collections import OrderedDict
+from contextlib import nullcontext
 from copy import deepcopy
 
+from django.conf import settings
+from django.core.cache import cache
 from django.utils.translation import gettext as t
 from rest_framework import serializers
 from formpack import FormPack
 
 from kpi.utils.log import logging
+from kpi.utils.mongo_helper import MongoHelper
+from kpi.utils.object_permission import get_database_user
+from .aggregation import (
+    VERSION_ID_KEYS,
+    get_aggregatable_fields,
+    get_aggregated_stats,
+    get_survey_fields,
+)
+from .columnar_cache import ColumnarSubmissionCache
 from .constants import (
     FUZZY_VERSION_ID_KEY,
     INFERRED_VERSION_ID_KEY,
@@ -108,6 +122,92 @@ def build_formpack(asset, submission_stream=None, use_all_form_versions=True):
     return pack, submission_stream
 
 
+# Longest time a refresh of a cached report is expected to take. Past it, the
+# refresh is assumed to have failed and another one can be triggered
+REPORT_CACHE_LOCK_TIMEOUT = settings.CELERY_TASK_TIME_LIMIT
+
+
+def cached_data_by_identifiers(asset, field_names=None, split_by=None,
+                               user=None):
+    """
+    Return `data_by_identifiers()` for the submissions `user` is allowed to
+    see, from the cache if submissions have not changed since it was computed.
+
+    Reports are cached per form version, report styles, questions, `split_by`
+    and permission filters of `user`, along with the submission watermark
+    of the deployment. Once submissions change, the previous statistics are
+    returned while Celery computes them again.
+    """
+    if field_names is not None:
+        field_names = list(field_names)
+
+    if not settings.REPORTS_CACHE_TIMEOUT or not asset.has_deployment:
+        return data_by_identifiers(
+            asset, field_names, split_by=split_by, user=user
+        )
+
+    user = get_database_user(user)
+    cache_key = _get_report_cache_key(asset, field_names, split_by, user)
+    cached_report = cache.get(cache_key)
+    if cached_report is None:
+        return refresh_cached_report(asset, field_names, split_by, user)
+
+    if cached_report['watermark'] != asset.deployment.get_submission_watermark():
+        if cache.add(f'{cache_key}:lock', True, REPORT_CACHE_LOCK_TIMEOUT):
+            from kpi.tasks import refresh_report_in_background  # avoid circular imports
+            refresh_report_in_background.delay(
+                asset.uid, field_names, split_by, user.pk
+            )
+    return cached_report['list']
+
+
+def refresh_cached_report(asset, field_names, split_by, user):
+    """
+    Compute the report of `cached_data_by_identifiers()` and store it in the
+    cache
+    """
+    cache_key = _get_report_cache_key(asset, field_names, split_by, user)
+    try:
+        # Read before computing: submissions received meanwhile make the
+        # report stale
+        watermark = asset.deployment.get_submission_watermark()
+        report = data_by_identifiers(
+            asset,
+            field_names,
+            split_by=split_by,
+            user=user,
+            watermark=watermark,
+        )
+        cache.set(
+            cache_key,
+            {'watermark': watermark, 'list': report},
+            settings.REPORTS_CACHE_TIMEOUT,
+        )
+    finally:
+        cache.delete(f'{cache_key}:lock')
+    return report
+
+
+def _get_report_cache_key(asset, field_names, split_by, user):
+    permission_filters = asset.deployment.validate_submission_list_params(
+        user, validate_count=True
+    )['permission_filters']
+    key = json.dumps(
+        [
+            asset.latest_deployed_version_uid,
+            asset.report_styles,
+            field_names,
+            split_by,
+            permission_filters,
+        ],
+        sort_keys=True,
+        default=str,
+    )
+    return 'report_data:{}:{}'.format(
+        asset.uid, hashlib.sha256(key.encode()).hexdigest()
+    )
+
+
 # TODO validate if this function is still in used.
 def _vnames(asset, cache=False):
     if not cache or not hasattr(asset, '_available_report_uids'):
@@ -121,7 +221,53 @@ def _vnames(asset, cache=False):
 
 def data_by_identifiers(asset, field_names=None, submission_stream=None,
                         report_styles=None, lang=None, fields=None,
-                        split_by=None):
+                        split_by=None, user=None, watermark=None):
+    """
+    Return the statistics of `field_names` (all questions by default).
+
+    If `submission_stream` is not provided, submissions `user` is allowed to
+    see are used. In that case, statistics of select and numeric questions
+    are computed with a MongoDB aggregation pipeline (unless
+    `REPORTS_USE_MONGO_AGGREGATION` is off) and only the responses of other
+    questions are streamed through formpack.
+
+    Submissions are read like any heavy workload (see
+    `MongoHelper.analytics_workload()`), unless the report is cached under
+    the submission `watermark` read beforehand: they are read from the
+    primary then, and from the columnar cache only if it is as recent, not
+    to cache stale statistics under a current watermark.
+    """
+    if watermark is None:
+        workload = MongoHelper.analytics_workload()
+    else:
+        workload = nullcontext()
+    with workload:
+        return _data_by_identifiers(
+            asset,
+            field_names,
+            submission_stream,
+            report_styles,
+            lang,
+            split_by,
+            user,
+            watermark,
+        )
+
+
+def _data_by_identifiers(asset, field_names, submission_stream,
+                         report_styles, lang, split_by, user, watermark):
+    use_aggregation = (
+        submission_stream is None
+        and user is not None
+        and settings.REPORTS_USE_MONGO_AGGREGATION
+    )
+    # Narrowed down once the questions left to formpack are known
+    stream_params = {}
+    if submission_stream is None and user is not None:
+        def _get_submissions():
+            yield from asset.deployment.get_submissions(user, **stream_params)
+        submission_stream = _get_submissions()
+
     pack, submission_stream = build_formpack(asset, submission_stream)
     _all_versions = pack.versions.keys()
     report = pack.autoreport(versions=_all_versions)
@@ -174,10 +320,59 @@ def data_by_identifiers(asset, field_names=None, submission_stream=None,
             'style': specified_styles.get(identifier, {}),
         }
 
+    if not use_aggregation:
+        return [
+            _package_stat(*stat_tup, split_by=split_by) for
+            stat_tup in report.get_stats(submission_stream,
+                                         fields=field_names,
+                                         lang=lang,
+                                         split_by=split_by)
+        ]
+
+    # formpack considers all questions if none is specified
+    field_names = list(field_names) or list(fields_by_name.keys())
+    survey_fields = get_survey_fields(asset)
+    aggregatable_fields = get_aggregatable_fields(
+        survey_fields,
+        {
+            name: fields_by_name[name].data_type
+            for name in field_names if name in fields_by_name
+        },
+        split_by,
+    )
+    stats = get_aggregated_stats(
+        asset,
+        user,
+        aggregatable_fields,
+        split_by_field=survey_fields.get(split_by) if split_by else None,
+        lang=lang,
+        columnar_cache=(
+            ColumnarSubmissionCache(asset, watermark=watermark)
+            if ColumnarSubmissionCache.is_enabled()
+            else None
+        ),
+    )
+
+    remaining_field_names = [name for name in field_names if name not in stats]
+    if remaining_field_names:
+        # Only retrieve the responses formpack needs (wherever each version
+        # of the form stores them), unless some questions only exist in
+        # previous versions of the form
+        names = remaining_field_names + ([split_by] if split_by else [])
+        if all(name in survey_fields for name in names):
+            stream_params['fields'] = [
+                root_xpath
+                for name in names
+                for root_xpath in survey_fields[name].root_xpaths
+            ] + VERSION_ID_KEYS
+
+        for field, _, stat in report.get_stats(submission_stream,
+                                               fields=remaining_field_names,
+                                               lang=lang,
+                                               split_by=split_by):
+            stats[field.name] = stat
+
     return [
-        _package_stat(*stat_tup, split_by=split_by) for
-        stat_tup in report.get_stats(submission_stream,
-                                     fields=field_names,
-                                     lang=lang,
-                                     split_by=split_by)
+        _package_stat(fields_by_name[name], None, stats[name], split_by)
+        for name in fields_by_name if name in stats
     ]
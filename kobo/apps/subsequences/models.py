@@ -154,6 +154,10 @@ class SubmissionExtras(models.Model):
 
         super().save(*args, **kwargs)
 
+        if self.asset.has_deployment:
+            # Cached submissions include their extras
+            self.asset.deployment.invalidate_submission_cache()
+
     @property
     def full_content(self):
         _content = {}
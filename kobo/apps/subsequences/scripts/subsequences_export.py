@@ -1,7 +1,7 @@
 from kpi.models import Asset
 
 from kobo.apps.subsequences.models import SubmissionExtras
-from kobo.apps.subsequences.utils import stream_with_extras
+from kobo.apps.subsequences.utils import stream_with_batched_extras
 
 from kobo.apps.reports.report_data import build_formpack
 
@@ -14,12 +14,9 @@ def run_on_asset(asset):
     )
 
     if asset.has_advanced_features:
-        extr = dict(
-            asset.submission_extras.values_list(
-                'submission_uuid', 'content'
-            )
+        submission_stream = stream_with_batched_extras(
+            submission_stream, asset
         )
-        submission_stream = stream_with_extras(submission_stream, extr)
 
     pack, submission_stream = build_formpack(
         asset, submission_stream, True,
@@ -1,8 +1,13 @@
 import json
 
+from django.contrib.auth.models import User
 from django.test import TestCase
 
-from kobo.apps.subsequences.utils import stream_with_extras
+from kobo.apps.subsequences.models import SubmissionExtras
+from kobo.apps.subsequences.utils import (
+    stream_with_batched_extras,
+    stream_with_extras,
+)
 from kpi.models import Asset
 
 def mock_submission_stream():
@@ -42,3 +47,39 @@ class TestSubmissionStream(TestCase):
         assert '_supplementalDetails' in output[0]
         assert '_supplementalDetails' in output[1]
         # test other things?
+
+    def test_submission_stream_with_batched_extras(self):
+        user = User.objects.create_user(username='someuser')
+        asset = Asset.objects.create(
+            owner=user, content={'survey': [{'type': 'audio', 'name': 'QQ'}]}
+        )
+        SubmissionExtras.objects.create(
+            asset=asset,
+            submission_uuid='aaa',
+            content={'QQ': {'transcript': {'value': 'aaa transcript'}}},
+        )
+        SubmissionExtras.objects.create(
+            asset=asset,
+            submission_uuid='ccc',
+            content={'QQ': {'transcript': {'value': 'ccc transcript'}}},
+        )
+        submissions = [
+            {'_uuid': 'aaa'},
+            {'_uuid': 'bbb'},
+            {'_uuid': 'ccc', '_supplementalDetails': {'already': 'joined'}},
+        ]
+        # One query per batch, but none for the last batch because its only
+        # submission already has supplemental details
+        with self.assertNumQueries(1):
+            output = list(
+                stream_with_batched_extras(
+                    iter(submissions), asset, batch_size=2
+                )
+            )
+
+        assert [s['_uuid'] for s in output] == ['aaa', 'bbb', 'ccc']
+        assert output[0]['_supplementalDetails'] == {
+            'QQ': {'transcript': {'value': 'aaa transcript'}}
+        }
+        assert output[1]['_supplementalDetails'] == {}
+        assert output[2]['_supplementalDetails'] == {'already': 'joined'}
@@ -1,4 +1,6 @@
 from copy import deepcopy
+from itertools import islice
+
 from ..actions.automatic_transcription import AutomaticTranscriptionAction
 from ..actions.translation import TranslationAction
 
@@ -117,11 +119,54 @@ def get_jsonschema(action_instances=(), url=None):
 
 SUPPLEMENTAL_DETAILS_KEY = '_supplementalDetails'
 
+# Number of submissions whose supplemental details are fetched at once
+SUPPLEMENTAL_DETAILS_BATCH_SIZE = 1000
+
+
+def get_submission_uuid(submission):
+    if SUBMISSION_UUID_FIELD in submission:
+        return submission[SUBMISSION_UUID_FIELD]
+    return submission['_uuid']
+
+
 def stream_with_extras(submission_stream, extras):
     for submission in submission_stream:
-        if SUBMISSION_UUID_FIELD in submission:
-            uuid = submission[SUBMISSION_UUID_FIELD]
-        else:
-            uuid = submission['_uuid']
+        uuid = get_submission_uuid(submission)
         submission[SUPPLEMENTAL_DETAILS_KEY] = extras.get(uuid, {})
         yield submission
+
+
+def stream_with_batched_extras(
+    submission_stream, asset, batch_size=SUPPLEMENTAL_DETAILS_BATCH_SIZE
+):
+    """
+    Like `stream_with_extras()`, but supplemental details are fetched from the
+    database for the submissions of `submission_stream` only, `batch_size` at
+    a time, instead of for every submission of `asset`.
+    Submissions which already have supplemental details are left untouched,
+    thus wrapping a stream twice does not fetch them twice.
+    """
+    submission_stream = iter(submission_stream)
+    while True:
+        batch = list(islice(submission_stream, batch_size))
+        if not batch:
+            return
+
+        uuids = [
+            get_submission_uuid(submission)
+            for submission in batch
+            if SUPPLEMENTAL_DETAILS_KEY not in submission
+        ]
+        extras = {}
+        if uuids:
+            extras = dict(
+                asset.submission_extras.filter(
+                    submission_uuid__in=uuids
+                ).values_list('submission_uuid', 'content')
+            )
+
+        for submission in batch:
+            if SUPPLEMENTAL_DETAILS_KEY not in submission:
+                uuid = get_submission_uuid(submission)
+                submission[SUPPLEMENTAL_DETAILS_KEY] = extras.get(uuid, {})
+            yield submission
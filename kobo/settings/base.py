@@ -217,7 +217,9 @@ CONSTANCE_CONFIG = {
     'SYNCHRONOUS_EXPORT_CACHE_MAX_AGE': (
         300,
         'A synchronous export request will return the last export generated '
-        'with the same settings unless it is older than this value (seconds)'
+        'with the same settings if it is younger than this value (seconds). '
+        'Older exports are still returned as long as the submissions and the '
+        'deployed form have not changed'
     ),
     'ALLOW_UNSECURED_HOOK_ENDPOINTS': (
         True,
@@ -563,6 +565,33 @@ SYNCHRONOUS_REQUEST_TIME_LIMIT = 120  # seconds
 # REMOVE the oldest if a user exceeds this many exports for a particular form
 MAXIMUM_EXPORTS_PER_USER_PER_FORM = 10
 
+# Number of rows per row group of Parquet exports. Bounds the memory used to
+# write them
+EXPORT_PARQUET_ROW_GROUP_SIZE = env.int('EXPORT_PARQUET_ROW_GROUP_SIZE', 10000)
+
+# Size of the chunks export files are copied to the storage by. S3 buffers
+# them into the parts of a multipart upload (see `AWS_S3_FILE_BUFFER_SIZE`)
+EXPORT_UPLOAD_CHUNK_SIZE = env.int('EXPORT_UPLOAD_CHUNK_SIZE', 5 * 1024 * 1024)
+
+# CSV, XLSX and Parquet exports of forms with more submissions than this are
+# split into ranges of submissions (shards) exported in parallel by several
+# Celery workers, then merged. `0` disables sharding
+EXPORT_SHARD_SIZE = env.int('EXPORT_SHARD_SIZE', 0)
+EXPORT_MAX_SHARDS = env.int('EXPORT_MAX_SHARDS', 8)
+
+# Reuse the file of a previous export, whoever requested it, instead of
+# generating a new one when the settings, the accessible submissions and their
+# state are the same
+EXPORT_REUSE_ENABLED = env.bool('EXPORT_REUSE_ENABLED', True)
+
+# Exports record their progress (and check whether they were cancelled) at
+# most once per this many seconds
+EXPORT_PROGRESS_INTERVAL = env.int('EXPORT_PROGRESS_INTERVAL', 10)
+# Incomplete exports which have not recorded any progress for this long are
+# considered dead. Must exceed `CELERY_TASK_TIME_LIMIT`: exports do not record
+# any progress while their file is written out
+EXPORT_STALLED_TIMEOUT = env.int('EXPORT_STALLED_TIMEOUT', 3600)  # seconds
+
 # Private media file configuration
 PRIVATE_STORAGE_ROOT = os.path.join(BASE_DIR, 'media')
 PRIVATE_STORAGE_AUTH_FUNCTION = \
@@ -689,6 +718,22 @@ KOBOCAT_OLD_URL = os.environ.get('KOBOCAT_OLD_URL')
 KOBOCAT_INTERNAL_URL = os.environ.get('KOBOCAT_INTERNAL_URL',
                                       'http://kobocat')
 
+# Requests to KoBoCAT share a pool of keep-alive connections per process.
+# Idempotent requests are retried on connection errors and 502/503/504
+# responses, waiting `backoff factor * 2 ^ (retry - 1)` seconds in between
+KOBOCAT_HTTP_POOL_SIZE = env.int('KOBOCAT_HTTP_POOL_SIZE', 10)
+KOBOCAT_HTTP_CONNECT_TIMEOUT = env.float('KOBOCAT_HTTP_CONNECT_TIMEOUT', 5)  # seconds
+KOBOCAT_HTTP_READ_TIMEOUT = env.float('KOBOCAT_HTTP_READ_TIMEOUT', 120)  # seconds
+KOBOCAT_HTTP_MAX_RETRIES = env.int('KOBOCAT_HTTP_MAX_RETRIES', 3)
+KOBOCAT_HTTP_BACKOFF_FACTOR = env.float('KOBOCAT_HTTP_BACKOFF_FACTOR', 0.5)
+
+# Number of submissions sent to KoBoCAT concurrently by a bulk update
+KOBOCAT_BULK_UPDATE_MAX_WORKERS = env.int('KOBOCAT_BULK_UPDATE_MAX_WORKERS', 5)
+# Bulk updates of more submissions than this run in the background (Celery)
+SUBMISSION_BULK_UPDATE_ASYNC_THRESHOLD = env.int(
+    'SUBMISSION_BULK_UPDATE_ASYNC_THRESHOLD', 200
+)
+
 KOBOFORM_URL = os.environ.get('KOBOFORM_URL', 'http://kpi')
 KOBOFORM_INTERNAL_URL = os.environ.get('KOBOFORM_INTERNAL_URL', 'http://kpi')
 
@@ -1177,14 +1222,88 @@ else:
         mongo_db_name = env.str('MONGO_DB_NAME', 'formhub')
 
 mongo_client = MongoClient(
-    MONGO_DB_URL, connect=False, journal=True, tz_aware=True
+    MONGO_DB_URL,
+    connect=False,
+    journal=True,
+    tz_aware=True,
+    maxPoolSize=env.int('MONGO_MAX_POOL_SIZE', 100),
 )
 MONGO_DB = mongo_client[mongo_db_name]
 
+# Heavy read workloads (exports, reports, paired data) use their own client
+# with its own connection pool, and read from secondaries when there are any,
+# so they cannot starve interactive requests.
+# See `MongoHelper.analytics_workload()`
+mongo_analytics_client = MongoClient(
+    MONGO_DB_URL,
+    connect=False,
+    journal=True,
+    tz_aware=True,
+    readPreference=env.str('MONGO_ANALYTICS_READ_PREFERENCE', 'secondaryPreferred'),
+    maxPoolSize=env.int('MONGO_ANALYTICS_MAX_POOL_SIZE', 20),
+)
+MONGO_ANALYTICS_DB = mongo_analytics_client[mongo_db_name]
+
 # If a request or task makes a database query and then times out, the database
 # server should not spin forever attempting to fulfill that query.
 MONGO_QUERY_TIMEOUT = SYNCHRONOUS_REQUEST_TIME_LIMIT + 5  # seconds
 MONGO_CELERY_QUERY_TIMEOUT = CELERY_TASK_TIME_LIMIT + 10  # seconds
+MONGO_ANALYTICS_QUERY_TIMEOUT = env.int(
+    'MONGO_ANALYTICS_QUERY_TIMEOUT', MONGO_CELERY_QUERY_TIMEOUT
+)  # seconds
+
+# Counts of submissions matching a query are cached until the form receives or
+# loses submissions. Edits do not invalidate them, so do not keep them longer
+# than this
+MONGO_COUNT_CACHE_TIMEOUT = env.int('MONGO_COUNT_CACHE_TIMEOUT', 300)  # seconds
+
+# The JSON of single submissions retrieved through the data API by users
+# allowed to view all submissions is cached until they are written through
+# KPI. Edits made directly in KoBoCAT (e.g. with Enketo) are not seen before
+# this delay. `0` disables the cache
+SUBMISSION_CACHE_TIMEOUT = env.int('SUBMISSION_CACHE_TIMEOUT', 30)  # seconds
+
+# When submissions were last modified in KoBoCAT (part of the watermark which
+# tells whether cached reports and exports are up to date) is cached this
+# long, until submissions are received or deleted. Edits made in KoBoCAT are
+# not seen before this delay. `0` disables the cache
+SUBMISSION_WATERMARK_CACHE_TIMEOUT = env.int(
+    'SUBMISSION_WATERMARK_CACHE_TIMEOUT', 60
+)  # seconds
+
+# Record the fields submissions are sorted by, to recommend (and create) the
+# indexes they need. See `./manage.py sync_mongo_indexes --help`
+MONGO_RECORD_QUERY_SHAPES = env.bool('MONGO_RECORD_QUERY_SHAPES', True)
+# Sorts are counted in memory and written to MongoDB at most this often
+MONGO_QUERY_SHAPES_FLUSH_INTERVAL = env.int(
+    'MONGO_QUERY_SHAPES_FLUSH_INTERVAL', 60
+)  # seconds
+# Maximum number of indexes created from recorded sorts. MongoDB does not
+# support more than 64 indexes per collection
+MONGO_QUERY_SHAPE_INDEXES_LIMIT = env.int('MONGO_QUERY_SHAPE_INDEXES_LIMIT', 20)
+
+# Compute statistics of select and numeric questions of reports with MongoDB
+# aggregation pipelines instead of streaming all submissions through formpack
+REPORTS_USE_MONGO_AGGREGATION = env.bool('REPORTS_USE_MONGO_AGGREGATION', True)
+
+# Statistics of reports are cached until submissions change, then refreshed
+# in the background (previous ones are returned meanwhile). `0` disables the
+# cache
+REPORTS_CACHE_TIMEOUT = env.int('REPORTS_CACHE_TIMEOUT', 7 * 24 * 60 * 60)  # seconds
+
+# Optional columnar copy (Parquet files queried with DuckDB) of submissions,
+# used by reports and filtered counts. Requires `pyarrow` and `duckdb`.
+# Copies are built by Celery workers, which must share `ANALYTICS_CACHE_ROOT`
+# with the web processes.
+ANALYTICS_CACHE_ENABLED = env.bool('ANALYTICS_CACHE_ENABLED', False)
+ANALYTICS_CACHE_ROOT = env.str(
+    'ANALYTICS_CACHE_ROOT', os.path.join(BASE_DIR, 'analytics_cache')
+)
+# Number of submissions per Parquet file
+ANALYTICS_CACHE_BATCH_SIZE = env.int('ANALYTICS_CACHE_BATCH_SIZE', 50000)
+# Rebuild the copy of a form past this age (seconds) or this number of files
+ANALYTICS_CACHE_MAX_AGE = env.int('ANALYTICS_CACHE_MAX_AGE', 60 * 60)
+ANALYTICS_CACHE_MAX_PARTS = env.int('ANALYTICS_CACHE_MAX_PARTS', 50)
 
 SESSION_ENGINE = 'redis_sessions.session'
 # django-redis-session expects a dictionary with `url`
@@ -28,6 +28,7 @@ MONGO_CONNECTION_URL = 'mongodb://fakehost/formhub_test'
 mongo_client = MockMongoClient(
     MONGO_CONNECTION_URL, connect=False, journal=True, tz_aware=True)
 MONGO_DB = mongo_client['formhub_test']
+MONGO_ANALYTICS_DB = MONGO_DB
 
 ENKETO_URL = 'http://enketo.mock'
 ENKETO_INTERNAL_URL = 'http://enketo.mock'
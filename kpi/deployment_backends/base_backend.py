@@ -3,10 +3,13 @@ from __future__ import annotations
 import abc
 import copy
 import json
-from datetime import date
-from typing import Union, Iterator, Optional
+import time
+from datetime import date, datetime
+from typing import Callable, Union, Iterator, Optional
 
 from bson import json_util
+from django.conf import settings
+from django.core.cache import cache
 from django.db.models.query import QuerySet
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as t
@@ -24,6 +27,8 @@ from kpi.constants import (
 from kpi.models.asset_file import AssetFile
 from kpi.models.paired_data import PairedData
 from kpi.utils.jsonbfield_helper import ReplaceValues
+from kpi.utils.mongo_helper import MongoHelper
+from kpi.utils.object_permission import get_database_user
 
 
 class BaseDeploymentBackend(abc.ABC):
@@ -31,6 +36,9 @@ class BaseDeploymentBackend(abc.ABC):
     Defines the interface for a deployment backend.
     """
 
+    COUNT_EXACT = 'exact'
+    COUNT_ESTIMATE = 'estimate'
+
     def __init__(self, asset):
         self.asset = asset
         # Python-only attribute used by `kpi.views.v2.data.DataViewSet.list()`
@@ -41,6 +49,28 @@ class BaseDeploymentBackend(abc.ABC):
     def active(self):
         return self.get_data('active', False)
 
+    def aggregate_submissions(
+        self,
+        user: 'auth.User',
+        pipeline: list,
+        partial_perm=PERM_VIEW_SUBMISSIONS,
+        **mongo_query_params
+    ) -> list:
+        """
+        Run the MongoDB aggregation `pipeline` on the submissions `user` is
+        allowed to access, narrowed down by `query` and `submission_ids` of
+        `mongo_query_params` if any, and return its results.
+        See `MongoHelper.aggregate()`
+        """
+        params = self.validate_submission_list_params(
+            user,
+            validate_count=True,
+            partial_perm=partial_perm,
+            **mongo_query_params
+        )
+        params.pop('count_cache_version')
+        return MongoHelper.aggregate(self.mongo_userform_id, pipeline, **params)
+
     @property
     @abc.abstractmethod
     def all_time_submission_count(self):
@@ -65,7 +95,10 @@ class BaseDeploymentBackend(abc.ABC):
 
     @abc.abstractmethod
     def bulk_update_submissions(
-        self, data: dict, user: 'auth.User'
+        self,
+        data: dict,
+        user: 'auth.User',
+        progress_callback: Optional[Callable[[int], None]] = None,
     ) -> dict:
         pass
 
@@ -117,9 +150,42 @@ class BaseDeploymentBackend(abc.ABC):
     def get_attachment_objects_from_dict(self, submission: dict) -> list:
         pass
 
-    @abc.abstractmethod
-    def get_daily_counts(self, user: 'auth.User', timeframe: tuple[date, date]) -> dict:
-        pass
+    def get_daily_counts(
+        self,
+        user: 'auth.User',
+        timeframe: Optional[tuple[date, date]] = None,
+    ) -> dict:
+        """
+        Return the number of submissions `user` is allowed to see per day
+        (`YYYY-MM-DD`) within `timeframe` (all days if omitted).
+
+        Counts are read from the daily counts materialized by
+        `MongoHelper.refresh_daily_counts()`, unless partial permissions
+        filter on other fields than the submitter.
+        """
+        user = get_database_user(user)
+        permission_filters = None
+
+        if user != self.asset.owner and self.asset.has_perm(
+            user, PERM_PARTIAL_SUBMISSIONS
+        ):
+            permission_filters = self.asset.get_filters_for_partial_perm(
+                user.pk, perm=PERM_VIEW_SUBMISSIONS
+            )
+            if not permission_filters:
+                return {}
+
+            if not MongoHelper.are_daily_counts_filterable(permission_filters):
+                return self._aggregate_daily_counts(
+                    permission_filters, timeframe
+                )
+
+        return MongoHelper.get_daily_counts(
+            self.mongo_userform_id,
+            timeframe,
+            permission_filters,
+            version=self.submission_count_cache_version,
+        )
 
     def get_data(
         self, dotted_path: str = None, default=None
@@ -159,17 +225,65 @@ class BaseDeploymentBackend(abc.ABC):
     def get_enketo_survey_links(self):
         pass
 
+    @abc.abstractmethod
+    def get_modified_submission_ids(self, since: datetime) -> list[int]:
+        """
+        Return the ids of the submissions received, edited or whose validation
+        status changed after `since`
+        """
+        pass
+
+    def get_submission_cache_generation(self) -> int:
+        """
+        Return a value which changes whenever submissions are written through
+        the back end. See `invalidate_submission_cache()`
+        """
+        generation = cache.get(self._submission_cache_generation_key)
+        if generation is None:
+            self.invalidate_submission_cache()
+            generation = cache.get(self._submission_cache_generation_key)
+        return generation
+
+    def has_modified_submissions(
+        self, since: Optional[str], max_id: int
+    ) -> bool:
+        """
+        Return whether submissions up to `max_id` have been modified (e.g.
+        edited or validated) after `since`, a value returned by
+        `get_submission_last_modified()` (`None`: ever). Assumed by default
+        when it cannot be told
+        """
+        return True
+
+    def get_submission_last_modified(self) -> Optional[str]:
+        """
+        Return when submissions were last added, edited or validated, in ISO
+        format, or `None` if it is unknown. Part of the submission watermark,
+        see `get_submission_watermark()`
+        """
+        return None
+
+    @abc.abstractmethod
+    def get_submission_watermark(self) -> str:
+        """
+        Return a value which changes whenever submissions are added, edited,
+        validated or deleted, whether through the back end or not
+        """
+        pass
+
     def get_submission(
         self,
-        submission_id: int,
+        submission_id: Union[int, str],
         user: 'auth.User',
         format_type: str = SUBMISSION_FORMAT_TYPE_JSON,
         request: Optional['rest_framework.request.Request'] = None,
+        use_cache: bool = False,
         **mongo_query_params: dict
     ) -> Union[dict, str, None]:
         """
-        Retrieve the corresponding submission whose id equals `submission_id`
-        and which `user` is allowed to access.
+        Retrieve the corresponding submission whose id (or UUID) equals
+        `submission_id` and which `user` is allowed to access.
+        If several submissions share the same UUID, the first one is returned.
 
         The format `format_type` can be either:
         - 'json' (See `kpi.constants.SUBMISSION_FORMAT_TYPE_JSON`)
@@ -182,22 +296,53 @@ class BaseDeploymentBackend(abc.ABC):
         `None` is returned.
         If `format_type` is 'json', a dictionary is returned.
         Otherwise, if `format_type` is 'xml', a string is returned.
+
+        With `use_cache`, submissions are cached for
+        `settings.SUBMISSION_CACHE_TIMEOUT` seconds when neither
+        `mongo_query_params` nor partial permissions narrow down the result.
+        See `invalidate_submission_cache()`. Edits made through Enketo are not
+        seen before this delay: do not use the cache to edit, duplicate or
+        serve the attachments of a submission.
         """
+        cache_key = None
+        if use_cache and not mongo_query_params and self.asset.has_perm(
+            user, PERM_VIEW_SUBMISSIONS
+        ):
+            cache_key = self._get_submission_cache_key(
+                submission_id, format_type, request
+            )
+            submission = cache.get(cache_key)
+            if submission is not None:
+                return submission
+
+        if isinstance(submission_id, str) and not submission_id.isdigit():
+            query = mongo_query_params.get('query', {})
+            if isinstance(query, str):
+                query = json.loads(query)
+            mongo_query_params['query'] = {**query, '_uuid': submission_id}
+            mongo_query_params['limit'] = 1
+            submission_ids = []
+        else:
+            submission_ids = [int(submission_id)]
 
         submissions = list(
             self.get_submissions(
                 user,
                 format_type,
-                [int(submission_id)],
+                submission_ids,
                 request,
                 **mongo_query_params
             )
         )
         try:
-            return submissions[0]
+            submission = submissions[0]
         except IndexError:
-            pass
-        return None
+            return None
+
+        if cache_key and settings.SUBMISSION_CACHE_TIMEOUT:
+            cache.set(cache_key, submission, settings.SUBMISSION_CACHE_TIMEOUT)
+
+        return submission
 
     @abc.abstractmethod
     def get_submission_detail_url(self, submission_id: int) -> str:
@@ -247,6 +392,22 @@ class BaseDeploymentBackend(abc.ABC):
     def identifier(self):
         return self.get_data('identifier')
 
+    def invalidate_submission_cache(self):
+        """
+        Discard all cached submissions of the asset (see `get_submission()`).
+        Must be called whenever submissions are written through the back end.
+        """
+        try:
+            cache.incr(self._submission_cache_generation_key)
+        except ValueError:
+            # Key has expired or has been evicted, start a new generation
+            # which cannot collide with previous ones
+            cache.set(
+                self._submission_cache_generation_key,
+                time.time_ns(),
+                None,
+            )
+
     @property
     def last_submission_time(self):
         return self._last_submission_time()
@@ -337,6 +498,16 @@ class BaseDeploymentBackend(abc.ABC):
     def submission_count(self):
         pass
 
+    @property
+    def submission_count_cache_version(self) -> Optional[str]:
+        """
+        Return a value which changes whenever submissions are added to or
+        deleted from the form, to cache the counts of submissions.
+        See `MongoHelper._count()`.
+        Counts are not cached if `None` is returned.
+        """
+        return None
+
     @property
     @abc.abstractmethod
     def submission_list_url(self):
@@ -368,8 +539,17 @@ class BaseDeploymentBackend(abc.ABC):
             - fields
             - query
             - submission_ids
-        If `validate_count` is True,`start`, `limit`, `fields` and `sort` are
-        ignored.
+            - cursor
+            - count
+        If `validate_count` is True,`start`, `limit`, `fields`, `sort`,
+        `cursor` and `count` are ignored.
+        `count` can be `exact` (default) or `estimate`. With `estimate`, the
+        total of submissions is read from the submission counter of the form
+        instead of being counted in Mongo, unless the results are filtered.
+        In that case, the (cached) count of Mongo is used.
+        If `cursor` is provided (an empty string stands for the first page),
+        `start` is ignored and results are paginated with keyset pagination.
+        See `MongoHelper.get_instances()`.
         If `user` has partial permissions, conditions are
         applied to the query to narrow down results to what they are allowed
         to see. Partial permissions are validated with 'view_submissions' by
@@ -377,16 +557,6 @@ class BaseDeploymentBackend(abc.ABC):
         to `partial_perm`.
         """
 
-        if 'count' in mongo_query_params:
-            raise serializers.ValidationError(
-                {
-                    'count': t(
-                        'This param is not implemented. Use `count` property '
-                        'of the response instead.'
-                    )
-                }
-            )
-
         if validate_count is False and format_type == SUBMISSION_FORMAT_TYPE_XML:
             if 'sort' in mongo_query_params:
                 # FIXME. Use Mongo to sort data and ask PostgreSQL to follow the order
@@ -400,6 +570,11 @@ class BaseDeploymentBackend(abc.ABC):
                     'fields': t('This is not supported in `XML` format')
                 })
 
+            if 'cursor' in mongo_query_params:
+                raise serializers.ValidationError({
+                    'cursor': t('This param is not supported in `XML` format')
+                })
+
         start = mongo_query_params.get('start', 0)
         limit = mongo_query_params.get('limit')
         sort = mongo_query_params.get('sort', {})
@@ -407,6 +582,8 @@ class BaseDeploymentBackend(abc.ABC):
         query = mongo_query_params.get('query', {})
         submission_ids = mongo_query_params.get('submission_ids', [])
         skip_count = mongo_query_params.get('skip_count', False)
+        cursor = mongo_query_params.get('cursor')
+        count = mongo_query_params.get('count', self.COUNT_EXACT)
 
         # I've copied these `ValidationError` messages verbatim from DRF where
         # possible.TODO: Should this validation be in (or called directly by)
@@ -438,9 +615,25 @@ class BaseDeploymentBackend(abc.ABC):
             return {
                 'query': query,
                 'submission_ids': submission_ids,
-                'permission_filters': permission_filters
+                'permission_filters': permission_filters,
+                'count_cache_version': self.submission_count_cache_version,
             }
 
+        if count not in (self.COUNT_EXACT, self.COUNT_ESTIMATE):
+            raise serializers.ValidationError(
+                {'count': t('Value must be `exact` or `estimate`.')}
+            )
+
+        # The submission counter of the form is only relevant when results
+        # are not narrowed down
+        estimate_count = (
+            count == self.COUNT_ESTIMATE
+            and not skip_count
+            and not query
+            and not submission_ids
+            and not permission_filters
+        )
+
         if isinstance(sort, str):
             try:
                 sort = json.loads(sort, object_hook=json_util.object_hook)
@@ -471,6 +664,24 @@ class BaseDeploymentBackend(abc.ABC):
                     {'fields': t('Value must be valid JSON.')}
                 )
 
+        if cursor is not None:
+            try:
+                cursor = MongoHelper.decode_cursor(cursor)
+            except ValueError:
+                raise serializers.ValidationError(
+                    {'cursor': t('Invalid cursor.')}
+                )
+
+            sort_key, sort_dir = MongoHelper.get_sort_key_and_direction(sort)
+            if cursor and cursor['sort'] != [sort_key, sort_dir]:
+                raise serializers.ValidationError(
+                    {'cursor': t('Cursor does not match `sort`.')}
+                )
+
+            # The value of the sort field is needed to build the next cursor
+            if fields and sort_key not in fields:
+                fields.append(sort_key)
+
         params = {
             'query': query,
             'start': start,
@@ -478,7 +689,10 @@ class BaseDeploymentBackend(abc.ABC):
             'sort': sort,
             'submission_ids': submission_ids,
             'permission_filters': permission_filters,
-            'skip_count': skip_count,
+            'skip_count': skip_count or estimate_count,
+            'cursor': cursor,
+            'count_cache_version': self.submission_count_cache_version,
+            'estimate_count': estimate_count,
         }
 
         if limit:
@@ -506,70 +720,61 @@ class BaseDeploymentBackend(abc.ABC):
         if PERM_PARTIAL_SUBMISSIONS not in self.asset.get_perms(user):
             return
 
-        allowed_submission_ids = []
-
-        if not submission_ids:
-            # if no submission ids are provided, the back end must rebuild the
-            # query to retrieve the related submissions. Unfortunately, the
-            # current back end (KoBoCAT) does not support row level permissions.
-            # Thus, we need to fetch all the submissions the user is allowed to
-            # see in order to to compare the requested subset of submissions to
-            # all
-            all_submissions = self.get_submissions(
-                user=user,
+        # Do not alter the caller's query (or the default value)
+        query = copy.deepcopy(query)
+        submission_ids = [int(id_) for id_ in set(submission_ids)]
+
+        if submission_ids:
+            # All requested submissions must match `query` (if any) and be
+            # allowed. Counting the submissions which match both the request
+            # and the permission filters avoids retrieving their ids.
+            params = self.validate_submission_list_params(
+                user,
+                validate_count=True,
                 partial_perm=perm,
-                fields=['_id'],
-                skip_count=True,
+                submission_ids=submission_ids,
+                query=query,
             )
-            allowed_submission_ids = [r['_id'] for r in all_submissions]
-
-            # User should see at least one submission to be allowed to do
-            # something
-            if not allowed_submission_ids:
+            # Permissions must not be validated against a cached count
+            params['count_cache_version'] = None
+            if MongoHelper.get_count(self.mongo_userform_id, **params) != len(
+                submission_ids
+            ):
                 raise PermissionDenied
 
-            # if `query` is not provided, the action is performed on all
-            # submissions. There are no needs to go further.
-            if not query:
-                return allowed_submission_ids
-
+            return submission_ids
+
+        # If no submission ids are provided, the back end must rebuild the
+        # query to retrieve the related submissions. Unfortunately, the
+        # current back end (KoBoCAT) does not support row level permissions.
+        # Thus, the ids of the submissions matching `query` (all submissions
+        # if `query` is empty) the user is allowed to access are returned.
+        # Regardless of whether the request contained a query or not, always
+        # return ids here because the results of a query may contain
+        # submissions that the requesting user is not allowed to access.
+        # For example,
+        #   - In submissions 4, 5, and 6, the response to the "state"
+        #       question was "California"
+        #   - Bob is allowed to access only submissions made by Jerry
+        #   - Jerry uploaded submissions 5, 6, and 7
+        #   - Bob submits a query for all submissions where
+        #       `{"state": "California"}`
+        #   - Bob must only see submissions 5 and 6
         submissions = self.get_submissions(
             user=user,
             partial_perm=perm,
             fields=['_id'],
-            submission_ids=submission_ids,
             query=query,
             skip_count=True,
         )
+        allowed_submission_ids = [r['_id'] for r in submissions]
 
-        requested_submission_ids = [
-            r['_id'] for r in submissions
-        ]
-
-        if not requested_submission_ids:
+        # User should see at least one submission to be allowed to do
+        # something
+        if not allowed_submission_ids:
             raise PermissionDenied
 
-        submission_ids = [int(id_) for id_ in set(submission_ids)]
-        if (
-            (allowed_submission_ids
-             and set(requested_submission_ids).issubset(allowed_submission_ids))
-            or sorted(requested_submission_ids) == sorted(submission_ids)
-        ):
-            # Regardless of whether or not the request contained a query or a
-            # list of IDs, always return IDs here because the results of a
-            # query may contain submissions that the requesting user is not
-            # allowed to access. For example,
-            #   - In submissions 4, 5, and 6, the response to the "state"
-            #       question was "California"
-            #   - Bob is allowed to access only submissions made by Jerry
-            #   - Jerry uploaded submissions 5, 6, and 7
-            #   - Bob submits a query for all submissions where
-            #       `{"state": "California"}`
-            #   - Bob must only see submissions 5 and 6
-
-            return requested_submission_ids
-
-        raise PermissionDenied
+        return allowed_submission_ids
 
     @property
     def version(self):
@@ -579,6 +784,55 @@ class BaseDeploymentBackend(abc.ABC):
     def version_id(self):
         return self.get_data('version')
 
+    def _aggregate_daily_counts(
+        self,
+        permission_filters: list,
+        timeframe: Optional[tuple[date, date]] = None,
+    ) -> dict:
+        """
+        Count the submissions matching `permission_filters` per day on the fly
+        """
+        query = {'_userform_id': self.mongo_userform_id}
+        if timeframe:
+            query['_submission_time'] = {
+                '$gte': f'{timeframe[0]}',
+                '$lte': f'{timeframe[1]}T23:59:59',
+            }
+        query = MongoHelper.get_permission_filters_query(
+            query, permission_filters
+        )
+        documents = settings.MONGO_DB.instances.aggregate(
+            [
+                {'$match': query},
+                {
+                    '$group': {
+                        '_id': {'$substr': ['$_submission_time', 0, 10]},
+                        'count': {'$sum': 1},
+                    }
+                },
+            ],
+            maxTimeMS=MongoHelper.get_max_time_ms(),
+        )
+        return {doc['_id']: doc['count'] for doc in documents}
+
+    def _get_submission_cache_key(
+        self,
+        submission_id: Union[int, str],
+        format_type: str,
+        request: Optional['rest_framework.request.Request'] = None,
+    ) -> str:
+        generation = self.get_submission_cache_generation()
+        # Attachment URLs are built from the host of the request
+        host = request.get_host() if request else ''
+        return (
+            f'submission:{self.asset.uid}:{generation}:{submission_id}:'
+            f'{format_type}:{host}'
+        )
+
+    @property
+    def _submission_cache_generation_key(self) -> str:
+        return f'submission_cache_generation:{self.asset.uid}'
+
     def _get_metadata_queryset(self, file_type: str) -> Union[QuerySet, list]:
         """
         Returns a list of objects, or a QuerySet to pass to Celery to
@@ -0,0 +1,141 @@
+# coding: utf-8
+import os
+import threading
+import time
+from http.cookiejar import DefaultCookiePolicy
+from typing import Optional
+
+import requests
+from django.conf import settings
+from prometheus_client import Histogram
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from kpi.utils.log import logging
+
+KOBOCAT_REQUEST_LATENCY = Histogram(
+    'kpi_kobocat_request_latency_seconds',
+    'Latency of HTTP requests sent to KoBoCAT',
+    ['method', 'status'],
+)
+
+_lock = threading.Lock()
+_adapter = None
+_adapter_pid = None
+_local = threading.local()
+
+
+class BlockAllCookies(DefaultCookiePolicy):
+    """
+    Cookie policy which refuses to store any cookie
+    """
+
+    def set_ok(self, cookie, request):
+        return False
+
+
+class KobocatSession(requests.Session):
+    """
+    `requests.Session` which keeps connections to KoBoCAT alive, retries
+    idempotent requests with backoff, applies default timeouts and records
+    the latency of each request.
+
+    Requests are sent on behalf of different users: cookies set by KoBoCAT
+    (e.g. `sessionid`, `csrftoken`) are never stored, so that they cannot be
+    replayed on the requests of other users
+    """
+
+    def __init__(self, adapter: HTTPAdapter):
+        super().__init__()
+        self.cookies.set_policy(BlockAllCookies())
+        self.mount('http://', adapter)
+        self.mount('https://', adapter)
+
+    def send(self, request, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = (
+                settings.KOBOCAT_HTTP_CONNECT_TIMEOUT,
+                settings.KOBOCAT_HTTP_READ_TIMEOUT,
+            )
+        status = 'error'
+        start = time.perf_counter()
+        try:
+            response = super().send(request, **kwargs)
+            status = response.status_code
+            return response
+        finally:
+            duration = time.perf_counter() - start
+            KOBOCAT_REQUEST_LATENCY.labels(request.method, status).observe(
+                duration
+            )
+            logging.debug(
+                f'KoBoCAT request {request.method} {request.url} '
+                f'({status}) took {duration:.3f}s'
+            )
+
+
+def get_kobocat_adapter() -> HTTPAdapter:
+    """
+    Return the HTTP adapter, i.e. the pool of connections to KoBoCAT, shared
+    by all threads of the current process. A new one is created after a fork,
+    since connections cannot be shared between processes.
+    """
+    global _adapter, _adapter_pid
+
+    pid = os.getpid()
+    if _adapter is None or _adapter_pid != pid:
+        with _lock:
+            if _adapter is None or _adapter_pid != pid:
+                retry = Retry(
+                    total=settings.KOBOCAT_HTTP_MAX_RETRIES,
+                    backoff_factor=settings.KOBOCAT_HTTP_BACKOFF_FACTOR,
+                    status_forcelist=(502, 503, 504),
+                    # Only idempotent methods; submissions must never be sent
+                    # twice
+                    allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+                    # Let callers handle error responses
+                    raise_on_status=False,
+                )
+                _adapter = HTTPAdapter(
+                    pool_connections=settings.KOBOCAT_HTTP_POOL_SIZE,
+                    pool_maxsize=settings.KOBOCAT_HTTP_POOL_SIZE,
+                    max_retries=retry,
+                )
+                _adapter_pid = pid
+    return _adapter
+
+
+def get_kobocat_session() -> KobocatSession:
+    """
+    Return the session of the current thread for requests to KoBoCAT.
+    `requests.Session` is not guaranteed to be thread-safe: each thread has
+    its own session, and all of them share the connections of
+    `get_kobocat_adapter()`
+    """
+    adapter = get_kobocat_adapter()
+    session = getattr(_local, 'session', None)
+    if session is None or session.get_adapter('http://') is not adapter:
+        session = KobocatSession(adapter)
+        _local.session = session
+    return session
+
+
+def kobocat_request(
+    method: str, url: str, timeout: Optional[tuple] = None, **kwargs
+) -> requests.Response:
+    """
+    Send a request to KoBoCAT with the session of the current thread. Keyword
+    arguments are passed through to `requests.Session.request()`
+    """
+    return get_kobocat_session().request(
+        method, url, timeout=timeout, **kwargs
+    )
+
+
+def kobocat_send(
+    prepared_request: requests.PreparedRequest, **kwargs
+) -> requests.Response:
+    """
+    Send a prepared request to KoBoCAT with the session of the current thread
+    """
+    return get_kobocat_session().send(prepared_request, **kwargs)
@@ -4,7 +4,6 @@ import logging
 from contextlib import ContextDecorator
 from typing import Union
 
-import requests
 from django.conf import settings
 from django.contrib.auth.models import AnonymousUser, User
 from django.core.exceptions import ImproperlyConfigured
@@ -16,6 +15,7 @@ from rest_framework.authtoken.models import Token
 from kpi.exceptions import KobocatProfileException
 from kpi.utils.log import logging
 from kpi.utils.permissions import is_user_anonymous
+from .http_client import kobocat_request
 from .shadow_models import (
     safe_kc_read,
     KobocatContentType,
@@ -35,8 +35,8 @@ def _trigger_kc_profile_creation(user):
     """
     url = settings.KOBOCAT_INTERNAL_URL + '/api/v1/user'
     token, _ = Token.objects.get_or_create(user=user)
-    response = requests.get(
-        url, headers={'Authorization': 'Token ' + token.key})
+    response = kobocat_request(
+        'GET', url, headers={'Authorization': 'Token ' + token.key})
     if not response.status_code == 200:
         raise KobocatProfileException(
             'Bad HTTP status code `{}` when retrieving KoBoCAT user profile'
@@ -392,8 +392,8 @@ def remove_applicable_kc_permissions(
 def delete_kc_user(username: str):
     url = settings.KOBOCAT_INTERNAL_URL + f'/api/v1/users/{username}'
 
-    response = requests.delete(
-        url, headers=get_request_headers(username)
+    response = kobocat_request(
+        'DELETE', url, headers=get_request_headers(username)
     )
     response.raise_for_status()
 
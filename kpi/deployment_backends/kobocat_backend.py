@@ -8,8 +8,15 @@ import posixpath
 import re
 import uuid
 from collections import defaultdict
+from concurrent.futures import (
+    ALL_COMPLETED,
+    FIRST_COMPLETED,
+    ThreadPoolExecutor,
+    wait,
+)
 from datetime import date, datetime
-from typing import Generator, Optional, Union
+from itertools import islice
+from typing import Callable, Generator, Optional, Union
 from urllib.parse import urlparse
 from xml.etree import ElementTree as ET
 try:
@@ -19,10 +26,11 @@ except ImportError:
 
 import requests
 from django.conf import settings
+from django.core.cache import cache
 from django.core.exceptions import ImproperlyConfigured
 from lxml import etree
 from django.core.files import File
-from django.db.models import Sum
+from django.db.models import Max, Sum
 from django.db.models.query import QuerySet
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as t
@@ -59,11 +67,11 @@ from kpi.utils.object_permission import get_database_user
 from kpi.utils.permissions import is_user_anonymous
 from kpi.utils.xml import edit_submission_xml
 from .base_backend import BaseDeploymentBackend
+from .kc_access.http_client import kobocat_send
 from .kc_access.shadow_models import (
     KobocatXForm,
     ReadOnlyKobocatAttachment,
     ReadOnlyKobocatInstance,
-    ReadOnlyKobocatDailyXFormSubmissionCounter,
     ReadOnlyKobocatMonthlyXFormSubmissionCounter,
 )
 from .kc_access.utils import (
@@ -78,7 +86,11 @@ from ..exceptions import (
     KobocatDuplicateSubmissionException,
 )
 
-from kobo.apps.subsequences.utils import stream_with_extras
+from kobo.apps.reports.columnar_cache import (
+    ColumnarCacheError,
+    ColumnarSubmissionCache,
+)
+from kobo.apps.subsequences.utils import stream_with_batched_extras
 from kobo.apps.trackers.models import MonthlyNLPUsageCounter
 
 
@@ -103,6 +115,9 @@ class KobocatDeploymentBackend(BaseDeploymentBackend):
         r'[a-z\d]{8}-([a-z\d]{4}-){3}[a-z\d]{12}'
     )
 
+    # Number of submission XMLs retrieved from PostgreSQL per query
+    SUBMISSION_XML_BATCH_SIZE = 500
+
     @property
     def all_time_submission_count(self):
         try:
@@ -146,7 +161,10 @@ class KobocatDeploymentBackend(BaseDeploymentBackend):
                 assign_applicable_kc_permissions(self.asset, user, perms)
 
     def bulk_update_submissions(
-        self, data: dict, user: 'auth.User'
+        self,
+        data: dict,
+        user: 'auth.User',
+        progress_callback: Optional[Callable[[int], None]] = None,
     ) -> dict:
         """
         Allows for bulk updating of submissions proxied through KoBoCAT. A
@@ -156,10 +174,15 @@ class KobocatDeploymentBackend(BaseDeploymentBackend):
         submission's XML tree, or the existing value is replaced by the updated
         value.
 
+        Updated submissions are sent to KoBoCAT concurrently, by up to
+        `KOBOCAT_BULK_UPDATE_MAX_WORKERS` threads.
+
         Args:
             data (dict): must contain a list of `submission_ids` and at
                 least one other key:value field for updating the submissions
             user (User)
+            progress_callback (callable): called with the number of
+                submissions processed so far, each time some are
 
         Returns:
             dict: formatted dict to be passed to a Response object
@@ -195,55 +218,13 @@ class KobocatDeploymentBackend(BaseDeploymentBackend):
             )
 
         update_data = self.__prepare_bulk_update_data(data['data'])
-        kc_responses = []
-        for submission in submissions:
-            xml_parsed = etree.fromstring(submission)
-
-            _uuid, uuid_formatted = self.generate_new_instance_id()
-
-            # Updating xml fields for submission. In order to update an existing
-            # submission, the current `instanceID` must be moved to the value
-            # for `deprecatedID`.
-            instance_id = xml_parsed.find('meta/instanceID')
-            # If the submission has been edited before, it will already contain
-            # a deprecatedID element - otherwise create a new element
-            deprecated_id = xml_parsed.find('meta/deprecatedID')
-            deprecated_id_or_new = (
-                deprecated_id
-                if deprecated_id is not None
-                else etree.SubElement(xml_parsed.find('meta'), 'deprecatedID')
-            )
-            deprecated_id_or_new.text = instance_id.text
-            instance_id.text = uuid_formatted
-
-            # If the form has been updated with new fields and earlier
-            # submissions have been selected as part of the bulk update,
-            # a new element has to be created before a value can be set.
-            # However, with this new power, arbitrary fields can be added
-            # to the XML tree through the API.
-            for path, value in update_data.items():
-                edit_submission_xml(xml_parsed, path, value)
-
-            # TODO: Might be worth refactoring this as it is also used when
-            # duplicating a submission
-            file_tuple = (_uuid, io.BytesIO(etree.tostring(xml_parsed)))
-            files = {'xml_submission_file': file_tuple}
-            # `POST` is required by OpenRosa spec https://docs.getodk.org/openrosa-form-submission
-            kc_request = requests.Request(
-                method='POST',
-                url=self.submission_url,
-                files=files,
-            )
-            kc_response = self.__kobocat_proxy_request(
-                kc_request, user=user
-            )
-
-            kc_responses.append(
-                {
-                    'uuid': _uuid,
-                    'response': kc_response,
-                }
-            )
+        kc_requests = self.__prepare_bulk_update_requests(
+            submissions, update_data, user
+        )
+        kc_responses = self.__send_bulk_update_requests(
+            kc_requests, progress_callback
+        )
+        self.invalidate_submission_cache()
 
         return self.__prepare_bulk_update_response(kc_responses)
 
@@ -251,6 +232,17 @@ class KobocatDeploymentBackend(BaseDeploymentBackend):
         params = self.validate_submission_list_params(
             user, validate_count=True, **kwargs
         )
+        if ColumnarSubmissionCache.is_enabled():
+            query = MongoHelper.get_query(
+                self.mongo_userform_id,
+                copy.deepcopy(params['query']),
+                params['submission_ids'],
+                params['permission_filters'],
+            )
+            try:
+                return ColumnarSubmissionCache(self.asset).count(query)
+            except ColumnarCacheError:
+                pass
         return MongoHelper.get_count(self.mongo_userform_id, **params)
 
     def connect(self, identifier=None, active=False):
@@ -428,6 +420,7 @@ class KobocatDeploymentBackend(BaseDeploymentBackend):
         kc_url = self.get_submission_detail_url(submission_id)
         kc_request = requests.Request(method='DELETE', url=kc_url)
         kc_response = self.__kobocat_proxy_request(kc_request, user)
+        self.invalidate_submission_cache()
 
         return self.__prepare_as_drf_response_signature(kc_response)
 
@@ -462,6 +455,7 @@ class KobocatDeploymentBackend(BaseDeploymentBackend):
         kc_url = self.submission_list_url
         kc_request = requests.Request(method='DELETE', url=kc_url, json=data)
         kc_response = self.__kobocat_proxy_request(kc_request, user)
+        self.invalidate_submission_cache()
 
         drf_response = self.__prepare_as_drf_response_signature(kc_response)
         return drf_response
@@ -598,6 +592,7 @@ class KobocatDeploymentBackend(BaseDeploymentBackend):
             method='POST', url=self.submission_url, files=files
         )
         kc_response = self.__kobocat_proxy_request(kc_request, user)
+        self.invalidate_submission_cache()
         return self.__prepare_as_drf_response_signature(
             kc_response, expected_response_format='xml'
         )
@@ -742,73 +737,6 @@ class KobocatDeploymentBackend(BaseDeploymentBackend):
             instance_id=submission['_id']
         )
 
-    def get_daily_counts(
-        self, user: 'auth.User', timeframe: tuple[date, date]
-    ) -> dict:
-
-        user = get_database_user(user)
-
-        if user != self.asset.owner and self.asset.has_perm(
-            user, PERM_PARTIAL_SUBMISSIONS
-        ):
-            # We cannot use cached values from daily counter when user has
-            # partial permissions. We need to use MongoDB aggregation engine
-            # to retrieve the correct value according to user's permissions.
-            permission_filters = self.asset.get_filters_for_partial_perm(
-                user.pk, perm=PERM_VIEW_SUBMISSIONS
-            )
-
-            if not permission_filters:
-                return {}
-
-            query = {
-                '_userform_id': self.mongo_userform_id,
-                '_submission_time': {
-                    '$gte': f'{timeframe[0]}',
-                    '$lte': f'{timeframe[1]}T23:59:59'
-                }
-            }
-
-            query = MongoHelper.get_permission_filters_query(
-                query, permission_filters
-            )
-
-            documents = settings.MONGO_DB.instances.aggregate([
-                {
-                    '$match': query,
-                },
-                {
-                    '$group': {
-                        '_id': {
-                            '$dateToString': {
-                                'format': '%Y-%m-%d',
-                                'date': {
-                                    '$dateFromString': {
-                                        'format': "%Y-%m-%dT%H:%M:%S",
-                                        'dateString': "$_submission_time"
-                                    }
-                                }
-                            }
-                        },
-                        'count': {'$sum': 1}
-                    }
-                }
-            ])
-            return {doc['_id']: doc['count'] for doc in documents}
-
-        # Trivial case, user has 'view_permissions'
-        daily_counts = (
-            ReadOnlyKobocatDailyXFormSubmissionCounter.objects.values(
-                'date', 'counter'
-            ).filter(
-                xform_id=self.xform_id,
-                date__range=timeframe,
-            )
-        )
-        return {
-            str(count['date']): count['counter'] for count in daily_counts
-        }
-
     def get_data_download_links(self):
         exports_base_url = '/'.join((
             settings.KOBOCAT_URL.rstrip('/'),
@@ -867,6 +795,15 @@ class KobocatDeploymentBackend(BaseDeploymentBackend):
                 pass
         return links
 
+    def get_modified_submission_ids(self, since: datetime) -> list[int]:
+        # KoBoCAT updates `date_modified` of instances when they are edited or
+        # when their validation status changes
+        return list(
+            ReadOnlyKobocatInstance.objects.filter(
+                xform_id=self.xform_id, date_modified__gt=since
+            ).values_list('pk', flat=True)
+        )
+
     def get_orphan_postgres_submissions(self) -> Optional[QuerySet, bool]:
         """
         Return a queryset of all submissions still present in PostgreSQL
@@ -902,6 +839,59 @@ class KobocatDeploymentBackend(BaseDeploymentBackend):
         )
         return url
 
+    def get_submission_last_modified(self) -> Optional[str]:
+        # The aggregate reads all the instances of the form: it is cached
+        # briefly, per count cache version. Submissions received or deleted
+        # are thus seen right away, edits after
+        # `SUBMISSION_WATERMARK_CACHE_TIMEOUT` at most
+        count_cache_version = self.submission_count_cache_version
+        cache_key = None
+        if (
+            count_cache_version is not None
+            and settings.SUBMISSION_WATERMARK_CACHE_TIMEOUT
+        ):
+            cache_key = 'submission_last_modified:{}:{}'.format(
+                self.xform_id, count_cache_version
+            )
+            last_modified = cache.get(cache_key)
+            if last_modified is not None:
+                return last_modified or None
+
+        last_modified = ReadOnlyKobocatInstance.objects.filter(
+            xform_id=self.xform_id
+        ).aggregate(Max('date_modified'))['date_modified__max']
+        last_modified = last_modified.isoformat() if last_modified else None
+        if cache_key:
+            # An empty string tells no submission from a cache miss
+            cache.set(
+                cache_key,
+                last_modified or '',
+                settings.SUBMISSION_WATERMARK_CACHE_TIMEOUT,
+            )
+        return last_modified
+
+    def has_modified_submissions(
+        self, since: Optional[str], max_id: int
+    ) -> bool:
+        # The ids of submissions in MongoDB are the ids of KoBoCAT instances
+        instances = ReadOnlyKobocatInstance.objects.filter(
+            xform_id=self.xform_id, pk__lte=max_id
+        )
+        if since is not None:
+            instances = instances.filter(
+                date_modified__gt=datetime.fromisoformat(since)
+            )
+        return instances.exists()
+
+    def get_submission_watermark(self) -> str:
+        # Submissions are received and edited by KoBoCAT directly, which
+        # updates the counter and `date_modified` of instances
+        return '{}|{}|{}'.format(
+            self.submission_count_cache_version,
+            self.get_submission_last_modified(),
+            self.get_submission_cache_generation(),
+        )
+
     def get_submissions(
         self,
         user: 'auth.User',
@@ -1192,6 +1182,7 @@ class KobocatDeploymentBackend(BaseDeploymentBackend):
 
         kc_request = requests.Request(**kc_request_params)
         kc_response = self.__kobocat_proxy_request(kc_request, user)
+        self.invalidate_submission_cache()
         return self.__prepare_as_drf_response_signature(kc_response)
 
     def set_validation_statuses(self, user: 'auth.User', data: dict) -> dict:
@@ -1225,6 +1216,7 @@ class KobocatDeploymentBackend(BaseDeploymentBackend):
         url = self.submission_list_url
         kc_request = requests.Request(method='PATCH', url=url, json=data)
         kc_response = self.__kobocat_proxy_request(kc_request, user)
+        self.invalidate_submission_cache()
         return self.__prepare_as_drf_response_signature(kc_response)
 
     @property
@@ -1234,6 +1226,14 @@ class KobocatDeploymentBackend(BaseDeploymentBackend):
         except InvalidXFormException:
             return 0
 
+    @property
+    def submission_count_cache_version(self) -> Optional[str]:
+        try:
+            xform = self.xform
+        except InvalidXFormException:
+            return None
+        return f'{xform.last_submission_time}|{xform.num_of_submissions}'
+
     @property
     def submission_list_url(self):
         url = '{kc_base}/api/v1/data/{formid}'.format(
@@ -1343,6 +1343,7 @@ class KobocatDeploymentBackend(BaseDeploymentBackend):
                     'user__username',
                     'id_string',
                     'num_of_submissions',
+                    'last_submission_time',
                     'attachment_storage_bytes',
                 )
                 .select_related(
@@ -1480,11 +1481,14 @@ class KobocatDeploymentBackend(BaseDeploymentBackend):
         Retrieve submissions directly from Mongo.
         Submissions can be filtered with `params`.
         """
+        estimate_count = params.pop('estimate_count', False)
         mongo_cursor, total_count = MongoHelper.get_instances(
             self.mongo_userform_id, **params)
 
         # Python-only attribute used by `kpi.views.v2.data.DataViewSet.list()`
-        self.current_submission_count = total_count
+        self.current_submission_count = (
+            self.submission_count if estimate_count else total_count
+        )
 
         add_supplemental_details_to_query = self.asset.has_advanced_features
 
@@ -1494,13 +1498,13 @@ class KobocatDeploymentBackend(BaseDeploymentBackend):
             add_supplemental_details_to_query = False
 
         if add_supplemental_details_to_query:
-            extras_query = self.asset.submission_extras
-            extras_data = dict(extras_query.values_list('submission_uuid', 'content'))
-            mongo_cursor = stream_with_extras(mongo_cursor, extras_data)
+            mongo_cursor = stream_with_batched_extras(mongo_cursor, self.asset)
+
+        key_codec = MongoHelper.get_key_codec(self.mongo_userform_id)
 
         return (
             self.__rewrite_json_attachment_urls(
-                MongoHelper.to_readable_dict(submission),
+                key_codec.to_readable_dict(submission),
                 request,
             )
             for submission in mongo_cursor
@@ -1515,6 +1519,7 @@ class KobocatDeploymentBackend(BaseDeploymentBackend):
         Submissions can be filtered with `params`.
         """
 
+        estimate_count = params.pop('estimate_count', False)
         mongo_filters = ['query', 'permission_filters']
         use_mongo = any(mongo_filter in mongo_filters for mongo_filter in params
                         if params.get(mongo_filter) is not None)
@@ -1528,35 +1533,57 @@ class KobocatDeploymentBackend(BaseDeploymentBackend):
             submissions, count = MongoHelper.get_instances(
                 self.mongo_userform_id, **params
             )
-            submission_ids = [
-                submission.get('_id')
-                for submission in submissions
-            ]
             self.current_submission_count = count
+            if estimate_count:
+                self.current_submission_count = self.submission_count
+            # Walk the Mongo cursor, which is already paginated, and retrieve
+            # XMLs from PostgreSQL by batches to keep memory usage bounded
+            return self.__stream_xml_by_ids(
+                submission.get('_id') for submission in submissions
+            )
 
         queryset = ReadOnlyKobocatInstance.objects.filter(
             xform_id=self.xform_id,
         )
 
-        if len(submission_ids) > 0 or use_mongo:
+        if submission_ids := params.get('submission_ids'):
             queryset = queryset.filter(id__in=submission_ids)
 
         # Python-only attribute used by `kpi.views.v2.data.DataViewSet.list()`
-        if not use_mongo:
+        if estimate_count:
+            self.current_submission_count = self.submission_count
+        else:
             self.current_submission_count = queryset.count()
 
         # Force Sort by id
         # See FIXME about sort in `BaseDeploymentBackend.validate_submission_list_params()`
         queryset = queryset.order_by('id')
 
-        # When using Mongo, data is already paginated,
-        # no need to do it with PostgreSQL too.
-        if not use_mongo:
-            offset = params.get('start')
-            limit = offset + params.get('limit')
-            queryset = queryset[offset:limit]
+        offset = params.get('start')
+        limit = offset + params.get('limit')
+        queryset = queryset[offset:limit]
 
-        return (lazy_instance.xml for lazy_instance in queryset)
+        return queryset.values_list('xml', flat=True).iterator()
+
+    def __stream_xml_by_ids(
+        self, submission_ids: Generator[int, None, None]
+    ) -> Generator[str, None, None]:
+        """
+        Yield the XML of the submissions whose ids are yielded by
+        `submission_ids`, in ascending order. Ids must be sorted.
+        """
+        while True:
+            batch = list(islice(submission_ids, self.SUBMISSION_XML_BATCH_SIZE))
+            if not batch:
+                break
+            queryset = (
+                ReadOnlyKobocatInstance.objects.filter(
+                    xform_id=self.xform_id, id__in=batch
+                )
+                .order_by('id')
+                .values_list('xml', flat=True)
+            )
+            yield from queryset.iterator()
 
     @staticmethod
     def __kobocat_proxy_request(kc_request, user=None):
@@ -1572,8 +1599,7 @@ class KobocatDeploymentBackend(BaseDeploymentBackend):
         if not is_user_anonymous(user):
             kc_request.headers.update(get_request_headers(user.username))
 
-        session = requests.Session()
-        return session.send(kc_request.prepare())
+        return kobocat_send(kc_request.prepare())
 
     @staticmethod
     def __parse_identifier(identifier: str) -> tuple:
@@ -1642,6 +1668,59 @@ class KobocatDeploymentBackend(BaseDeploymentBackend):
 
         return sanitized_updates
 
+    def __prepare_bulk_update_requests(
+        self,
+        submissions: Generator[str, None, None],
+        update_data: dict,
+        user: 'auth.User',
+    ) -> Generator[tuple, None, None]:
+        """
+        Yield a (uuid, prepared request) tuple for each submission of
+        `submissions` updated with `update_data`
+        """
+        for submission in submissions:
+            xml_parsed = etree.fromstring(submission)
+
+            _uuid, uuid_formatted = self.generate_new_instance_id()
+
+            # Updating xml fields for submission. In order to update an existing
+            # submission, the current `instanceID` must be moved to the value
+            # for `deprecatedID`.
+            instance_id = xml_parsed.find('meta/instanceID')
+            # If the submission has been edited before, it will already contain
+            # a deprecatedID element - otherwise create a new element
+            deprecated_id = xml_parsed.find('meta/deprecatedID')
+            deprecated_id_or_new = (
+                deprecated_id
+                if deprecated_id is not None
+                else etree.SubElement(xml_parsed.find('meta'), 'deprecatedID')
+            )
+            deprecated_id_or_new.text = instance_id.text
+            instance_id.text = uuid_formatted
+
+            # If the form has been updated with new fields and earlier
+            # submissions have been selected as part of the bulk update,
+            # a new element has to be created before a value can be set.
+            # However, with this new power, arbitrary fields can be added
+            # to the XML tree through the API.
+            for path, value in update_data.items():
+                edit_submission_xml(xml_parsed, path, value)
+
+            # TODO: Might be worth refactoring this as it is also used when
+            # duplicating a submission
+            file_tuple = (_uuid, io.BytesIO(etree.tostring(xml_parsed)))
+            files = {'xml_submission_file': file_tuple}
+            # `POST` is required by OpenRosa spec https://docs.getodk.org/openrosa-form-submission
+            kc_request = requests.Request(
+                method='POST',
+                url=self.submission_url,
+                files=files,
+            )
+            if not is_user_anonymous(user):
+                kc_request.headers.update(get_request_headers(user.username))
+
+            yield _uuid, kc_request.prepare()
+
     @staticmethod
     def __prepare_bulk_update_response(kc_responses: list) -> dict:
         """
@@ -1698,6 +1777,44 @@ class KobocatDeploymentBackend(BaseDeploymentBackend):
             },
         }
 
+    @staticmethod
+    def __send_bulk_update_requests(
+        kc_requests: Generator[tuple, None, None],
+        progress_callback: Optional[Callable[[int], None]] = None,
+    ) -> list:
+        """
+        Send the prepared `kc_requests`, i.e. (uuid, request) tuples, to
+        KoBoCAT concurrently and return their responses in the same order
+        """
+        max_workers = settings.KOBOCAT_BULK_UPDATE_MAX_WORKERS
+        kc_responses = []
+        pending = set()
+        processed = 0
+
+        def _wait_for_pending(return_when):
+            nonlocal pending, processed
+            done, pending = wait(pending, return_when=return_when)
+            processed += len(done)
+            if progress_callback and done:
+                progress_callback(processed)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for _uuid, prepared_request in kc_requests:
+                # Do not build more XML than the workers can send
+                if len(pending) >= max_workers * 2:
+                    _wait_for_pending(FIRST_COMPLETED)
+                # Each worker thread sends with its own session
+                future = executor.submit(kobocat_send, prepared_request)
+                pending.add(future)
+                kc_responses.append({'uuid': _uuid, 'response': future})
+            _wait_for_pending(ALL_COMPLETED)
+
+        for kc_response in kc_responses:
+            # Raise the first error encountered, if any
+            kc_response['response'] = kc_response['response'].result()
+
+        return kc_responses
+
     def __rewrite_json_attachment_urls(
         self, submission: dict, request
     ) -> list:
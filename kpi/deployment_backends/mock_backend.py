@@ -5,9 +5,8 @@ import os
 import re
 import time
 import uuid
-from collections import defaultdict
-from datetime import date, datetime
-from typing import Optional, Union
+from datetime import datetime
+from typing import Callable, Optional, Union
 from xml.etree import ElementTree as ET
 try:
     from zoneinfo import ZoneInfo
@@ -78,7 +77,10 @@ class MockDeploymentBackend(BaseDeploymentBackend):
         pass
 
     def bulk_update_submissions(
-        self, data: dict, user: 'auth.User'
+        self,
+        data: dict,
+        user: 'auth.User',
+        progress_callback: Optional[Callable[[int], None]] = None,
     ) -> dict:
         submission_ids = self.validate_access_with_partial_perms(
             user=user,
@@ -134,6 +136,8 @@ class MockDeploymentBackend(BaseDeploymentBackend):
                     'updated_submission': etree.tostring(xml_parsed) # only for testing
                 }
             )
+            if progress_callback:
+                progress_callback(len(kc_responses))
 
         return self.__prepare_bulk_update_response(kc_responses)
 
@@ -205,6 +209,7 @@ class MockDeploymentBackend(BaseDeploymentBackend):
             }
 
         settings.MONGO_DB.instances.delete_one({'_id': submission_id})
+        self.invalidate_submission_cache()
 
         return {
             'content_type': 'application/json',
@@ -254,6 +259,7 @@ class MockDeploymentBackend(BaseDeploymentBackend):
             settings.MONGO_DB.instances.delete_one(
                 {'_id': submission_id}
             )
+        self.invalidate_submission_cache()
 
         return {
             'content_type': 'application/json',
@@ -387,6 +393,22 @@ class MockDeploymentBackend(BaseDeploymentBackend):
             # 'preview_iframe_url': 'https://enke.to/preview/i/::self',
         }
 
+    def get_modified_submission_ids(self, since: datetime) -> list[int]:
+        # Mock submissions cannot be edited, only their validation status can
+        # change
+        return [
+            submission['_id']
+            for submission in settings.MONGO_DB.instances.find(
+                {
+                    MongoHelper.USERFORM_ID: self.mongo_userform_id,
+                    '_validation_status.timestamp': {
+                        '$gte': int(since.timestamp())
+                    },
+                },
+                {'_id': 1},
+            )
+        ]
+
     def get_submission_detail_url(self, submission_id: int) -> str:
         # This doesn't really need to be implemented.
         # We keep it to stay close to `KobocatDeploymentBackend`
@@ -399,17 +421,29 @@ class MockDeploymentBackend(BaseDeploymentBackend):
         )
         return url
 
-    def get_daily_counts(self, user: 'auth.User', timeframe: tuple[date, date]) -> dict:
-        submissions = self.get_submissions(user=self.asset.owner)
-        daily_counts = defaultdict(int)
-        for submission in submissions:
-            submission_date = datetime.strptime(
-                submission['_submission_time'],
-                '%Y-%m-%dT%H:%M:%S'
-            )
-            daily_counts[str(submission_date.date())] += 1
-
-        return daily_counts
+    def get_submission_last_modified(self) -> Optional[str]:
+        # Mock submissions are only modified when they are validated
+        last_validated = settings.MONGO_DB.instances.find_one(
+            {
+                MongoHelper.USERFORM_ID: self.mongo_userform_id,
+                '_validation_status.timestamp': {'$exists': True},
+            },
+            {'_validation_status.timestamp': 1},
+            sort=[('_validation_status.timestamp', -1)],
+        )
+        if not last_validated:
+            return None
+        return str(last_validated['_validation_status']['timestamp'])
+
+    def get_submission_watermark(self) -> str:
+        # Tests alter mock submissions directly in MongoDB too
+        return '{}|{}|{}'.format(
+            settings.MONGO_DB.instances.count_documents(
+                {MongoHelper.USERFORM_ID: self.mongo_userform_id}
+            ),
+            self.get_submission_last_modified(),
+            self.get_submission_cache_generation(),
+        )
 
     def get_submissions(
         self,
@@ -440,14 +474,18 @@ class MockDeploymentBackend(BaseDeploymentBackend):
                                                       format_type=format_type,
                                                       **mongo_query_params)
 
+        estimate_count = params.pop('estimate_count', False)
         mongo_cursor, total_count = MongoHelper.get_instances(
             self.mongo_userform_id, **params)
 
         # Python-only attribute used by `kpi.views.v2.data.DataViewSet.list()`
-        self.current_submission_count = total_count
+        self.current_submission_count = (
+            self.submission_count if estimate_count else total_count
+        )
 
+        key_codec = MongoHelper.get_key_codec(self.mongo_userform_id)
         submissions = [
-            MongoHelper.to_readable_dict(submission)
+            key_codec.to_readable_dict(submission)
             for submission in mongo_cursor
         ]
 
@@ -492,6 +530,8 @@ class MockDeploymentBackend(BaseDeploymentBackend):
             # Do not add `MongoHelper.USERFORM_ID` to original `submissions`
             del submission[MongoHelper.USERFORM_ID]
 
+        self.invalidate_submission_cache()
+
     @property
     def mongo_userform_id(self):
         return f'{self.asset.owner.username}_{self.asset.uid}'
@@ -590,6 +630,7 @@ class MockDeploymentBackend(BaseDeploymentBackend):
             {'_id': submission_id},
             {'$set': {'_validation_status': validation_status}},
         )
+        self.invalidate_submission_cache()
         return {
             'content_type': 'application/json',
             'status': status_code,
@@ -648,6 +689,7 @@ class MockDeploymentBackend(BaseDeploymentBackend):
 
             submission_count += 1
 
+        self.invalidate_submission_cache()
         return {
             'content_type': 'application/json',
             'status': status.HTTP_200_OK,
@@ -0,0 +1,102 @@
+# coding: utf-8
+import timeit
+from copy import deepcopy
+
+from django.core.management.base import BaseCommand
+
+from kpi.utils.mongo_helper import MongoHelper
+
+
+class Command(BaseCommand):
+
+    help = (
+        'Compare the speed of `MongoHelper.to_readable_dict()` and of the '
+        'per-form key codec on synthetic submissions. No database is used.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--submissions',
+            default=1000,
+            type=int,
+            help='Number of submissions to decode per run',
+        )
+        parser.add_argument(
+            '--questions',
+            default=100,
+            type=int,
+            help='Number of questions per submission',
+        )
+        parser.add_argument(
+            '--repeats',
+            default=5,
+            type=int,
+            help='Number of repeat group entries per submission',
+        )
+        parser.add_argument(
+            '--runs',
+            default=5,
+            type=int,
+            help='Number of runs; the best one is reported',
+        )
+
+    def handle(self, *args, **options):
+        submission = self._build_submission(
+            options['questions'], options['repeats']
+        )
+        submissions_count = options['submissions']
+        runs = options['runs']
+
+        def _run(to_readable_dict):
+            # Decoding updates submissions in place, copy them beforehand
+            submissions = [
+                deepcopy(submission) for _ in range(submissions_count)
+            ]
+            start = timeit.default_timer()
+            for submission_ in submissions:
+                to_readable_dict(submission_)
+            return timeit.default_timer() - start
+
+        results = {
+            'MongoHelper.to_readable_dict': min(
+                _run(MongoHelper.to_readable_dict) for _ in range(runs)
+            ),
+            'MongoKeyCodec.to_readable_dict': min(
+                _run(MongoHelper.get_key_codec('benchmark').to_readable_dict)
+                for _ in range(runs)
+            ),
+        }
+
+        reference = results['MongoHelper.to_readable_dict']
+        for label, duration in results.items():
+            self.stdout.write(
+                f'{label}: {duration * 1000:.1f} ms for {submissions_count} '
+                f'submissions (x{reference / duration:.1f})'
+            )
+
+    @staticmethod
+    def _build_submission(questions: int, repeats: int) -> dict:
+        submission = {
+            '_id': 1,
+            '_uuid': 'f9753a6e-abd3-47e3-a218-9ad1adfa2688',
+            '_validation_status': {},
+            '_attachments': [],
+            'meta/instanceID': 'uuid:f9753a6e-abd3-47e3-a218-9ad1adfa2688',
+        }
+        # One question out of ten contains dots and is stored encoded
+        for index in range(questions):
+            if index % 10:
+                submission[f'group/question_{index}'] = str(index)
+            else:
+                key = MongoHelper.encode(f'group/question.{index}')
+                submission[key] = str(index)
+
+        repeat_group = MongoHelper.encode('repeat.group')
+        submission[repeat_group] = [
+            {
+                f'{repeat_group}/{MongoHelper.encode("question.a")}': 'a',
+                f'{repeat_group}/question_b': 'b',
+            }
+            for _ in range(repeats)
+        ]
+        return submission
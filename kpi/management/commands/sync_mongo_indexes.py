@@ -0,0 +1,104 @@
+# coding: utf-8
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from pymongo.errors import OperationFailure
+
+from kpi.utils.mongo_helper import MongoHelper
+
+
+class Command(BaseCommand):
+
+    help = (
+        'Create the MongoDB indexes submission queries rely on.\n'
+        'Optionally, recommend or create per-form indexes for the fields '
+        'submissions are frequently sorted by.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            default=False,
+            help='Only verify required indexes exist; fail if any is missing',
+        )
+        parser.add_argument(
+            '--recommend',
+            action='store_true',
+            default=False,
+            help='List per-form indexes recommended from recorded sorts',
+        )
+        parser.add_argument(
+            '--create-recommended',
+            action='store_true',
+            default=False,
+            help=(
+                'Create per-form indexes recommended from recorded sorts, up '
+                'to `MONGO_QUERY_SHAPE_INDEXES_LIMIT`'
+            ),
+        )
+        parser.add_argument(
+            '--min-count',
+            default=100,
+            type=int,
+            help='Minimum number of sorts to recommend an index',
+        )
+
+    def handle(self, *args, **options):
+        verbosity = options['verbosity']
+        missing_indexes = MongoHelper.get_missing_indexes()
+
+        if options['check']:
+            if missing_indexes:
+                raise CommandError(
+                    'Missing indexes: '
+                    + ', '.join(str(index['keys']) for index in missing_indexes)
+                )
+            if verbosity >= 1:
+                self.stdout.write('All required indexes exist')
+        elif missing_indexes:
+            for name in MongoHelper.create_indexes(missing_indexes):
+                if verbosity >= 1:
+                    self.stdout.write(f'Index `{name}` created')
+        elif verbosity >= 1:
+            self.stdout.write('All required indexes exist')
+
+        if not (options['recommend'] or options['create_recommended']):
+            return
+
+        recommended_indexes = MongoHelper.get_recommended_indexes(
+            options['min_count']
+        )
+        if options['recommend']:
+            for index, count in recommended_indexes:
+                self.stdout.write(
+                    f'{index["partialFilterExpression"]}: '
+                    f'{index["keys"]} ({count} sorts)'
+                )
+
+        if options['create_recommended']:
+            self._create_recommended_indexes(recommended_indexes, verbosity)
+
+    def _create_recommended_indexes(
+        self, recommended_indexes: list[tuple[dict, int]], verbosity: int
+    ):
+        remaining = settings.MONGO_QUERY_SHAPE_INDEXES_LIMIT - len(
+            MongoHelper.get_query_shape_index_names()
+        )
+        for index, count in recommended_indexes:
+            if remaining <= 0:
+                if verbosity >= 1:
+                    self.stdout.write(
+                        'Limit of indexes created from recorded sorts '
+                        'reached. See `MONGO_QUERY_SHAPE_INDEXES_LIMIT`'
+                    )
+                break
+            try:
+                MongoHelper.create_indexes([index])
+            except OperationFailure as e:
+                # e.g. an index with the same keys but another filter exists
+                # and MongoDB < 5.0 does not support it
+                self.stderr.write(f'Index `{index["name"]}` skipped: {e}')
+                continue
+            remaining -= 1
+            if verbosity >= 1:
+                self.stdout.write(f'Index `{index["name"]}` created')
@@ -0,0 +1,33 @@
+# Generated by Django 3.2.15 on 2026-10-18 10:12
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import kpi.fields.kpi_uid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('kpi', '0050_add_indexes_to_import_and_export_tasks'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SubmissionBulkUpdateTask',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.JSONField()),
+                ('messages', models.JSONField(default=dict)),
+                ('status', models.CharField(choices=[('created', 'created'), ('processing', 'processing'), ('error', 'error'), ('complete', 'complete')], default='created', max_length=32)),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+                ('uid', kpi.fields.kpi_uid.KpiUidField(uid_prefix='bu')),
+                ('asset', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='submission_bulk_update_tasks', to='kpi.asset')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
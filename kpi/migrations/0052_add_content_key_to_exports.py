@@ -0,0 +1,93 @@
+# Generated by Django 3.2.15 on 2026-10-18 20:05
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def manually_create_indexes_instructions(apps, schema_editor):
+    print(
+        """
+        !!! ATTENTION !!!
+        You need to run the SQL queries below in PostgreSQL directly:
+
+            > CREATE INDEX CONCURRENTLY "exporttask_content_key_idx" ON "kpi_exporttask" ("content_key");
+            > CREATE INDEX CONCURRENTLY "syncexport_content_key_idx" ON "kpi_synchronousexport" ("content_key");
+
+        Otherwise, looking for an export to reuse will perform very poorly.
+
+        You may run both queries in parallel (within different psql sessions).
+        """
+    )
+
+
+def manually_drop_indexes_instructions(apps, schema_editor):
+    print(
+        """
+        !!! ATTENTION !!!
+        Run the SQL queries below in PostgreSQL directly:
+
+            > DROP INDEX CONCURRENTLY IF EXISTS "exporttask_content_key_idx";
+            > DROP INDEX CONCURRENTLY IF EXISTS "syncexport_content_key_idx";
+
+        You may run both queries in parallel (within different psql sessions).
+        """
+    )
+
+
+def warning_long_run(apps, schema_editor):
+    print(
+        """
+        This might take a while. If it is too slow, you may want to
+        interrupt this migration, cancel any outstanding `CREATE…` or `DROP
+        INDEX` queries on `kpi_exporttask` and `kpi_synchronousexport`,
+        re-run the migration with `SKIP_HEAVY_MIGRATIONS=True`, and then
+        follow the printed instructions to set up the indexes concurrently
+        (without downtime) using raw SQL.
+        """
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kpi', '0051_submissionbulkupdatetask'),
+    ]
+
+    # Exports recorded their content key in `data` before, they are simply
+    # not reused
+    operations = [
+        migrations.AddField(
+            model_name='exporttask',
+            name='content_key',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='synchronousexport',
+            name='content_key',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+    ]
+
+    if not settings.SKIP_HEAVY_MIGRATIONS:
+        operations += [
+            migrations.RunPython(warning_long_run, warning_long_run),
+            migrations.AddIndex(
+                model_name='exporttask',
+                index=models.Index(
+                    fields=['content_key'], name='exporttask_content_key_idx'
+                ),
+            ),
+            migrations.AddIndex(
+                model_name='synchronousexport',
+                index=models.Index(
+                    fields=['content_key'], name='syncexport_content_key_idx'
+                ),
+            ),
+        ]
+    else:
+        operations += [
+            migrations.RunPython(
+                manually_create_indexes_instructions,
+                manually_drop_indexes_instructions,
+            )
+        ]
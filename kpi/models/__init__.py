@@ -11,6 +11,7 @@ from .import_export_task import (
     ExportTask,
     ImportTask,
     ProjectViewExportTask,
+    SubmissionBulkUpdateTask,
     SynchronousExport,
 )
 from .tag_uid import TagUid
@@ -1,15 +1,33 @@
 # coding: utf-8
 import base64
+import csv
 import datetime
 import dateutil.parser
+import gzip
+import io
+import json
 import os
 import posixpath
 import re
+import shutil
 import tempfile
+import time
+import zipfile
 from collections import defaultdict
+from contextlib import contextmanager, nullcontext
 from io import BytesIO
+from itertools import islice
 from os.path import split, splitext
-from typing import List, Dict, Optional, Tuple, Generator
+from typing import (
+    Callable,
+    List,
+    Dict,
+    Iterable,
+    Optional,
+    Tuple,
+    Generator,
+    Iterator,
+)
 try:
     from zoneinfo import ZoneInfo
 except ImportError:
@@ -19,6 +37,7 @@ import constance
 import requests
 from django.conf import settings
 from django.contrib.postgres.indexes import BTreeIndex, HashIndex
+from django.core.cache import cache
 from django.core.files.storage import FileSystemStorage
 from django.db import models, transaction
 from django.db.models import F
@@ -38,13 +57,14 @@ from formpack.schema.fields import (
 from formpack.utils.kobo_locking import get_kobo_locking_profiles
 from formpack.utils.string import ellipsize
 from private_storage.fields import PrivateFileField
+from pymongo.errors import PyMongoError
 from rest_framework import exceptions
 from werkzeug.http import parse_options_header
 from openpyxl.utils.exceptions import InvalidFileException
 from pyxform.xls2json_backends import xls_to_dict, xlsx_to_dict
 
 from kobo.apps.reports.report_data import build_formpack
-from kobo.apps.subsequences.utils import stream_with_extras
+from kobo.apps.subsequences.utils import stream_with_batched_extras
 from kpi.constants import (
     ASSET_TYPE_COLLECTION,
     ASSET_TYPE_EMPTY,
@@ -58,6 +78,7 @@ from kpi.exceptions import XlsFormatException
 from kpi.fields import KpiUidField
 from kpi.models import Asset
 from kpi.utils.log import logging
+from kpi.utils.mongo_helper import MongoHelper
 from kpi.utils.models import (
     _load_library_content,
     create_assets,
@@ -69,8 +90,21 @@ from kpi.utils.rename_xls_sheet import (
     NoFromSheetError,
     ConflictSheetError,
 )
+from kpi.utils.export_task import (
+    COMPRESSIBLE_EXPORT_TYPES,
+    EXPORT_SETTING_COMPRESSION,
+    EXPORT_SETTING_INCREMENTAL,
+    EXPORT_SETTING_INCREMENTAL_MERGE,
+    VALID_EXPORT_TYPES,
+    WriteOnlyFile,
+    dumps_export_chunk,
+    loads_export_chunk,
+)
+from kpi.utils.hash import calculate_hash
+from kpi.utils.parquet_export import ParquetExportWriter
 from kpi.utils.project_view_exports import create_project_view_export
 from kpi.utils.strings import to_str
+from kpi.utils.xlsx_export import XlsxExportWriter
 from kpi.zip_importer import HttpContentParse
 
 
@@ -133,6 +167,13 @@ class ImportExportTask(models.Model):
             self.status = self.PROCESSING
             self.save(update_fields=['status'])
 
+        return self._run_and_record()
+
+    def _run_and_record(self):
+        """
+        Call `_run_task()` and record its outcome (status and messages) on the
+        task, which must be processing
+        """
         msgs = defaultdict(list)
         try:
             # This method must be implemented by a subclass
@@ -142,6 +183,10 @@ class ImportExportTask(models.Model):
             msgs['error_type'] = t('Cannot access data')
             msgs['error'] = str(e)
             self.status = self.ERROR
+        except ExportTaskBase.Cancelled as e:
+            msgs['error_type'] = t('Cancelled')
+            msgs['error'] = str(e)
+            self.status = self.ERROR
         # TODO: continue to make more specific exceptions as above until this
         # catch-all can be removed entirely
         except Exception as err:
@@ -483,6 +528,7 @@ class ProjectViewExportTask(ImportExportTask):
         time = datetime.datetime.now().strftime('%Y-%m-%dT%H:%M:%SZ')
         return f'{export_type}-{username}-view_{view}-{time}.csv'
 
+    @MongoHelper.analytics_workload()
     def _run_task(self, messages: list) -> None:
         export_type = self.data['type']
         view = self.data['view']
@@ -506,11 +552,45 @@ class ProjectViewExportTask(ImportExportTask):
         super().delete(*args, **kwargs)
 
 
+class SubmissionBulkUpdateTask(ImportExportTask):
+    """
+    A bulk update of submissions too large to run within a request. `data`
+    contains the validated `payload` of the bulk update, the number of
+    submissions it targets (`count`) and processed so far (`processed`) and,
+    once complete, its `result`
+    """
+
+    # Save progress once per this number of processed submissions
+    PROGRESS_STEP = 50
+
+    uid = KpiUidField(uid_prefix='bu')
+    asset = models.ForeignKey(
+        'kpi.Asset',
+        related_name='submission_bulk_update_tasks',
+        on_delete=models.CASCADE,
+    )
+
+    def _run_task(self, messages: list) -> None:
+        self.data['processed'] = 0
+
+        def _update_progress(processed: int):
+            if processed - self.data['processed'] < self.PROGRESS_STEP:
+                return
+            self.data['processed'] = processed
+            self.save(update_fields=['data'])
+
+        response = self.asset.deployment.bulk_update_submissions(
+            self.data['payload'], self.user, progress_callback=_update_progress
+        )
+        self.data['processed'] = response['data']['count']
+        self.data['result'] = response['data']
+
+
 class ExportTaskBase(ImportExportTask):
     """
     An (asynchronous) submission data export job. The instantiator must set the
     `data` attribute to a dictionary with the following keys:
-    * `type`: required; `xls`, `csv`, or `spss_labels`
+    * `type`: required; `xls`, `csv`, `geojson`, `parquet` or `spss_labels`
     * `source`: required; URL of a deployed `Asset`
     * `lang`: optional; the name of the translation to be used for headers and
               response values. Specify `_xml` to use question and choice names
@@ -540,11 +620,23 @@ class ExportTaskBase(ImportExportTask):
              | 123                             |
 
         The default is `['hxl']`
+    * `incremental`: optional; when `true`, only export the submissions
+        received or modified (edited, validated) since the previous successful
+        export of the same user with the same settings. Defaults to `False`
+    * `incremental_merge`: optional, CSV only; when `true` with `incremental`,
+        merge these submissions into the file of the previous export to produce
+        a full export. Defaults to `False`
+    * `compression`: optional, CSV and GeoJSON only; `gzip` or `zip` to
+        compress the file of the export as it is written. Not compressed by
+        default
     """
 
     uid = KpiUidField(uid_prefix='e')
     last_submission_time = models.DateTimeField(null=True)
     result = PrivateFileField(upload_to=export_upload_to, max_length=380)
+    # Hash of the content of the export (see `_get_content_key()`), empty if
+    # its result may not be found by it (see `_is_content_keyed()`)
+    content_key = models.CharField(max_length=64, blank=True, default='')
 
     COPY_FIELDS = (
         IdCopyField,
@@ -570,6 +662,42 @@ class ExportTaskBase(ImportExportTask):
     }
 
     TIMESTAMP_KEY = '_submission_time'
+    # Settings which do not change the content of an export, ignored when
+    # looking for the previous export of an incremental one
+    INCREMENTAL_IGNORED_SETTINGS = (
+        'name',
+        'processing_time_seconds',
+        'last_submission_id',
+        'incremental_since',
+        'shards',
+        'content_key',
+        'reused_export',
+        'progress',
+        'cancel_requested',
+        EXPORT_SETTING_INCREMENTAL,
+        EXPORT_SETTING_INCREMENTAL_MERGE,
+    )
+    # Default values of the settings which change the content of an export,
+    # for exports to have the same content key whether they are set or not
+    # (see `_get_content_key()`)
+    CONTENT_KEY_DEFAULT_SETTINGS = {
+        'fields': [],
+        'fields_from_all_versions': True,
+        'flatten': True,
+        'group_sep': '/',
+        'hierarchy_in_labels': False,
+        'include_media_url': False,
+        'lang': None,
+        'multiple_select': 'both',
+        'query': {},
+        'submission_ids': [],
+        'tag_cols_for_header': ['hxl'],
+        EXPORT_SETTING_COMPRESSION: None,
+        'xls_types_as_text': True,
+    }
+    # Format of the lines generated by `formpack.reporting.Export.to_csv()`
+    CSV_SEPARATOR = ';'
+    CSV_QUOTE = '"'
     # Above 244 seems to cause 'Download error' in Chrome 64/Linux
     MAXIMUM_FILENAME_LENGTH = 240
 
@@ -577,6 +705,16 @@ class ExportTaskBase(ImportExportTask):
         def __str__(self):
             return t('This data does not exist or you do not have access to it')
 
+    class Cancelled(Exception):
+        def __str__(self):
+            return t('The export was cancelled')
+
+    # Whether exports record their progress (see `_track_progress()`), i.e.
+    # whether users can follow them
+    TRACKS_PROGRESS = False
+    # Number of bytes of the export written so far, see `_track_progress()`
+    _bytes_written = 0
+
     class Meta:
         abstract = True
         ordering = ['-date_created']
@@ -587,6 +725,9 @@ class ExportTaskBase(ImportExportTask):
             HashIndex(
                 F('data__source'), name='data__source_hash_idx'
             ),
+            models.Index(
+                fields=['content_key'], name='exporttask_content_key_idx'
+            ),
         ]
 
     def _build_export_filename(self, export, export_type):
@@ -602,9 +743,18 @@ class ExportTaskBase(ImportExportTask):
             extension = 'xlsx'
         elif export_type == 'spss_labels':
             extension = 'zip'
+        elif export_type == 'parquet':
+            # Repeat groups are written to separate files
+            extension = ParquetExportWriter.get_extension(export)
         else:
             extension = export_type
 
+        compression = self._get_compression()
+        if compression == 'gzip':
+            extension += '.gz'
+        elif compression == 'zip':
+            extension += '.zip'
+
         if export_type == 'spss_labels':
             lang = 'SPSS Labels'
         elif export.lang == formpack.constants.UNTRANSLATED:
@@ -672,6 +822,33 @@ class ExportTaskBase(ImportExportTask):
             'include_media_url': include_media_url,
         }
 
+    @staticmethod
+    def _copy_by_chunks(local_file, output_file):
+        """
+        Copy the export written to `local_file` to `output_file`, a file of
+        the storage, by chunks of `settings.EXPORT_UPLOAD_CHUNK_SIZE` bytes,
+        and return the number of bytes copied. Memory usage does not depend on
+        the size of the export: S3 uploads the chunks as the parts of a
+        multipart upload
+        """
+        local_file.seek(0)
+        shutil.copyfileobj(
+            local_file, output_file, settings.EXPORT_UPLOAD_CHUNK_SIZE
+        )
+        return local_file.tell()
+
+    def _delete_result(self):
+        """
+        Delete the file of the export, unless other exports reuse it (see
+        `_get_reusable_export()`), and clear `self.result`
+        """
+        if not self.result:
+            return
+        if self._is_file_shared(self.result.name):
+            self.result = None
+            return
+        self.result.delete(save=False)
+
     @property
     def _fields_from_all_versions(self) -> bool:
         fields_from_versions = self.data.get('fields_from_all_versions', True)
@@ -680,6 +857,98 @@ class ExportTaskBase(ImportExportTask):
             return fields_from_versions.lower() == 'true'
         return fields_from_versions
 
+    @classmethod
+    def _get_comparable_settings(cls, data: dict) -> dict:
+        return {
+            key: value
+            for key, value in data.items()
+            if key not in cls.INCREMENTAL_IGNORED_SETTINGS
+        }
+
+    def _get_content_key(self, source: Asset) -> str:
+        """
+        Return a hash of everything the content of the export depends on: the
+        deployed versions of `source`, the settings of the export, the
+        submissions the user is allowed to see and the state of these
+        submissions. Exports with the same key have the same content, whoever
+        requested them
+        """
+        export_settings = {
+            **self.CONTENT_KEY_DEFAULT_SETTINGS,
+            **self._get_comparable_settings(self.data),
+            'fields_from_all_versions': self._fields_from_all_versions,
+            'hierarchy_in_labels': self._hierarchy_in_labels,
+            'type': self._get_export_type(),
+        }
+        # The URL of the source may be absolute or not
+        export_settings.pop('source', None)
+        versions = source.deployed_versions.values_list('uid', flat=True)
+        if not self._fields_from_all_versions:
+            versions = versions[:1]
+
+        content = {
+            'asset': source.uid,
+            'versions': list(versions),
+            'settings': export_settings,
+            'permission_filters': source.get_filters_for_partial_perm(
+                self.user.pk, perm=PERM_VIEW_SUBMISSIONS
+            ),
+            'watermark': source.deployment.get_submission_watermark(),
+        }
+        return calculate_hash(
+            json.dumps(content, sort_keys=True, default=str),
+            algorithm='sha256',
+        )
+
+    def _get_compression(self) -> Optional[str]:
+        """
+        Return the compression of the file of the export, if any. Only text
+        exports are compressed, other types are ignored
+        """
+        try:
+            export_type = self._get_export_type()
+        except NotImplementedError:
+            return None
+        if export_type not in COMPRESSIBLE_EXPORT_TYPES:
+            return None
+        return self.data.get(EXPORT_SETTING_COMPRESSION)
+
+    def _get_csv_reader(self, binary_file) -> Iterator[list]:
+        return csv.reader(
+            io.TextIOWrapper(binary_file, encoding='utf-8', newline=''),
+            delimiter=self.CSV_SEPARATOR,
+            quotechar=self.CSV_QUOTE,
+        )
+
+    def _get_exported_submission_ids(self) -> set:
+        """
+        Return the ids of all the submissions the settings of the export
+        match, regardless of `incremental`
+        """
+        source = resolve_url_to_asset(self.data['source'])
+        return {
+            submission['_id']
+            for submission in source.deployment.get_submissions(
+                user=self.user,
+                fields=['_id'],
+                submission_ids=self.data.get('submission_ids', []),
+                query=self.data.get('query', {}),
+            )
+        }
+
+    def _get_export_type(self) -> str:
+        export_type = self.data.get('type', '').lower()
+        if export_type == 'xlsx':
+            # Excel exports are always returned in XLSX format, but they're
+            # referred to internally as `xls`
+            export_type = 'xls'
+        if export_type not in VALID_EXPORT_TYPES:
+            raise NotImplementedError(
+                'only `xls`, `csv`, `geojson`, `parquet`, and `spss_labels` '
+                'are valid export types'
+            )
+        return export_type
+
     @staticmethod
     def _get_fields_and_groups(fields: List[str]) -> List[str]:
         """
@@ -709,6 +978,149 @@ class ExportTaskBase(ImportExportTask):
         fields += list(field_groups) + additional_fields
         return fields
 
+    def _get_incremental_query(self, source: Asset, query: dict) -> dict:
+        """
+        Narrow down `query` to the submissions received or modified since the
+        previous export with the same settings, and record in `self.data` the
+        watermark it is based on. `query` is returned unchanged if there is no
+        previous export to start from
+        """
+        previous_export = self._get_previous_export(
+            full=self._incremental_merge
+        )
+        if (
+            previous_export is None
+            or previous_export.data.get('last_submission_id') is None
+        ):
+            return query
+
+        last_submission_id = previous_export.data['last_submission_id']
+        modified_submission_ids = source.deployment.get_modified_submission_ids(
+            previous_export.date_created
+        )
+        self.data['incremental_since'] = {
+            'export': previous_export.uid,
+            'date_created': previous_export.date_created.isoformat(),
+            'last_submission_id': last_submission_id,
+        }
+        # Carry the watermark over, in case nothing has changed since
+        self.data['last_submission_id'] = last_submission_id
+        self.last_submission_time = previous_export.last_submission_time
+
+        incremental_query = {
+            MongoHelper.OR_OPERATOR: [
+                {'_id': {'$gt': last_submission_id}},
+                {'_id': {MongoHelper.IN_OPERATOR: modified_submission_ids}},
+            ]
+        }
+        if not query:
+            return incremental_query
+        return {MongoHelper.AND_OPERATOR: [query, incremental_query]}
+
+    def _get_previous_export(
+        self, full: bool = False
+    ) -> Optional['ExportTaskBase']:
+        """
+        Return the most recent successful export of the same source by the
+        same user with the same settings, if any. With `full`, it must also
+        contain all the submissions, i.e. not only those of an incremental
+        export
+        """
+        comparable_settings = self._get_comparable_settings(self.data)
+        previous_exports = (
+            self._meta.model.objects.filter(
+                user=self.user,
+                status=self.COMPLETE,
+                data__source=self.data.get('source'),
+            )
+            .exclude(pk=self.pk)
+            .order_by('-date_created')
+        )
+        for previous_export in previous_exports:
+            if (
+                self._get_comparable_settings(previous_export.data)
+                != comparable_settings
+            ):
+                continue
+            if (
+                full
+                and 'incremental_since' in previous_export.data
+                and not previous_export._incremental_merge
+            ):
+                return None
+            return previous_export
+
+        return None
+
+    def _get_reusable_export(self) -> Optional['ExportTaskBase']:
+        """
+        Return the most recent complete export, of any user, whose content is
+        the same as the content of this export would be, if any. The content
+        key of this export is recorded in `self.content_key` if its result
+        may be found by it (see `_is_content_keyed()`). Incremental exports
+        depend on previous exports and are never reused
+        """
+        self.content_key = ''
+        if self._incremental:
+            return None
+
+        try:
+            source = resolve_url_to_asset(self.data['source'])
+        except (KeyError, Asset.DoesNotExist):
+            # The error is raised when the export runs
+            return None
+        source_perms = source.get_perms(self.user)
+        if (
+            PERM_VIEW_SUBMISSIONS not in source_perms
+            and PERM_PARTIAL_SUBMISSIONS not in source_perms
+        ) or not source.has_deployment:
+            return None
+
+        content_key = self._get_content_key(source)
+        if self._is_content_keyed():
+            self.content_key = content_key
+        if not settings.EXPORT_REUSE_ENABLED:
+            return None
+
+        reusable_exports = []
+        for model in (ExportTask, SynchronousExport):
+            exports = model.objects.filter(
+                status=self.COMPLETE,
+                content_key=content_key,
+            ).exclude(result='')
+            if isinstance(self, model) and self.pk:
+                exports = exports.exclude(pk=self.pk)
+            export = exports.order_by('-date_created').first()
+            if export is not None:
+                reusable_exports.append(export)
+
+        for export in sorted(
+            reusable_exports,
+            key=lambda export_: export_.date_created,
+            reverse=True,
+        ):
+            if export.result.storage.exists(export.result.name):
+                return export
+
+        return None
+
+    def _has_same_csv_header(
+        self, previous_export: 'ExportTaskBase', header_lines: list
+    ) -> bool:
+        """
+        Return whether the CSV file of `previous_export` starts with
+        `header_lines` and can thus be merged with the current export
+        """
+        header_rows = [self._parse_csv_line(line) for line in header_lines]
+        if not header_rows or '_id' not in header_rows[0]:
+            return False
+        try:
+            with previous_export._open_result() as f:
+                reader = self._get_csv_reader(f)
+                return all(next(reader, None) == row for row in header_rows)
+        except (OSError, zipfile.BadZipFile):
+            return False
+
     @property
     def _hierarchy_in_labels(self) -> bool:
         hierarchy_in_labels = self.data.get('hierarchy_in_labels', False)
@@ -717,14 +1129,145 @@ class ExportTaskBase(ImportExportTask):
             return hierarchy_in_labels.lower() == 'true'
         return hierarchy_in_labels
 
+    def _is_content_keyed(self) -> bool:
+        """
+        Return whether the result of this export may be found by its content
+        key, i.e. reused by other exports (see `_get_reusable_export()`)
+        """
+        return settings.EXPORT_REUSE_ENABLED
+
+    def _get_workload(self):
+        """
+        Return the context to read the submissions of this export within.
+        The content key of an export is built from the state of the
+        submissions on the primary: an export which records it is read from
+        the primary too, to not save the data of a lagging secondary under a
+        current key. Others are read like any heavy workload (see
+        `MongoHelper.analytics_workload()`)
+        """
+        if self.content_key:
+            return nullcontext()
+        return MongoHelper.analytics_workload()
+
+    def _is_file_shared(self, name: str) -> bool:
+        """
+        Return whether other exports use the file `name` as their result
+        """
+        for model in (ExportTask, SynchronousExport):
+            other_exports = model.objects.filter(result=name)
+            if isinstance(self, model):
+                other_exports = other_exports.exclude(pk=self.pk)
+            if other_exports.exists():
+                return True
+        return False
+
+    @property
+    def _incremental(self) -> bool:
+        return bool(self.data.get(EXPORT_SETTING_INCREMENTAL, False))
+
+    @property
+    def _incremental_merge(self) -> bool:
+        # Only CSV files can be merged
+        return (
+            self._incremental
+            and self.data.get('type', '').lower() == 'csv'
+            and bool(self.data.get(EXPORT_SETTING_INCREMENTAL_MERGE, False))
+        )
+
+    def _merge_csv_export(
+        self,
+        previous_export: 'ExportTaskBase',
+        header_lines: list,
+        lines: Iterator[str],
+    ) -> Generator[str, None, None]:
+        """
+        Yield the lines of a full CSV export: the lines of `previous_export`
+        for the submissions which are still exported and were not modified
+        since, then `lines`, the CSV export of the submissions received or
+        modified since.
+        `lines` are buffered in a temporary file to know which submissions
+        they contain, whatever their number.
+        """
+        id_index = self._parse_csv_line(header_lines[0]).index('_id')
+        modified_submission_ids = set()
+        with tempfile.TemporaryFile(mode='w+', encoding='utf-8') as delta_file:
+            for line in islice(lines, len(header_lines), None):
+                modified_submission_ids.add(
+                    self._parse_csv_line(line)[id_index]
+                )
+                # Lines may contain line breaks
+                delta_file.write(json.dumps(line) + '\n')
+
+            exported_submission_ids = {
+                str(submission_id)
+                for submission_id in self._get_exported_submission_ids()
+            }
+
+            yield from header_lines
+            with previous_export._open_result() as f:
+                reader = self._get_csv_reader(f)
+                for row in islice(reader, len(header_lines), None):
+                    submission_id = row[id_index]
+                    if (
+                        submission_id in exported_submission_ids
+                        and submission_id not in modified_submission_ids
+                    ):
+                        yield self._format_csv_line(row)
+
+            delta_file.seek(0)
+            for line in delta_file:
+                yield json.loads(line)
+
+    def _format_csv_line(self, values: Iterable) -> str:
+        """
+        Format `values` like the lines of `formpack.reporting.Export.to_csv()`
+        """
+        return self.CSV_SEPARATOR.join(
+            self.CSV_QUOTE
+            + ('' if value is None else str(value)).replace(
+                self.CSV_QUOTE, self.CSV_QUOTE * 2
+            )
+            + self.CSV_QUOTE
+            for value in values
+        )
+
+    def _get_csv_lines(
+        self, export: formpack.reporting.Export, chunks: Iterable[dict]
+    ) -> Generator[str, None, None]:
+        """
+        Yield the lines of the CSV export of `chunks`, rows already formatted
+        by `export.parse_submissions()`. Like `export.to_csv()`, only the
+        rows of the main section are exported
+        """
+        main_section = next(iter(export.sections))
+        yield from export.to_csv([])
+        for chunk in chunks:
+            for row in chunk.get(main_section, []):
+                yield self._format_csv_line(row)
+
+    def _parse_csv_line(self, line: str) -> list:
+        return next(
+            csv.reader(
+                [line], delimiter=self.CSV_SEPARATOR, quotechar=self.CSV_QUOTE
+            )
+        )
+
     def _record_last_submission_time(self, submission_stream):
         """
         Internal generator that yields each submission in the given
         `submission_stream` while recording the most recent submission
-        timestamp in `self.last_submission_time`
+        timestamp in `self.last_submission_time`, and the highest submission
+        id in `self.data['last_submission_id']` (the watermark of incremental
+        exports)
         """
         # FIXME: Mongo has only per-second resolution. Brutal.
         for submission in submission_stream:
+            submission_id = submission.get('_id')
+            if isinstance(submission_id, int) and (
+                self.data.get('last_submission_id') is None
+                or submission_id > self.data['last_submission_id']
+            ):
+                self.data['last_submission_id'] = submission_id
             try:
                 timestamp = submission[self.TIMESTAMP_KEY]
             except KeyError:
@@ -741,62 +1284,231 @@ class ExportTaskBase(ImportExportTask):
                     self.last_submission_time = timestamp
             yield submission
 
+    @contextmanager
+    def _open_compressed(self, output_file, filename: str):
+        """
+        Yield a file which compresses what is written to it into
+        `output_file`, a file of the storage named `filename`, according to
+        the compression of the export
+        """
+        compression = self._get_compression()
+        # Name of the uncompressed file, without `.gz` or `.zip`
+        filename = splitext(filename)[0]
+        if compression == 'gzip':
+            with gzip.GzipFile(
+                filename=filename, mode='wb', fileobj=output_file
+            ) as gzip_file:
+                yield gzip_file
+        elif compression == 'zip':
+            with zipfile.ZipFile(
+                WriteOnlyFile(output_file), 'w', zipfile.ZIP_DEFLATED
+            ) as zip_:
+                # The size of the member is unknown until it is written
+                with zip_.open(filename, 'w', force_zip64=True) as member:
+                    yield member
+        else:
+            yield output_file
+
+    @contextmanager
+    def _open_result(self):
+        """
+        Yield the file of the export opened for reading, decompressed
+        """
+        with self.result.open('rb') as f:
+            compression = self._get_compression()
+            if compression == 'gzip':
+                with gzip.GzipFile(mode='rb', fileobj=f) as gzip_file:
+                    yield gzip_file
+            elif compression == 'zip':
+                with zipfile.ZipFile(f) as zip_:
+                    with zip_.open(zip_.namelist()[0]) as member:
+                        yield member
+            else:
+                yield f
+
+    def _record_progress(self, **values) -> bool:
+        """
+        Save `values` (`processed`, `total` and `bytes_written`) into
+        `self.data['progress']`, along with the time of the update, which
+        tells a slow export from a dead one (see
+        `log_and_mark_stuck_as_errored()`). Return whether the export was
+        cancelled meanwhile (see `cancel()`)
+        """
+        values['date_modified'] = utcnow().isoformat()
+        self.data.setdefault('progress', {}).update(values)
+        if not self.pk:
+            return False
+
+        # Only `progress` is updated: the rest of `data` may be changed
+        # concurrently by `cancel()`
+        with transaction.atomic():
+            data = (
+                self._meta.model.objects.select_for_update()
+                .values_list('data', flat=True)
+                .get(pk=self.pk)
+            )
+            data.setdefault('progress', {}).update(values)
+            self._meta.model.objects.filter(pk=self.pk).update(data=data)
+
+        if data.get('cancel_requested'):
+            self.data['cancel_requested'] = True
+            return True
+        return False
+
+    def _track_progress(
+        self,
+        submission_stream: Iterator,
+        count_total: Callable[[], Optional[int]],
+    ) -> Generator:
+        """
+        Internal generator that yields each submission in the given
+        `submission_stream` while recording the progress of the export every
+        `settings.EXPORT_PROGRESS_INTERVAL` seconds. Raises `Cancelled` as soon
+        as the export is cancelled, which stops the export promptly.
+
+        The estimated total is only counted, with `count_total()`, once the
+        export has lasted `settings.EXPORT_PROGRESS_INTERVAL` seconds: short
+        exports do not pay for it
+        """
+        processed = 0
+        if self._record_progress(
+            processed=processed, total=None, bytes_written=0
+        ):
+            raise self.Cancelled
+        last_update = time.monotonic()
+        total_counted = False
+
+        for submission in submission_stream:
+            yield submission
+            processed += 1
+            if (
+                time.monotonic() - last_update
+                >= settings.EXPORT_PROGRESS_INTERVAL
+            ):
+                progress = {
+                    'processed': processed,
+                    'bytes_written': self._bytes_written,
+                }
+                if not total_counted:
+                    progress['total'] = count_total()
+                    total_counted = True
+                if self._record_progress(**progress):
+                    raise self.Cancelled
+                last_update = time.monotonic()
+
+        self._record_progress(
+            processed=processed,
+            total=processed,
+            bytes_written=self._bytes_written,
+        )
+
+    def _reuse_export(self, export: 'ExportTaskBase'):
+        """
+        Use the file of `export`, which has the same content key, as the
+        result of this export
+        """
+        self.result = export.result.name
+        self.last_submission_time = export.last_submission_time
+        self.data['last_submission_id'] = export.data.get('last_submission_id')
+        self.data['reused_export'] = export.uid
+
+        if not self.pk:
+            self.save()
+        else:
+            self.save(
+                update_fields=['result', 'last_submission_time', 'content_key']
+            )
+
     def _run_task(self, messages):
         """
         Generate the export and store the result in the `self.result`
         `PrivateFileField`. Should be called by the `run()` method of the
         superclass. The `submission_stream` method is provided for testing
         """
-        source_url = self.data.get('source', False)
-        flatten = self.data.get('flatten', True)
-        export_type = self.data.get('type', '').lower()
-        if export_type == 'xlsx':
-            # Excel exports are always returned in XLSX format, but they're
-            # referred to internally as `xls`
-            export_type = 'xls'
-        if export_type not in ('xls', 'csv', 'geojson', 'spss_labels'):
-            raise NotImplementedError(
-                'only `xls`, `csv`, `geojson`, and `spss_labels` '
-                'are valid export types'
-            )
+        self.data.pop('reused_export', None)
+        reusable_export = self._get_reusable_export()
+        if reusable_export is not None:
+            self._reuse_export(reusable_export)
+            return
+
+        with self._get_workload():
+            self._generate_export(messages)
 
+    def _generate_export(self, messages):
+        export_type = self._get_export_type()
         export, submission_stream = self.get_export_object()
+        previous_export = None
+        header_lines = None
+        if (
+            export_type == 'csv'
+            and self._incremental_merge
+            and 'incremental_since' in self.data
+        ):
+            header_lines = list(export.to_csv([]))
+            previous_export = self._meta.model.objects.filter(
+                uid=self.data['incremental_since']['export']
+            ).first()
+            if previous_export is None or not self._has_same_csv_header(
+                previous_export, header_lines
+            ):
+                # The form has changed since the previous export (or its file
+                # is gone), everything is exported
+                previous_export = None
+                export, submission_stream = self.get_export_object(
+                    incremental=False
+                )
+
+        self._write_export(
+            export, submission_stream, messages, previous_export, header_lines
+        )
+
+    def _write_export(
+        self,
+        export: formpack.reporting.Export,
+        submission_stream: Iterator,
+        messages: dict,
+        previous_export: Optional['ExportTaskBase'] = None,
+        header_lines: Optional[list] = None,
+        chunks: Optional[Iterable[dict]] = None,
+    ):
+        """
+        Write the export of `submission_stream` to the storage and save it as
+        `self.result`. `previous_export` and its `header_lines` are only
+        passed to merge an incremental CSV export. `chunks`, rows already
+        formatted by `export.parse_submissions()`, are written instead of
+        `submission_stream` if passed (see `_write_export_file()`)
+        """
+        export_type = self._get_export_type()
         filename = self._build_export_filename(export, export_type)
         absolute_filepath = self.get_absolute_filepath(filename)
 
-        with self.result.storage.open(absolute_filepath, 'wb') as output_file:
-            if export_type == 'csv':
-                for line in export.to_csv(submission_stream):
-                    output_file.write((line + "\r\n").encode('utf-8'))
-            elif export_type == 'geojson':
-                for line in export.to_geojson(
-                    submission_stream, flatten=flatten
-                ):
-                    output_file.write(line.encode('utf-8'))
-            elif export_type == 'xls':
-                # XLSX export actually requires a filename (limitation of
-                # pyexcelerate?)
-                with tempfile.NamedTemporaryFile(
-                        prefix='export_xlsx', mode='rb'
-                ) as xlsx_output_file:
-                    export.to_xlsx(xlsx_output_file.name, submission_stream)
-                    # TODO: chunk again once
-                    # https://github.com/jschneier/django-storages/issues/449
-                    # is fixed
-                    # TODO: Check if monkey-patch (line 57) can restore writing
-                    # by chunk
-                    """
-                    while True:
-                        chunk = xlsx_output_file.read(5 * 1024 * 1024)
-                        if chunk:
-                            output_file.write(chunk)
-                        else:
-                            break
-                    """
-                    output_file.write(xlsx_output_file.read())
-            elif export_type == 'spss_labels':
-                export.to_spss_labels(output_file)
-
+        self._bytes_written = 0
+        try:
+            with self.result.storage.open(
+                absolute_filepath, 'wb'
+            ) as output_file, self._open_compressed(
+                output_file, posixpath.basename(absolute_filepath)
+            ) as export_file:
+                self._write_export_file(
+                    export,
+                    export_type,
+                    submission_stream,
+                    export_file,
+                    messages,
+                    previous_export,
+                    header_lines,
+                    chunks,
+                )
+        except Exception:
+            # Do not leave a partial file behind, e.g. if the export was
+            # cancelled
+            self.result.storage.delete(absolute_filepath)
+            raise
+
+        if self.TRACKS_PROGRESS:
+            self.data.setdefault('progress', {})[
+                'bytes_written'
+            ] = self._bytes_written
         self.result = absolute_filepath
 
         if not self.pk:
@@ -804,18 +1516,150 @@ class ExportTaskBase(ImportExportTask):
             # method, thus we cannot update only specific fields.
             self.save()
         else:
-            self.save(update_fields=['result', 'last_submission_time'])
+            self.save(
+                update_fields=['result', 'last_submission_time', 'content_key']
+            )
+
+    def _write_export_file(
+        self,
+        export: formpack.reporting.Export,
+        export_type: str,
+        submission_stream: Iterator,
+        output_file,
+        messages: dict,
+        previous_export: Optional['ExportTaskBase'] = None,
+        header_lines: Optional[list] = None,
+        chunks: Optional[Iterable[dict]] = None,
+    ):
+        """
+        Write the export of `submission_stream` to `output_file`, a file of
+        the storage, counting the bytes written in `self._bytes_written`.
+
+        If `chunks` are passed, they are written instead of
+        `submission_stream`: rows already formatted by
+        `export.parse_submissions()`, e.g. by the shards of an export. Only
+        CSV, XLSX and Parquet exports can be written from `chunks`
+        """
+        flatten = self.data.get('flatten', True)
+        if chunks is not None and export_type not in ('csv', 'xls', 'parquet'):
+            raise NotImplementedError(
+                f'{export_type} exports cannot be written from chunks'
+            )
+
+        if export_type == 'csv':
+            if chunks is not None:
+                lines = self._get_csv_lines(export, chunks)
+            else:
+                lines = export.to_csv(submission_stream)
+            if previous_export is not None:
+                lines = self._merge_csv_export(
+                    previous_export, header_lines, lines
+                )
+            for line in lines:
+                encoded_line = (line + "\r\n").encode('utf-8')
+                output_file.write(encoded_line)
+                self._bytes_written += len(encoded_line)
+        elif export_type == 'geojson':
+            for line in export.to_geojson(submission_stream, flatten=flatten):
+                encoded_line = line.encode('utf-8')
+                output_file.write(encoded_line)
+                self._bytes_written += len(encoded_line)
+        elif export_type == 'xls':
+            # XLSX export actually requires a filename (limitation of
+            # pyexcelerate?)
+            with tempfile.NamedTemporaryFile(
+                    prefix='export_xlsx', mode='rb'
+            ) as xlsx_output_file:
+                if chunks is not None:
+                    XlsxExportWriter(export).write(
+                        chunks, xlsx_output_file.name
+                    )
+                else:
+                    export.to_xlsx(xlsx_output_file.name, submission_stream)
+                self._bytes_written = self._copy_by_chunks(
+                    xlsx_output_file, output_file
+                )
+        elif export_type == 'spss_labels':
+            # ZIP archives are written to a local file first: headers are
+            # rewritten after each member, which is not possible once the
+            # beginning of the file is uploaded to a remote storage
+            with tempfile.TemporaryFile(
+                prefix='export_spss_labels'
+            ) as zip_output_file:
+                export.to_spss_labels(zip_output_file)
+                self._bytes_written = self._copy_by_chunks(
+                    zip_output_file, output_file
+                )
+        elif export_type == 'parquet':
+            writer = ParquetExportWriter(
+                export, settings.EXPORT_PARQUET_ROW_GROUP_SIZE
+            )
+            # Repeat groups are zipped, see `spss_labels` above
+            with tempfile.TemporaryFile(
+                prefix='export_parquet'
+            ) as parquet_output_file:
+                if chunks is not None:
+                    writer.write_chunks(chunks, parquet_output_file)
+                else:
+                    writer.write(submission_stream, parquet_output_file)
+                self._bytes_written = self._copy_by_chunks(
+                    parquet_output_file, output_file
+                )
+            for column, count in writer.invalid_values.items():
+                messages['warnings'].append(
+                    t(
+                        '{count} value(s) of `{column}` did not match the '
+                        'type of the question and were left empty'
+                    ).format(count=count, column=column)
+                )
+
+    def cancel(self) -> bool:
+        """
+        Cancel the export. An export waiting to be processed is marked as
+        errored right away, an export being processed stops the next time it
+        records its progress (see `_track_progress()`). Return `False` if the
+        export is already complete or errored
+        """
+        with transaction.atomic():
+            export = self._meta.model.objects.select_for_update().get(
+                pk=self.pk
+            )
+            if export.status in (self.COMPLETE, self.ERROR):
+                self.status = export.status
+                return False
+
+            export.data['cancel_requested'] = True
+            if export.status == self.CREATED:
+                export.status = self.ERROR
+                export.messages['error_type'] = t('Cancelled')
+                export.messages['error'] = str(self.Cancelled())
+            export.save(update_fields=['status', 'messages', 'data'])
+
+        self.status = export.status
+        self.messages = export.messages
+        self.data = export.data
+        return True
 
     def delete(self, *args, **kwargs):
         # removing exported file from storage
-        self.result.delete(save=False)
+        self._delete_result()
         super().delete(*args, **kwargs)
 
     def get_export_object(
-        self, source: Optional[Asset] = None
+        self,
+        source: Optional[Asset] = None,
+        incremental: bool = True,
+        id_range: Optional[Tuple[Optional[int], Optional[int]]] = None,
+        track_progress: Optional[bool] = None,
     ) -> Tuple[formpack.reporting.Export, Generator]:
         """
         Get the formpack Export object and submission stream for processing.
+        The stream is narrowed down to the submissions received or modified
+        since the previous export if the export is incremental, unless
+        `incremental` is `False`, and to the submissions whose `_id` is within
+        `id_range` (lower bound included, upper bound excluded, `None` for no
+        bound) if provided. Consuming the stream records the progress of the
+        export if `track_progress` is `True` (defaults to `TRACKS_PROGRESS`).
         """
 
         fields = self.data.get('fields', [])
@@ -841,6 +1685,25 @@ class ExportTaskBase(ImportExportTask):
         if not source.has_deployment:
             raise Exception('the source must be deployed prior to export')
 
+        self.data.pop('incremental_since', None)
+        self.data['last_submission_id'] = None
+        if incremental and self._incremental:
+            query = self._get_incremental_query(source, query)
+
+        if id_range is not None:
+            lower_id, upper_id = id_range
+            id_query = {}
+            if lower_id is not None:
+                id_query['$gte'] = lower_id
+            if upper_id is not None:
+                id_query['$lt'] = upper_id
+            if id_query:
+                query = (
+                    {MongoHelper.AND_OPERATOR: [query, {'_id': id_query}]}
+                    if query
+                    else {'_id': id_query}
+                )
+
         # Include the group name in `fields` for Mongo to correctly filter
         # for repeat groups
         fields = self._get_fields_and_groups(fields)
@@ -852,12 +1715,11 @@ class ExportTaskBase(ImportExportTask):
         )
 
         if source.has_advanced_features:
-            extr = dict(
-                source.submission_extras.values_list(
-                    'submission_uuid', 'content'
-                )
+            # The deployment back end may already have joined supplemental
+            # details; they are not fetched a second time
+            submission_stream = stream_with_batched_extras(
+                submission_stream, source
             )
-            submission_stream = stream_with_extras(submission_stream, extr)
 
         pack, submission_stream = build_formpack(
             source, submission_stream, self._fields_from_all_versions
@@ -871,6 +1733,25 @@ class ExportTaskBase(ImportExportTask):
         submission_stream = self._record_last_submission_time(
             submission_stream
         )
+        if track_progress is None:
+            track_progress = self.TRACKS_PROGRESS
+        if track_progress:
+            def _count_total():
+                try:
+                    return source.deployment.calculated_submission_count(
+                        user=self.user,
+                        submission_ids=submission_ids,
+                        query=query,
+                    )
+                except PyMongoError:
+                    # The total is only an estimate for users, do not fail
+                    # the export because of it (e.g. if counting takes too
+                    # long)
+                    return None
+
+            submission_stream = self._track_progress(
+                submission_stream, _count_total
+            )
 
         options = self._build_export_options(pack)
         return pack.export(**options), submission_stream
@@ -880,7 +1761,9 @@ class ExportTaskBase(ImportExportTask):
     def log_and_mark_stuck_as_errored(cls, user, source):
         """
         Set the status to ERROR and log a warning for any export that's been in
-        an incomplete state for too long.
+        an incomplete state for too long without recording any progress (see
+        `settings.EXPORT_STALLED_TIMEOUT`). Exports which still record their
+        progress are slow, not stuck, and are left alone.
 
         `source` is the source URL as included in the `data` attribute.
         """
@@ -893,12 +1776,33 @@ class ExportTaskBase(ImportExportTask):
             seconds=max_export_run_time * 4)
         this_moment = datetime.datetime.now(tz=ZoneInfo('UTC'))
         oldest_allowed_timestamp = this_moment - max_allowed_export_age
-        stuck_exports = cls.objects.filter(
+        stalled_timestamp = this_moment - datetime.timedelta(
+            seconds=settings.EXPORT_STALLED_TIMEOUT
+        )
+        incomplete_exports = cls.objects.select_for_update().filter(
             user=user,
-            date_created__lt=oldest_allowed_timestamp,
+            date_created__lt=stalled_timestamp,
             data__source=source,
         ).exclude(status__in=(cls.COMPLETE, cls.ERROR))
-        for stuck_export in stuck_exports:
+        for stuck_export in incomplete_exports:
+            progress_date = stuck_export.data.get('progress', {}).get(
+                'date_modified'
+            )
+            if progress_date is None:
+                # No progress recorded yet, the export may still be waiting
+                # in the Celery queue
+                if stuck_export.date_created >= oldest_allowed_timestamp:
+                    continue
+            elif dateutil.parser.isoparse(progress_date) >= stalled_timestamp:
+                logging.info(
+                    'Slow export {}: age {}, progress {}'.format(
+                        stuck_export.uid,
+                        this_moment - stuck_export.date_created,
+                        stuck_export.data['progress'],
+                    )
+                )
+                continue
+
             logging.warning(
                 'Stuck export {}: type {}, username {}, source {}, '
                 'age {}'.format(
@@ -909,7 +1813,6 @@ class ExportTaskBase(ImportExportTask):
                     this_moment - stuck_export.date_created,
                 )
             )
-            # FIXME: use `select_for_update`
             stuck_export.status = cls.ERROR
             stuck_export.save()
 
@@ -936,9 +1839,122 @@ class ExportTaskBase(ImportExportTask):
 
 class ExportTask(ExportTaskBase):
     """
-    An asynchronous export task, to be run with Celery
+    An asynchronous export task, to be run with Celery.
+
+    Large exports may be split into shards, i.e. ranges of submission `_id`s,
+    which are exported in parallel (see `split_into_shards()` and
+    `run_shard()`), then merged into the result (see `merge_shards()`). The
+    progress of each shard is recorded in `data['shards']`
     """
 
+    SHARDABLE_EXPORT_TYPES = ('csv', 'xls', 'parquet')
+    TRACKS_PROGRESS = True
+    # Number of submissions exported by a shard between two updates of its
+    # progress
+    SHARD_PROGRESS_INTERVAL = 10000
+
+    def _delete_shard_files(self):
+        for shard in self.data.get('shards', []):
+            if shard.get('file'):
+                self.result.storage.delete(shard.pop('file'))
+
+    @staticmethod
+    def _get_columns_hash(export: formpack.reporting.Export) -> str:
+        return calculate_hash(json.dumps(export.sections), algorithm='sha1')
+
+    def _merge_shards(self, messages):
+        """
+        Write the rows exported by the shards, in order, to the result of the
+        export
+        """
+        if self.data.get('cancel_requested'):
+            raise self.Cancelled
+
+        export, _ = self.get_export_object(track_progress=False)
+        columns_hash = self._get_columns_hash(export)
+
+        for index, shard in enumerate(self.data['shards']):
+            if shard['status'] != self.COMPLETE:
+                raise Exception(
+                    'shard {} of the export failed: {}'.format(
+                        index, shard.get('error', 'unknown error')
+                    )
+                )
+            if shard['columns_hash'] != columns_hash:
+                raise Exception('the form was redeployed during the export')
+
+        last_submission_ids = [
+            shard['last_submission_id']
+            for shard in self.data['shards']
+            if shard['last_submission_id'] is not None
+        ]
+        self.data['last_submission_id'] = max(
+            last_submission_ids, default=None
+        )
+        last_submission_times = [
+            dateutil.parser.parse(shard['last_submission_time'])
+            for shard in self.data['shards']
+            if shard['last_submission_time']
+        ]
+        self.last_submission_time = max(last_submission_times, default=None)
+
+        self._write_export(
+            export, [], messages, chunks=self._read_shard_chunks(export)
+        )
+
+    def _read_shard_chunks(
+        self, export: formpack.reporting.Export
+    ) -> Generator[dict, None, None]:
+        """
+        Yield the chunks of rows written by the shards. Each shard numbers
+        the rows of each section from 1, `_index` and `_parent_index` are
+        shifted by the number of rows of the preceding shards
+        """
+        main_section = next(iter(export.sections))
+        columns = {
+            section_name: {
+                name: position
+                for position, name in enumerate(names)
+                if name in ('_index', '_parent_index', '_parent_table_name')
+            }
+            for section_name, names in export.sections.items()
+        }
+        offsets = defaultdict(int)
+
+        def _shift(value, offset):
+            if not offset or value is None or value == '':
+                return value
+            shifted = int(value) + offset
+            return shifted if isinstance(value, int) else str(shifted)
+
+        for shard in self.data['shards']:
+            with self.result.storage.open(shard['file'], 'rb') as f:
+                with gzip.open(f, 'rt', encoding='utf-8') as lines:
+                    for line in lines:
+                        chunk = loads_export_chunk(line)
+                        for section_name, rows in chunk.items():
+                            positions = columns.get(section_name, {})
+                            for row in rows:
+                                if '_index' in positions:
+                                    position = positions['_index']
+                                    row[position] = _shift(
+                                        row[position], offsets[section_name]
+                                    )
+                                if '_parent_index' in positions:
+                                    parent_section = main_section
+                                    if '_parent_table_name' in positions:
+                                        parent_section = row[
+                                            positions['_parent_table_name']
+                                        ]
+                                    position = positions['_parent_index']
+                                    row[position] = _shift(
+                                        row[position], offsets[parent_section]
+                                    )
+                        yield chunk
+
+            for section_name, count in shard['rows'].items():
+                offsets[section_name] += count
+
     def _run_task(self, messages):
         try:
             source_url = self.data['source']
@@ -948,12 +1964,184 @@ class ExportTask(ExportTaskBase):
         # Take this opportunity to do some housekeeping
         self.log_and_mark_stuck_as_errored(self.user, source_url)
 
-        super()._run_task(messages)
+        if 'shards' in self.data:
+            try:
+                self._merge_shards(messages)
+            finally:
+                self._delete_shard_files()
+        else:
+            super()._run_task(messages)
 
         # Now that a new export has completed successfully, remove any old
         # exports in excess of the per-user, per-form limit
         self.remove_excess(self.user, source_url)
 
+    def _update_shard(self, index: int, **values) -> bool:
+        """
+        Update the shard `index` in `data['shards']` with `values`, and the
+        overall progress of the export. Shards are processed concurrently:
+        the export is locked to not overwrite the progress of the others.
+        Return whether the export was cancelled meanwhile
+        """
+        with transaction.atomic():
+            data = (
+                self._meta.model.objects.select_for_update()
+                .values_list('data', flat=True)
+                .get(pk=self.pk)
+            )
+            data['shards'][index].update(values)
+            data.setdefault('progress', {}).update(
+                processed=sum(shard['processed'] for shard in data['shards']),
+                date_modified=utcnow().isoformat(),
+            )
+            self._meta.model.objects.filter(pk=self.pk).update(data=data)
+        self.data['shards'][index].update(values)
+        self.data['progress'] = data['progress']
+        return bool(data.get('cancel_requested'))
+
+    def delete(self, *args, **kwargs):
+        self._delete_shard_files()
+        super().delete(*args, **kwargs)
+
+    def merge_shards(self):
+        """
+        Merge the rows exported by the shards into the result of the export,
+        once all of them are done. Like `run()`, catches all exceptions
+        """
+        if self.status != self.PROCESSING or 'shards' not in self.data:
+            raise Exception('only sharded exports being processed can be merged')
+        return self._run_and_record()
+
+    def run_shard(self, index: int):
+        """
+        Export the submissions of the shard `index` to a temporary file of
+        formatted rows, merged later by `merge_shards()`. Errors are recorded
+        on the shard instead of being raised, to let the merge report them
+        """
+        with self._get_workload():
+            self._run_shard(index)
+
+    def _run_shard(self, index: int):
+        shard = self.data['shards'][index]
+        filepath = None
+        try:
+            if self._update_shard(index, status=self.PROCESSING):
+                raise self.Cancelled
+            export, submission_stream = self.get_export_object(
+                id_range=(shard['lower_id'], shard['upper_id']),
+                track_progress=False,
+            )
+            filepath = self.get_absolute_filepath(
+                f'{self.uid}-shard-{index}.jsonl.gz'
+            )
+            rows = defaultdict(int)
+            processed = 0
+            with self.result.storage.open(filepath, 'wb') as output_file:
+                with gzip.open(output_file, 'wt', encoding='utf-8') as lines:
+                    for chunk in export.parse_submissions(submission_stream):
+                        for section_name, section_rows in chunk.items():
+                            rows[section_name] += len(section_rows)
+                        lines.write(dumps_export_chunk(chunk) + '\n')
+                        processed += 1
+                        if (
+                            processed % self.SHARD_PROGRESS_INTERVAL == 0
+                            and self._update_shard(index, processed=processed)
+                        ):
+                            raise self.Cancelled
+        except self.Cancelled as err:
+            if filepath:
+                self.result.storage.delete(filepath)
+            self._update_shard(index, status=self.ERROR, error=str(err))
+            return
+        except Exception as err:
+            logging.error(
+                'Failed to run shard {} of export {}: {}'.format(
+                    index, self.uid, repr(err)
+                ),
+                exc_info=True,
+            )
+            if filepath:
+                self.result.storage.delete(filepath)
+            self._update_shard(index, status=self.ERROR, error=str(err))
+            return
+
+        self._update_shard(
+            index,
+            status=self.COMPLETE,
+            processed=processed,
+            rows=dict(rows),
+            file=filepath,
+            columns_hash=self._get_columns_hash(export),
+            last_submission_id=self.data['last_submission_id'],
+            last_submission_time=(
+                self.last_submission_time.isoformat()
+                if self.last_submission_time
+                else None
+            ),
+        )
+
+    def split_into_shards(self) -> int:
+        """
+        Split the export into shards if there are enough submissions (see
+        `settings.EXPORT_SHARD_SIZE`) and mark it as processing. Return the
+        number of shards, or 0 if the export must be run as a whole by `run()`
+        """
+        if (
+            not settings.EXPORT_SHARD_SIZE
+            or self.status != self.CREATED
+            # Incremental exports and exports of selected submissions are
+            # small enough
+            or self._incremental
+            or self.data.get('submission_ids')
+        ):
+            return 0
+
+        try:
+            if self._get_export_type() not in self.SHARDABLE_EXPORT_TYPES:
+                return 0
+            source = resolve_url_to_asset(self.data['source'])
+        except (NotImplementedError, KeyError, Asset.DoesNotExist):
+            # `run()` reports the error
+            return 0
+        if not source.has_deployment:
+            return 0
+        if self._get_reusable_export() is not None:
+            # `run()` reuses it
+            return 0
+
+        with MongoHelper.analytics_workload():
+            boundaries = MongoHelper.get_id_boundaries(
+                source.deployment.mongo_userform_id,
+                settings.EXPORT_SHARD_SIZE,
+                settings.EXPORT_MAX_SHARDS,
+            )
+        if not boundaries:
+            return 0
+
+        self.data['shards'] = [
+            {
+                'lower_id': lower_id,
+                'upper_id': upper_id,
+                'status': self.CREATED,
+                'processed': 0,
+            }
+            for lower_id, upper_id in zip(
+                [None, *boundaries], [*boundaries, None]
+            )
+        ]
+        # Do not start the export twice, e.g. if the task is delivered twice
+        updated = self._meta.model.objects.filter(
+            pk=self.pk, status=self.CREATED
+        ).update(
+            status=self.PROCESSING, data=self.data, content_key=self.content_key
+        )
+        if not updated:
+            del self.data['shards']
+            return 0
+
+        self.status = self.PROCESSING
+        return len(self.data['shards'])
+
 
 class SynchronousExport(ExportTaskBase):
     """
@@ -968,14 +2156,56 @@ class SynchronousExport(ExportTaskBase):
     )
     format_type = models.CharField(choices=FORMAT_TYPE_CHOICES, max_length=32)
 
+    # Prevents queuing several refreshes of the same export, see
+    # `generate_or_return_existing()`
+    REFRESH_LOCK_KEY_PREFIX = 'synchronous_export_refresh'
+
     class Meta:
         unique_together = (('user', 'asset_export_settings', 'format_type'),)
+        indexes = [
+            models.Index(
+                fields=['content_key'], name='syncexport_content_key_idx'
+            ),
+        ]
+
+    def _is_content_keyed(self) -> bool:
+        # The content key tells whether the export is up to date, see
+        # `_is_up_to_date()`
+        return True
+
+    def _is_up_to_date(self, data: dict) -> bool:
+        """
+        Return whether the export is complete and is either recent (see
+        `SYNCHRONOUS_EXPORT_CACHE_MAX_AGE`) or has the content an export with
+        `data` would have now, i.e. neither the settings, the deployed
+        versions nor the submissions have changed since (see
+        `_get_content_key()`)
+        """
+        if self.status != self.COMPLETE or not self.result:
+            return False
 
-    @classmethod
-    def generate_or_return_existing(cls, user, asset_export_settings):
         age_cutoff = utcnow() - datetime.timedelta(
             seconds=constance.config.SYNCHRONOUS_EXPORT_CACHE_MAX_AGE
         )
+        if self.date_created >= age_cutoff:
+            return True
+
+        source = self.asset_export_settings.asset
+        if not self.content_key or not source.has_deployment:
+            return False
+        export = self.__class__(user=self.user, data=data)
+        return export._get_content_key(source) == self.content_key
+
+    @classmethod
+    def generate_or_return_existing(
+        cls, user, asset_export_settings, stale_ok: bool = False
+    ):
+        """
+        Return the export of `asset_export_settings` for `user`, generated
+        again first if it is not up to date (see `_is_up_to_date()`). With
+        `stale_ok`, an outdated export is returned as is, and generated again
+        in the background
+        """
         format_type = asset_export_settings.export_settings['type']
         data = asset_export_settings.export_settings.copy()
         data['source'] = reverse(
@@ -990,25 +2220,67 @@ class SynchronousExport(ExportTaskBase):
         # An object (a row) must be created (inserted) before it can be locked
         cls.objects.get_or_create(**criteria, defaults={'data': data})
 
+        if stale_ok:
+            # Not locked: while the export is generated again, the previous
+            # version is still returned until the new one is committed
+            export = cls.objects.get(**criteria)
+            if export.status == cls.COMPLETE and export.result:
+                if not export._is_up_to_date(data) and cache.add(
+                    f'{cls.REFRESH_LOCK_KEY_PREFIX}:{export.pk}',
+                    True,
+                    settings.CELERY_TASK_TIME_LIMIT,
+                ):
+                    from kpi.tasks import (
+                        refresh_synchronous_export_in_background,
+                    )  # avoid circular imports
+
+                    refresh_synchronous_export_in_background.delay(export.pk)
+                return export
+
         with transaction.atomic():
             # Lock the object (and block until a lock can be obtained) to
             # prevent the same export from running concurrently
             export = cls.objects.select_for_update().get(**criteria)
 
-            if (
-                export.status == cls.COMPLETE
-                and export.date_created >= age_cutoff
-            ):
+            if export._is_up_to_date(data):
                 return export
 
+            # The previous file is deleted only once the new one is committed,
+            # it may still be returned to callers which accept stale exports
+            previous_result = export.result.name if export.result else None
             export.data = data
             export.status = cls.CREATED
             export.date_created = utcnow()
-            export.result.delete(save=False)
+            export.result = None
             export.save()
             export.run()
+            if (
+                previous_result
+                and previous_result != getattr(export.result, 'name', None)
+                and not export._is_file_shared(previous_result)
+            ):
+                storage = export.result.storage
+                transaction.on_commit(lambda: storage.delete(previous_result))
             return export
 
+    @classmethod
+    def refresh(cls, export_id: int):
+        """
+        Generate the export `export_id` again if it is not up to date. Meant
+        to be run in the background, see `generate_or_return_existing()`
+        """
+        try:
+            export = cls.objects.select_related('asset_export_settings').get(
+                pk=export_id
+            )
+            asset_export_settings = export.asset_export_settings
+            # The type of the settings may differ from the format of the export
+            # (see `AssetExportSettingsViewSet.data()`)
+            asset_export_settings.export_settings['type'] = export.format_type
+            cls.generate_or_return_existing(export.user, asset_export_settings)
+        finally:
+            cache.delete(f'{cls.REFRESH_LOCK_KEY_PREFIX}:{export_id}')
+
 
 def _get_xls_format(decoded_str):
     first_bytes = decoded_str[:2]
@@ -12,16 +12,47 @@ from rest_framework.pagination import (
 from rest_framework.response import Response
 from rest_framework.reverse import reverse_lazy
 from rest_framework.serializers import SerializerMethodField
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 
 class DataPagination(LimitOffsetPagination):
     """
     Pagination class for submissions.
+
+    When the `cursor` query parameter is present (even empty), results are
+    paginated with keyset pagination: the `next` link contains an opaque
+    cursor, set by the view with `next_cursor`, instead of an offset.
     """
     default_limit = settings.SUBMISSION_LIST_LIMIT
     offset_query_param = 'start'
+    cursor_query_param = 'cursor'
     max_limit = settings.SUBMISSION_LIST_LIMIT
 
+    def get_next_link(self):
+        if not self.use_cursor:
+            return super().get_next_link()
+
+        if self.next_cursor is None:
+            return None
+
+        url = remove_query_param(
+            self.request.build_absolute_uri(), self.offset_query_param
+        )
+        return replace_query_param(
+            url, self.cursor_query_param, self.next_cursor
+        )
+
+    def get_previous_link(self):
+        if self.use_cursor:
+            # Keyset pagination only walks forward
+            return None
+        return super().get_previous_link()
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.use_cursor = self.cursor_query_param in request.query_params
+        self.next_cursor = None
+        return super().paginate_queryset(queryset, request, view)
+
 
 class Paginated(LimitOffsetPagination):
     """ Adds 'root' to the wrapping response object. """
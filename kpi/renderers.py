@@ -1,13 +1,14 @@
 # coding: utf-8
 import json
 import re
-from collections.abc import Callable
+from collections.abc import Callable, Iterable
 from io import StringIO
 
 
 from dict2xml import dict2xml
 from django.utils.xmlutils import SimplerXMLGenerator
 from rest_framework import renderers, status
+from rest_framework.compat import LONG_SEPARATORS, SHORT_SEPARATORS
 from rest_framework.exceptions import ErrorDetail
 from rest_framework_xml.renderers import XMLRenderer as DRFXMLRenderer
 
@@ -22,6 +23,64 @@ class AssetJsonRenderer(renderers.JSONRenderer):
     format = 'json'
 
 
+class StreamingJSONRenderer(renderers.JSONRenderer):
+    """
+    Render JSON incrementally, to be used with `StreamingHttpResponse`.
+
+    Lists and iterators (e.g. a stream of submissions), at the top level or
+    as values of a top level dict (e.g. `results` of a paginated response),
+    are written one item at a time instead of being loaded in memory first.
+    """
+
+    def stream(self, data, renderer_context=None):
+        if isinstance(data, dict):
+            yield b'{'
+            for index, (key, value) in enumerate(data.items()):
+                if index:
+                    yield b','
+                yield self._dumps(key) + b':'
+                if self._is_streamable(value):
+                    yield from self._stream_items(value)
+                else:
+                    yield self._dumps(value)
+            yield b'}'
+        elif self._is_streamable(data):
+            yield from self._stream_items(data)
+        else:
+            yield self._dumps(data)
+
+    def _dumps(self, data) -> bytes:
+        """
+        Same as `JSONRenderer.render()` but `None` is rendered as `null`
+        """
+        ret = json.dumps(
+            data,
+            cls=self.encoder_class,
+            ensure_ascii=self.ensure_ascii,
+            allow_nan=not self.strict,
+            separators=(
+                SHORT_SEPARATORS if self.compact else LONG_SEPARATORS
+            ),
+        )
+        # See `JSONRenderer.render()`
+        ret = ret.replace('\u2028', '\\u2028').replace('\u2029', '\\u2029')
+        return ret.encode()
+
+    @staticmethod
+    def _is_streamable(data) -> bool:
+        return not isinstance(data, (str, bytes, dict)) and isinstance(
+            data, Iterable
+        )
+
+    def _stream_items(self, items):
+        yield b'['
+        for index, item in enumerate(items):
+            if index:
+                yield b','
+            yield self._dumps(item)
+        yield b']'
+
+
 class MediaFileRenderer(renderers.BaseRenderer):
     media_type = '*/*'
     format = None
@@ -102,13 +161,20 @@ class SubmissionGeoJsonRenderer(renderers.BaseRenderer):
     format = 'geojson'
 
     def render(self, data, accepted_media_type=None, renderer_context=None):
-        view = renderer_context['view']
-        # `AssetNestedObjectViewsetMixin` provides the asset
-        asset = view.asset
         if renderer_context['response'].status_code != status.HTTP_200_OK:
             # We're ending up with stuff like `{u'detail': u'Not found.'}` in
             # `data`. Is this the best way to handle that?
             return None
+        return ''.join(self.stream(data, renderer_context))
+
+    def stream(self, data, renderer_context):
+        """
+        Yield the `FeatureCollection` chunk by chunk, as `data` (a stream of
+        submissions) is consumed
+        """
+        view = renderer_context['view']
+        # `AssetNestedObjectViewsetMixin` provides the asset
+        asset = view.asset
         pack, submission_stream = build_formpack(asset, data)
         # Right now, we're more-or-less mirroring the JSON renderer. In the
         # future, we could expose more export options (e.g. label language)
@@ -131,11 +197,9 @@ class SubmissionGeoJsonRenderer(renderers.BaseRenderer):
             except StopIteration:
                 # formpack will gracefully return an empty `features` array
                 geo_question_name = None
-        return ''.join(
-            export.to_geojson(
-                submission_stream,
-                geo_question_name=geo_question_name,
-            )
+        return export.to_geojson(
+            submission_stream,
+            geo_question_name=geo_question_name,
         )
 
 
@@ -40,6 +40,10 @@ class AssetCountsSerializer(serializers.Serializer):
             return asset.deployment.submission_count
 
         if asset.has_perm(user, PERM_PARTIAL_SUBMISSIONS):
-            return asset.deployment.calculated_submission_count(user=user)
+            # Daily counts are materialized, summing them is cheaper than
+            # counting the submissions `user` is allowed to see
+            return sum(
+                asset.deployment.get_daily_counts(user=user).values()
+            )
 
         return 0
@@ -17,13 +17,17 @@ from formpack.constants import (
     REQUIRED_EXPORT_SETTINGS,
     VALID_DEFAULT_LANGUAGES,
     VALID_EXPORT_SETTINGS,
-    VALID_EXPORT_TYPES,
     VALID_MULTIPLE_SELECTS,
 )
 
 from kpi.fields import WritableJSONField
 from kpi.models import Asset, AssetExportSettings
-from kpi.utils.export_task import format_exception_values
+from kpi.utils.export_task import (
+    EXPORT_SETTING_INCREMENTAL,
+    EXPORT_SETTING_INCREMENTAL_MERGE,
+    VALID_EXPORT_TYPES,
+    format_exception_values,
+)
 
 
 class AssetExportSettingsSerializer(serializers.ModelSerializer):
@@ -68,14 +72,18 @@ class AssetExportSettingsSerializer(serializers.ModelSerializer):
                     )
                 )
 
+        valid_export_settings = VALID_EXPORT_SETTINGS + [
+            EXPORT_SETTING_INCREMENTAL,
+            EXPORT_SETTING_INCREMENTAL_MERGE,
+        ]
         for key in export_settings:
-            if key not in VALID_EXPORT_SETTINGS:
+            if key not in valid_export_settings:
                 raise serializers.ValidationError(
                     t(
                         "`export_settings` can contain only the following "
                         "valid keys: {}"
                     ).format(
-                        format_exception_values(VALID_EXPORT_SETTINGS, 'and')
+                        format_exception_values(valid_export_settings, 'and')
                     )
                 )
 
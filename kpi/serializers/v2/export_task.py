@@ -23,14 +23,21 @@ from formpack.constants import (
     REQUIRED_EXPORT_SETTINGS,
     VALID_DEFAULT_LANGUAGES,
     VALID_EXPORT_SETTINGS,
-    VALID_EXPORT_TYPES,
     VALID_MULTIPLE_SELECTS,
 )
 
 from kpi.fields import ReadOnlyJSONField
 from kpi.models import ExportTask, Asset
 from kpi.tasks import export_in_background
-from kpi.utils.export_task import format_exception_values
+from kpi.utils.export_task import (
+    COMPRESSIBLE_EXPORT_TYPES,
+    EXPORT_SETTING_COMPRESSION,
+    EXPORT_SETTING_INCREMENTAL,
+    EXPORT_SETTING_INCREMENTAL_MERGE,
+    VALID_EXPORT_COMPRESSIONS,
+    VALID_EXPORT_TYPES,
+    format_exception_values,
+)
 from kpi.utils.object_permission import get_database_user
 
 
@@ -110,10 +117,30 @@ class ExportTaskSerializer(serializers.ModelSerializer):
                 EXPORT_SETTING_INCLUDE_MEDIA_URL
             ]
 
+        if EXPORT_SETTING_INCREMENTAL in data_:
+            attrs[EXPORT_SETTING_INCREMENTAL] = self.validate_incremental(
+                data_
+            )
+
+        if EXPORT_SETTING_INCREMENTAL_MERGE in data_:
+            attrs[
+                EXPORT_SETTING_INCREMENTAL_MERGE
+            ] = self.validate_incremental_merge(data_)
+
+        if data_.get(EXPORT_SETTING_COMPRESSION):
+            attrs[EXPORT_SETTING_COMPRESSION] = self.validate_compression(
+                data_
+            )
+
         return attrs
 
     def validate_data(self, data: dict) -> dict:
-        valid_export_settings = VALID_EXPORT_SETTINGS + [EXPORT_SETTING_SOURCE]
+        valid_export_settings = VALID_EXPORT_SETTINGS + [
+            EXPORT_SETTING_COMPRESSION,
+            EXPORT_SETTING_INCREMENTAL,
+            EXPORT_SETTING_INCREMENTAL_MERGE,
+            EXPORT_SETTING_SOURCE,
+        ]
 
         for required in REQUIRED_EXPORT_SETTINGS:
             if required not in data:
@@ -145,6 +172,28 @@ class ExportTaskSerializer(serializers.ModelSerializer):
 
         return data
 
+    def validate_compression(self, data: dict) -> str:
+        compression = data[EXPORT_SETTING_COMPRESSION]
+        if compression not in VALID_EXPORT_COMPRESSIONS:
+            raise serializers.ValidationError(
+                {
+                    EXPORT_SETTING_COMPRESSION: t('Must be either {}').format(
+                        format_exception_values(VALID_EXPORT_COMPRESSIONS)
+                    )
+                }
+            )
+        if data[EXPORT_SETTING_TYPE] not in COMPRESSIBLE_EXPORT_TYPES:
+            raise serializers.ValidationError(
+                {
+                    EXPORT_SETTING_COMPRESSION: t(
+                        'Only {} exports can be compressed'
+                    ).format(
+                        format_exception_values(COMPRESSIBLE_EXPORT_TYPES)
+                    )
+                }
+            )
+        return compression
+
     def validate_fields(self, data: dict) -> list:
         fields = data[EXPORT_SETTING_FIELDS]
         if not isinstance(fields, list):
@@ -170,6 +219,33 @@ class ExportTaskSerializer(serializers.ModelSerializer):
             )
         return group_sep
 
+    def validate_incremental(self, data: dict) -> bool:
+        incremental = data[EXPORT_SETTING_INCREMENTAL]
+        if not isinstance(incremental, bool):
+            raise serializers.ValidationError(
+                {EXPORT_SETTING_INCREMENTAL: t('Must be a boolean')}
+            )
+        return incremental
+
+    def validate_incremental_merge(self, data: dict) -> bool:
+        incremental_merge = data[EXPORT_SETTING_INCREMENTAL_MERGE]
+        if not isinstance(incremental_merge, bool):
+            raise serializers.ValidationError(
+                {EXPORT_SETTING_INCREMENTAL_MERGE: t('Must be a boolean')}
+            )
+        if incremental_merge and (
+            not data.get(EXPORT_SETTING_INCREMENTAL)
+            or data[EXPORT_SETTING_TYPE] != 'csv'
+        ):
+            raise serializers.ValidationError(
+                {
+                    EXPORT_SETTING_INCREMENTAL_MERGE: t(
+                        'Only incremental CSV exports can be merged'
+                    )
+                }
+            )
+        return incremental_merge
+
     def validate_lang(self, data: dict) -> str:
         asset_languages = self._get_asset.summary.get('languages', [])
         all_valid_languages = [*asset_languages, *VALID_DEFAULT_LANGUAGES]
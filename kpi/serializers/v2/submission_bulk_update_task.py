@@ -0,0 +1,51 @@
+# coding: utf-8
+from rest_framework import serializers
+from rest_framework.reverse import reverse
+
+from kpi.fields import ReadOnlyJSONField
+from kpi.models import SubmissionBulkUpdateTask
+
+
+class SubmissionBulkUpdateTaskSerializer(serializers.ModelSerializer):
+    url = serializers.SerializerMethodField()
+    messages = ReadOnlyJSONField(required=False)
+    count = serializers.SerializerMethodField()
+    processed = serializers.SerializerMethodField()
+    result = serializers.SerializerMethodField()
+
+    class Meta:
+        model = SubmissionBulkUpdateTask
+        fields = (
+            'url',
+            'uid',
+            'status',
+            'messages',
+            'date_created',
+            'count',
+            'processed',
+            'result',
+        )
+        read_only_fields = fields
+
+    def get_count(self, obj: SubmissionBulkUpdateTask) -> int:
+        return obj.data.get('count')
+
+    def get_processed(self, obj: SubmissionBulkUpdateTask) -> int:
+        return obj.data.get('processed', 0)
+
+    def get_result(self, obj: SubmissionBulkUpdateTask) -> dict:
+        """
+        Same data as the response of a synchronous bulk update, once the task
+        is complete
+        """
+        return obj.data.get('result')
+
+    def get_url(self, obj: SubmissionBulkUpdateTask) -> str:
+        return reverse(
+            'submission-bulk-task',
+            kwargs={
+                'parent_lookup_asset': obj.asset.uid,
+                'task_uid': obj.uid,
+            },
+            request=self.context.get('request', None),
+        )
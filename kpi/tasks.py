@@ -1,6 +1,7 @@
 # coding: utf-8
 import constance
 import requests
+from celery import chord
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.core.management import call_command
@@ -22,7 +23,77 @@ def export_in_background(export_task_uid):
     from kpi.models.import_export_task import ExportTask  # avoid circular imports
 
     export_task = ExportTask.objects.get(uid=export_task_uid)
-    export_task.run()
+    if export_task.data.get('cancel_requested'):
+        # Cancelled while waiting in the queue
+        return
+    shard_count = export_task.split_into_shards()
+    if not shard_count:
+        export_task.run()
+        return
+
+    # Shards are exported in parallel, then merged once all of them are done
+    chord(
+        export_shard_in_background.si(export_task_uid, index)
+        for index in range(shard_count)
+    )(merge_export_shards_in_background.si(export_task_uid))
+
+
+@celery_app.task
+def export_shard_in_background(export_task_uid, index):
+    from kpi.models.import_export_task import ExportTask  # avoid circular imports
+
+    export_task = ExportTask.objects.get(uid=export_task_uid)
+    export_task.run_shard(index)
+
+
+@celery_app.task
+def merge_export_shards_in_background(export_task_uid):
+    from kpi.models.import_export_task import ExportTask  # avoid circular imports
+
+    export_task = ExportTask.objects.get(uid=export_task_uid)
+    export_task.merge_shards()
+
+
+@celery_app.task
+def refresh_synchronous_export_in_background(export_id):
+    from kpi.models.import_export_task import (
+        SynchronousExport,
+    )  # avoid circular imports
+
+    SynchronousExport.refresh(export_id)
+
+
+@celery_app.task
+def build_columnar_cache_in_background(asset_uid):
+    from kobo.apps.reports.columnar_cache import (
+        ColumnarSubmissionCache,
+    )  # avoid circular imports
+    from kpi.models import Asset  # avoid circular imports
+
+    asset = Asset.objects.get(uid=asset_uid)
+    ColumnarSubmissionCache(asset).build()
+
+
+@celery_app.task
+def refresh_report_in_background(asset_uid, field_names, split_by, user_id):
+    from kobo.apps.reports.report_data import (
+        refresh_cached_report,
+    )  # avoid circular imports
+    from kpi.models import Asset  # avoid circular imports
+
+    asset = Asset.objects.get(uid=asset_uid)
+    user = User.objects.get(pk=user_id)
+    refresh_cached_report(asset, field_names, split_by, user)
+
+
+@celery_app.task
+def bulk_update_submissions_in_background(task_uid):
+    from kpi.models.import_export_task import (
+        SubmissionBulkUpdateTask,
+    )  # avoid circular imports
+
+    bulk_update_task = SubmissionBulkUpdateTask.objects.get(uid=task_uid)
+    bulk_update_task.run()
 
 
 @celery_app.task
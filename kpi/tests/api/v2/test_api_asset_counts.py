@@ -1,8 +1,15 @@
+import datetime
+
 from django.contrib.auth.models import User
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
 
-from kpi.constants import PERM_VIEW_ASSET, PERM_VIEW_SUBMISSIONS
+from kpi.constants import (
+    PERM_PARTIAL_SUBMISSIONS,
+    PERM_VIEW_ASSET,
+    PERM_VIEW_SUBMISSIONS,
+)
 from kpi.models import Asset
 from kpi.tests.base_test_case import BaseAssetDetailTestCase
 from kpi.urls.router_api_v2 import URL_NAMESPACE as ROUTER_URL_NAMESPACE
@@ -33,24 +40,28 @@ class UsageAPITestCase(BaseAssetDetailTestCase):
         }
         self.asset.save()
         self.asset.deploy(backend='mock', active=True)
+        # Only the counts of the last days are returned
+        today = timezone.now().date()
+        self.first_day = str(today - datetime.timedelta(days=5))
+        self.second_day = str(today - datetime.timedelta(days=2))
         submissions = [
             {
                 '__version__': self.asset.latest_deployed_version.uid,
                 'q1': 'a1',
                 '_submitted_by': 'anotheruser',
-                '_submission_time': '2022-09-07T13:21:33',
+                '_submission_time': f'{self.first_day}T13:21:33',
             },
             {
                 '__version__': self.asset.latest_deployed_version.uid,
                 'q1': 'a3',
                 '_submitted_by': '',
-                '_submission_time': '2022-09-12T16:31:33',
+                '_submission_time': f'{self.second_day}T16:31:33',
             },
             {
                 '__version__': self.asset.latest_deployed_version.uid,
                 'q1': 'a1',
                 '_submitted_by': '',
-                '_submission_time': '2022-09-12T17:31:33',
+                '_submission_time': f'{self.second_day}T17:31:33',
             },
         ]
 
@@ -66,7 +77,9 @@ class UsageAPITestCase(BaseAssetDetailTestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['total_submission_count'], 3)
         self.assertEqual(len(response.data['daily_submission_counts']), 2)
-        self.assertEqual(response.data['daily_submission_counts']['2022-09-12'], 2)
+        self.assertEqual(
+            response.data['daily_submission_counts'][self.second_day], 2
+        )
 
     def test_count_endpoint_anonymous_user(self):
         count_url = reverse(
@@ -114,4 +127,55 @@ class UsageAPITestCase(BaseAssetDetailTestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['total_submission_count'], 3)
         self.assertEqual(len(response.data['daily_submission_counts']), 2)
-        self.assertEqual(response.data['daily_submission_counts']['2022-09-12'], 2)
+        self.assertEqual(
+            response.data['daily_submission_counts'][self.second_day], 2
+        )
+
+    def test_count_endpoint_another_user_with_partial_perms(self):
+        count_url = reverse(
+            self._get_endpoint('asset-counts-list'),
+            kwargs={'parent_lookup_asset': self.asset.uid}
+        )
+        anotheruser = User.objects.get(username='anotheruser')
+        # Stored daily counts are filtered by submitter
+        self.asset.assign_perm(
+            anotheruser,
+            PERM_PARTIAL_SUBMISSIONS,
+            partial_perms={
+                PERM_VIEW_SUBMISSIONS: [{'_submitted_by': 'anotheruser'}]
+            },
+        )
+        self.client.login(username='anotheruser', password='anotheruser')
+        response = self.client.get(count_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['total_submission_count'], 1)
+        self.assertEqual(
+            response.data['daily_submission_counts'], {self.first_day: 1}
+        )
+
+    def test_count_endpoint_another_user_with_partial_perms_on_responses(self):
+        count_url = reverse(
+            self._get_endpoint('asset-counts-list'),
+            kwargs={'parent_lookup_asset': self.asset.uid}
+        )
+        anotheruser = User.objects.get(username='anotheruser')
+        # Submissions are counted on the fly
+        self.asset.assign_perm(
+            anotheruser,
+            PERM_PARTIAL_SUBMISSIONS,
+            partial_perms={PERM_VIEW_SUBMISSIONS: [{'q1': 'a1'}]},
+        )
+        self.client.login(username='anotheruser', password='anotheruser')
+        response = self.client.get(count_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['total_submission_count'], 2)
+        self.assertEqual(
+            response.data['daily_submission_counts'],
+            {self.first_day: 1, self.second_day: 1},
+        )
+
+        # Only the last days are counted
+        response = self.client.get(count_url, {'days': 3})
+        self.assertEqual(
+            response.data['daily_submission_counts'], {self.second_day: 1}
+        )
@@ -1,7 +1,9 @@
 # coding: utf-8
+import gzip
 import os
 from collections import defaultdict
 
+from constance.test import override_config
 from django.contrib.auth.models import User
 from rest_framework import status
 from rest_framework.reverse import reverse
@@ -257,6 +259,43 @@ class AssetExportTaskTestV2(MockDataExportsBase, BaseTestCase):
         response = self.client.post(list_url, data=data, format='json')
         assert response.status_code == status.HTTP_201_CREATED
 
+    def test_export_task_create_compressed(self):
+        self.client.login(username='someuser', password='someuser')
+        list_url = reverse(
+            self._get_endpoint('asset-export-list'),
+            kwargs={'format': 'json', 'parent_lookup_asset': self.asset.uid},
+        )
+        data = {
+            'type': 'csv',
+            'lang': '_default',
+            'group_sep': '/',
+            'hierarchy_in_labels': 'false',
+            'fields_from_all_versions': 'false',
+            'multiple_select': 'both',
+            'compression': 'gzip',
+        }
+        response = self.client.post(list_url, data=data)
+        assert response.status_code == status.HTTP_201_CREATED
+        response = self.client.get(response.data['url'])
+        result_url = response.data['result']
+        assert result_url.endswith('.csv.gz')
+
+        # Decompressed transparently by clients which accept gzip
+        response = self.client.get(result_url, HTTP_ACCEPT_ENCODING='gzip')
+        assert response.status_code == status.HTTP_200_OK
+        assert response['Content-Encoding'] == 'gzip'
+        assert response['Content-Type'].startswith('text/csv')
+        content = gzip.decompress(b''.join(response.streaming_content))
+        assert b'Do_you_descend_from_unicellular_organism' in content
+
+        response = self.client.get(result_url)
+        assert response.status_code == status.HTTP_200_OK
+        assert not response.has_header('Content-Encoding')
+
+        # Only text exports can be compressed
+        response = self.client.post(list_url, data={**data, 'type': 'xls'})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
     def test_export_task_create_with_name(self):
         self.client.login(username='someuser', password='someuser')
         list_url = reverse(
@@ -311,6 +350,36 @@ class AssetExportTaskTestV2(MockDataExportsBase, BaseTestCase):
         response = self.client.delete(detail_url)
         assert response.status_code == status.HTTP_204_NO_CONTENT
 
+    def test_export_task_cancel(self):
+        export_task = ExportTask.objects.create(
+            user=self.user,
+            data={
+                'source': reverse(
+                    self._get_endpoint('asset-detail'),
+                    kwargs={'uid': self.asset.uid},
+                ),
+                'type': 'csv',
+            },
+        )
+
+        self.client.login(username='someuser', password='someuser')
+        cancel_url = reverse(
+            self._get_endpoint('asset-export-cancel'),
+            kwargs={
+                'format': 'json',
+                'parent_lookup_asset': self.asset.uid,
+                'uid': export_task.uid,
+            },
+        )
+        response = self.client.post(cancel_url)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['status'] == ExportTask.ERROR
+        assert response.data['data']['cancel_requested'] is True
+
+        # Already finished
+        response = self.client.post(cancel_url)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
     def test_synchronous_csv_export_matches_async_export(self):
         es = self._create_export_settings()
 
@@ -454,6 +523,79 @@ class AssetExportTaskTestV2(MockDataExportsBase, BaseTestCase):
         first_line = next(synchronous_export_response.streaming_content)
         assert b'Do_you_descend_from_unicellular_organism' in first_line
 
+    def _add_submission(self):
+        submission = self.asset.deployment.get_submissions(self.asset.owner)[-1]
+        submission.pop('_id')
+        self.asset.deployment.mock_submissions([submission], flush_db=False)
+
+    @override_config(SYNCHRONOUS_EXPORT_CACHE_MAX_AGE=0)
+    def test_synchronous_export_conditional_requests(self):
+        es = self._create_export_settings()
+
+        self.client.login(username='someuser', password='someuser')
+        synchronous_exports_url = reverse(
+            self._get_endpoint('asset-export-settings-synchronous-data'),
+            kwargs={
+                'parent_lookup_asset': self.asset.uid,
+                'uid': es.uid,
+                'format': 'csv',
+            },
+        )
+        response = self.client.get(synchronous_exports_url)
+        assert response.status_code == status.HTTP_302_FOUND
+        etag = response['ETag']
+        assert response['Last-Modified']
+
+        # The export is older than `SYNCHRONOUS_EXPORT_CACHE_MAX_AGE` but is
+        # still up to date
+        response = self.client.get(
+            synchronous_exports_url, HTTP_IF_NONE_MATCH=etag
+        )
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+        assert response['ETag'] == etag
+
+        self._add_submission()
+        response = self.client.get(
+            synchronous_exports_url, HTTP_IF_NONE_MATCH=etag
+        )
+        assert response.status_code == status.HTTP_302_FOUND
+        assert response['ETag'] != etag
+
+    @override_config(SYNCHRONOUS_EXPORT_CACHE_MAX_AGE=0)
+    def test_synchronous_export_stale_ok(self):
+        es = self._create_export_settings()
+
+        self.client.login(username='someuser', password='someuser')
+        synchronous_exports_url = reverse(
+            self._get_endpoint('asset-export-settings-synchronous-data'),
+            kwargs={
+                'parent_lookup_asset': self.asset.uid,
+                'uid': es.uid,
+                'format': 'csv',
+            },
+        )
+        response = self.client.get(synchronous_exports_url)
+        etag = response['ETag']
+        self._add_submission()
+
+        # The outdated export is returned while a new one is generated in the
+        # background (which Celery runs eagerly in tests)
+        response = self.client.get(
+            synchronous_exports_url, {'stale_ok': 'true'}
+        )
+        assert response.status_code == status.HTTP_302_FOUND
+        assert response['ETag'] == etag
+
+        response = self.client.get(synchronous_exports_url)
+        assert response['ETag'] != etag
+        response = self.client.get(response['Location'])
+        content = b''.join(response.streaming_content).decode()
+        # Submissions start after header and hxl rows
+        exported_submissions = content.strip().split('\r\n')[2:]
+        assert len(exported_submissions) == len(
+            self.asset.deployment.get_submissions(self.asset.owner)
+        )
+
     def test_export_asset_with_slashes(self):
         """
         Ensure that the slashes are stripped from filename
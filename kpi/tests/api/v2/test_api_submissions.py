@@ -14,6 +14,7 @@ import pytest
 import responses
 from django.conf import settings
 from django.contrib.auth.models import User
+from django.test import override_settings
 from django.urls import reverse
 from django_digest.test import Client as DigestClient
 from rest_framework import status
@@ -30,7 +31,7 @@ from kpi.constants import (
     PERM_VIEW_SUBMISSIONS,
     SUBMISSION_FORMAT_TYPE_XML,
 )
-from kpi.models import Asset
+from kpi.models import Asset, SubmissionBulkUpdateTask
 from kpi.tests.base_test_case import BaseTestCase
 from kpi.tests.utils.xml import get_form_and_submission_tag_names
 from kpi.urls.router_api_v2 import URL_NAMESPACE as ROUTER_URL_NAMESPACE
@@ -350,6 +351,37 @@ class BulkDeleteSubmissionsApiTests(BaseSubmissionTestCase):
         response = self.client.get(self.submission_list_url, {'format': 'json'})
         self.assertEqual(response.data['count'], count - len(random_submissions))
 
+    def test_cannot_delete_unknown_submissions_with_partial_perms_as_anotheruser(self):
+        """
+        someuser is the project owner.
+        anotheruser has partial permissions and can view and delete their own
+        submitted data
+
+        Test that anotheruser cannot delete submissions which do not exist,
+        even along with their own
+        """
+        self._log_in_as_another_user()
+        partial_perms = {
+            PERM_DELETE_SUBMISSIONS: [{'_submitted_by': 'anotheruser'}]
+        }
+        self.asset.assign_perm(
+            self.anotheruser,
+            PERM_PARTIAL_SUBMISSIONS,
+            partial_perms=partial_perms,
+        )
+
+        random_submissions = self.get_random_submissions(self.anotheruser, 2)
+        submission_ids = [rs['_id'] for rs in random_submissions]
+        data = {
+            'payload': {
+                'submission_ids': submission_ids + [max(submission_ids) + 1000]
+            }
+        }
+        response = self.client.delete(self.submission_bulk_url,
+                                      data=data,
+                                      format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
     def test_cannot_delete_view_only_submissions_with_partial_perms_as_anotheruser(self):
         """
         someuser is the owner of the project
@@ -504,6 +536,122 @@ class SubmissionApiTests(BaseSubmissionTestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data['results']), limit)
 
+    def test_list_submissions_with_cursor(self):
+        """
+        someuser is the owner of the project.
+        They can walk through all their data with keyset pagination
+        """
+        expected_ids = sorted(s['_id'] for s in self.submissions)
+        submission_ids = []
+        url = self.submission_list_url
+        params = {'format': 'json', 'cursor': '', 'limit': 6}
+        while url:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.data['count'], len(self.submissions))
+            self.assertEqual(response.data['previous'], None)
+            submission_ids.extend(s['_id'] for s in response.data['results'])
+            url = response.data['next']
+            # `next` already contains all the parameters
+            params = None
+
+        self.assertEqual(submission_ids, expected_ids)
+
+    def test_list_submissions_with_cursor_and_sort(self):
+        """
+        someuser is the owner of the project.
+        Keyset pagination follows the requested sort order
+        """
+        expected_ids = [
+            s['_id']
+            for s in sorted(
+                self.submissions, key=lambda s: (s['q1'], s['_id']), reverse=True
+            )
+        ]
+        submission_ids = []
+        url = self.submission_list_url
+        params = {
+            'format': 'json',
+            'cursor': '',
+            'limit': 7,
+            'sort': '{"q1": -1}',
+        }
+        while url:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            submission_ids.extend(s['_id'] for s in response.data['results'])
+            url = response.data['next']
+            params = None
+
+        self.assertEqual(submission_ids, expected_ids)
+
+    def test_list_submissions_with_invalid_cursor(self):
+        response = self.client.get(
+            self.submission_list_url, {'format': 'json', 'cursor': 'foo'}
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        # A cursor built for another sort order is rejected too
+        response = self.client.get(
+            self.submission_list_url,
+            {'format': 'json', 'cursor': '', 'limit': 2},
+        )
+        next_url = response.data['next']
+        response = self.client.get(next_url + '&sort={"q1": 1}')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_list_submissions_with_estimated_count(self):
+        response = self.client.get(
+            self.submission_list_url,
+            {'format': 'json', 'count': 'estimate', 'limit': 5},
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], len(self.submissions))
+        self.assertEqual(len(response.data['results']), 5)
+
+        # Filtered results are still counted exactly
+        submitted_by = self.submissions[0]['_submitted_by']
+        response = self.client.get(
+            self.submission_list_url,
+            {
+                'format': 'json',
+                'count': 'estimate',
+                'query': f'{{"_submitted_by": "{submitted_by}"}}',
+            },
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        expected_count = len(
+            [
+                s
+                for s in self.submissions
+                if s['_submitted_by'] == submitted_by
+            ]
+        )
+        self.assertEqual(response.data['count'], expected_count)
+
+    def test_list_submissions_streamed(self):
+        response = self.client.get(
+            self.submission_list_url,
+            {'format': 'json', 'stream': 'true', 'start': 1, 'limit': 5},
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        data = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(data['count'], len(self.submissions))
+        self.assertEqual(data['results'], self.submissions[1:6])
+        self.assertIsNotNone(data['next'])
+
+        response = self.client.get(
+            self.submission_list_url, {'format': 'xml', 'stream': 'true'}
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_list_submissions_with_invalid_count(self):
+        response = self.client.get(
+            self.submission_list_url, {'format': 'json', 'count': 'foo'}
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_list_submissions_not_shared_as_anotheruser(self):
         """
         someuser is the owner of the project.
@@ -692,6 +840,57 @@ class SubmissionApiTests(BaseSubmissionTestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data, submission)
 
+    def test_retrieve_submission_is_cached_until_written(self):
+        """
+        someuser is the owner of the project.
+        Retrieving the same submission twice hits MongoDB once, until the
+        submission is written through the deployment back end.
+        """
+        submission = self.submissions[0]
+        url = self.asset.deployment.get_submission_detail_url(submission['_id'])
+        response = self.client.get(url, {'format': 'json'})
+        self.assertEqual(response.data, submission)
+
+        # Alter the submission behind the back end's back
+        settings.MONGO_DB.instances.update_one(
+            {'_id': submission['_id']}, {'$set': {'q1': 'changed'}}
+        )
+        response = self.client.get(url, {'format': 'json'})
+        self.assertEqual(response.data, submission)
+
+        self.asset.deployment.set_validation_status(
+            submission['_id'],
+            self.asset.owner,
+            {'validation_status.uid': 'validation_status_approved'},
+            method='PATCH',
+        )
+        response = self.client.get(url, {'format': 'json'})
+        self.assertEqual(response.data['q1'], 'changed')
+
+    def test_retrieve_submission_xml_is_not_cached(self):
+        """
+        someuser is the owner of the project.
+        The XML of a submission is used to edit it with Enketo, which writes
+        to KoBoCAT directly: it must not be served from the cache.
+        """
+        submission = self.submissions[0]
+        self.asset.deployment.get_submission(
+            submission['_id'], self.asset.owner, use_cache=True
+        )
+        settings.MONGO_DB.instances.update_one(
+            {'_id': submission['_id']}, {'$set': {'q1': 'changed'}}
+        )
+        self.assertEqual(
+            self.asset.deployment.get_submission(
+                submission['_id'], self.asset.owner
+            )['q1'],
+            'changed',
+        )
+        url = self.asset.deployment.get_submission_detail_url(submission['_id'])
+        response = self.client.get(url, {'format': 'xml'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn(b'<q1>changed</q1>', response.content)
+
     def test_retrieve_submission_not_shared_as_anotheruser(self):
         """
         someuser is the owner of the project.
@@ -1742,6 +1941,51 @@ class BulkUpdateSubmissionsApiTests(BaseSubmissionTestCase):
         assert response.status_code == status.HTTP_200_OK
         self._check_bulk_update(response)
 
+    @override_settings(SUBMISSION_BULK_UPDATE_ASYNC_THRESHOLD=2)
+    def test_bulk_update_submissions_in_background(self):
+        response = self.client.patch(
+            self.submission_url, data=self.submitted_payload, format='json'
+        )
+        assert response.status_code == status.HTTP_202_ACCEPTED
+        assert response.data['count'] == 3
+        task_url = response.data['url']
+
+        # Celery runs tasks synchronously in tests
+        response = self.client.get(task_url)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['status'] == 'complete'
+        assert response.data['processed'] == 3
+        assert response.data['result']['successes'] == 3
+
+        # Only the user who started the task can see it
+        self._log_in_as_another_user()
+        self.asset.assign_perm(self.anotheruser, PERM_VIEW_SUBMISSIONS)
+        response = self.client.get(task_url)
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    @override_settings(SUBMISSION_BULK_UPDATE_ASYNC_THRESHOLD=2)
+    def test_cannot_bulk_update_submissions_in_background_with_partial_perms(
+        self,
+    ):
+        self._log_in_as_another_user()
+        partial_perms = {
+            PERM_CHANGE_SUBMISSIONS: [{'_submitted_by': 'anotheruser'}]
+        }
+        self.asset.assign_perm(
+            self.anotheruser,
+            PERM_PARTIAL_SUBMISSIONS,
+            partial_perms=partial_perms,
+        )
+
+        # anotheruser is allowed to update their own submissions only
+        response = self.client.patch(
+            self.submission_url, data=self.submitted_payload, format='json'
+        )
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+        assert not SubmissionBulkUpdateTask.objects.filter(
+            asset=self.asset
+        ).exists()
+
 
 class SubmissionValidationStatusApiTests(BaseSubmissionTestCase):
 
@@ -2503,3 +2747,57 @@ class SubmissionGeoJsonApiTests(BaseTestCase):
             ],
         }
         assert expected_output == json.loads(response.content)
+
+    def test_list_submissions_geojson_streamed(self):
+        response = self.client.get(
+            self.submission_list_url,
+            {'format': 'geojson'}
+        )
+        streamed_response = self.client.get(
+            self.submission_list_url,
+            {'format': 'geojson', 'stream': 'true'}
+        )
+        assert streamed_response.streaming
+        assert json.loads(response.content) == json.loads(
+            b''.join(streamed_response.streaming_content)
+        )
+
+    def test_geo_clusters(self):
+        v_uid = self.asset.latest_deployed_version.uid
+        self.asset.deployment.mock_submissions(
+            [
+                {'__version__': v_uid, '_geolocation': [45.51, -73.56]},
+                {'__version__': v_uid, '_geolocation': [45.52, -73.58]},
+                {'__version__': v_uid, '_geolocation': [46.81, -71.21]},
+                {'__version__': v_uid, '_geolocation': [10.11, 10.12]},
+                {'__version__': v_uid, '_geolocation': [None, None]},
+            ]
+        )
+        url = reverse(
+            self._get_endpoint('submission-geo-clusters'),
+            kwargs={'parent_lookup_asset': self.asset.uid},
+        )
+
+        response = self.client.get(url, {'bbox': '-80,40,-70,50', 'zoom': 6})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['count'] == 3
+        clusters = response.data['results']
+        assert [cluster['count'] for cluster in clusters] == [2, 1]
+        assert clusters[0]['latitude'] == pytest.approx(45.515)
+        assert 'submission_id' not in clusters[0]
+        assert clusters[1]['submission_id'] == 3
+
+        # At a lower zoom level, all submissions of the bounding box are
+        # in the same cell
+        response = self.client.get(url, {'bbox': '-80,40,-70,50', 'zoom': 1})
+        assert [cluster['count'] for cluster in response.data['results']] == [3]
+
+    def test_geo_clusters_invalid_bbox(self):
+        url = reverse(
+            self._get_endpoint('submission-geo-clusters'),
+            kwargs={'parent_lookup_asset': self.asset.uid},
+        )
+        response = self.client.get(url, {'bbox': '-80,40,-70'})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        response = self.client.get(url, {'bbox': '-80,50,-70,40'})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
@@ -0,0 +1,240 @@
+# coding: utf-8
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+
+from kobo.apps.reports import columnar_cache
+from kobo.apps.reports.aggregation import get_survey_fields
+from kobo.apps.reports.columnar_cache import (
+    ColumnarCacheError,
+    ColumnarSubmissionCache,
+)
+from kpi.models import Asset
+
+
+@unittest.skipIf(
+    columnar_cache.duckdb is None, '`pyarrow` and `duckdb` are not installed'
+)
+class ColumnarSubmissionCacheTestCase(TestCase):
+    fixtures = ['test_data']
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.settings_override = override_settings(
+            ANALYTICS_CACHE_ENABLED=True,
+            ANALYTICS_CACHE_ROOT=self.root,
+            ANALYTICS_CACHE_BATCH_SIZE=2,
+        )
+        self.settings_override.enable()
+
+        self.user = User.objects.get(username='someuser')
+        self.asset = Asset.objects.create(
+            content={
+                'survey': [
+                    {
+                        'type': 'select_one',
+                        'name': 'color',
+                        'select_from_list_name': 'colors',
+                    },
+                    {'type': 'integer', 'name': 'age'},
+                    {'type': 'begin_repeat', 'name': 'children'},
+                    {'type': 'text', 'name': 'child_name'},
+                    {'type': 'end_repeat'},
+                ],
+                'choices': [
+                    {'list_name': 'colors', 'name': 'red', 'label': ['Red']},
+                    {'list_name': 'colors', 'name': 'blue', 'label': ['Blue']},
+                ],
+            },
+            owner=self.user,
+        )
+        self.asset.deploy(backend='mock', active=True)
+        self.asset.deployment.mock_submissions(
+            [
+                {'color': 'red', 'age': '30', '_submitted_by': 'someuser'},
+                {'color': 'blue', 'age': '40', '_submitted_by': 'anotheruser'},
+                {'color': 'red', '_submitted_by': 'anotheruser'},
+            ]
+        )
+        self.cache = ColumnarSubmissionCache(self.asset)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def test_columns_exclude_repeat_groups(self):
+        assert 'color' in self.cache.columns
+        assert 'age' in self.cache.columns
+        assert 'children/child_name' not in self.cache.columns
+
+    def test_count(self):
+        assert self.cache.count(self.cache.get_query(self.user)) == 3
+        assert self.cache.count({'color': 'red'}) == 2
+        assert self.cache.count(
+            {
+                '$or': [
+                    {'_submitted_by': 'someuser'},
+                    {'age': {'$exists': False}},
+                ]
+            }
+        ) == 2
+        assert self.cache.count({'_id': {'$in': [1, 2]}}) == 2
+
+    def test_value_counts(self):
+        assert self.cache.get_value_counts('color') == [
+            ('red', None, 2),
+            ('blue', None, 1),
+        ]
+        assert self.cache.get_value_counts('age', 'color') == [
+            ('30', 'red', 1),
+            ('40', 'blue', 1),
+            (None, 'red', 1),
+        ]
+
+    def test_unsupported_queries(self):
+        for query in (
+            {'color': {'$regex': '^r'}},
+            {'unknown': 'value'},
+            {'age': 30},
+        ):
+            with self.assertRaises(ColumnarCacheError):
+                self.cache.count(query)
+
+    def test_new_submissions_are_appended(self):
+        state = self.cache.refresh()
+        assert state['count'] == 3
+        assert len(state['parts']) == 2
+
+        settings.MONGO_DB.instances.insert_one(
+            {
+                '_id': 4,
+                '_userform_id': self.asset.deployment.mongo_userform_id,
+                'color': 'blue',
+            }
+        )
+        new_state = self.cache.refresh()
+        assert new_state['directory'] == state['directory']
+        assert new_state['parts'][:2] == state['parts']
+        assert new_state['count'] == 4
+        assert self.cache.count({'color': 'blue'}) == 2
+
+    def test_cache_is_rebuilt_after_deletion(self):
+        state = self.cache.refresh()
+        settings.MONGO_DB.instances.delete_one({'_id': 1})
+
+        # The cache is rebuilt by Celery (synchronously in tests)
+        new_state = self.cache.refresh()
+        assert new_state['directory'] != state['directory']
+        assert new_state['count'] == 2
+        # Previous copy is kept for the processes which still read it…
+        assert sorted(os.listdir(self.cache.root)) == sorted(
+            [
+                state['directory'],
+                new_state['directory'],
+                ColumnarSubmissionCache.STATE_FILENAME,
+            ]
+        )
+        # …until the grace period is over
+        with mock.patch.object(
+            ColumnarSubmissionCache, 'STALE_DIRECTORY_GRACE_PERIOD', 0
+        ):
+            self.cache._remove_stale_directories(new_state)
+        assert sorted(os.listdir(self.cache.root)) == sorted(
+            [new_state['directory'], ColumnarSubmissionCache.STATE_FILENAME]
+        )
+
+    def test_cache_is_rebuilt_after_edit(self):
+        state = self.cache.refresh()
+        deployment = self.cache.deployment
+
+        # Submission received, e.g. through KoBoCAT
+        settings.MONGO_DB.instances.insert_one(
+            {
+                '_id': 4,
+                '_userform_id': self.asset.deployment.mongo_userform_id,
+                'color': 'blue',
+            }
+        )
+        with mock.patch.object(
+            deployment,
+            'get_submission_last_modified',
+            return_value='2024-01-01T00:00:00+00:00',
+        ), mock.patch.object(
+            deployment, 'has_modified_submissions', return_value=False
+        ):
+            new_state = self.cache.refresh()
+        assert new_state['directory'] == state['directory']
+        assert new_state['count'] == 4
+
+        # Submission edited, e.g. with Enketo
+        settings.MONGO_DB.instances.update_one(
+            {'_id': 1}, {'$set': {'color': 'blue'}}
+        )
+        with mock.patch.object(
+            deployment,
+            'get_submission_last_modified',
+            return_value='2024-01-02T00:00:00+00:00',
+        ), mock.patch.object(
+            deployment, 'has_modified_submissions', return_value=True
+        ) as has_modified_submissions:
+            edited_state = self.cache.refresh()
+        has_modified_submissions.assert_called_once_with(
+            '2024-01-01T00:00:00+00:00', 4
+        )
+        assert edited_state['directory'] != state['directory']
+        assert self.cache.get_value_counts('color') == [
+            ('blue', None, 3),
+            ('red', None, 1),
+        ]
+
+    def test_submissions_received_during_refresh_do_not_rebuild(self):
+        state = self.cache.refresh()
+        append = self.cache._append
+
+        def _append_then_receive_submission(*args):
+            appended_state = append(*args)
+            settings.MONGO_DB.instances.insert_one(
+                {
+                    '_id': 5,
+                    '_userform_id': self.asset.deployment.mongo_userform_id,
+                    'color': 'red',
+                }
+            )
+            return appended_state
+
+        settings.MONGO_DB.instances.insert_one(
+            {
+                '_id': 4,
+                '_userform_id': self.asset.deployment.mongo_userform_id,
+                'color': 'blue',
+            }
+        )
+        with mock.patch.object(
+            self.cache, '_append', _append_then_receive_submission
+        ):
+            new_state = self.cache.refresh()
+        assert new_state['directory'] == state['directory']
+        assert new_state['count'] == 4
+
+    def test_first_build_is_queued(self):
+        with mock.patch(
+            'kpi.tasks.build_columnar_cache_in_background.delay'
+        ) as build_in_background:
+            with self.assertRaises(ColumnarCacheError):
+                self.cache.refresh()
+            with self.assertRaises(ColumnarCacheError):
+                self.cache.refresh()
+        # Only once, until the build is over
+        build_in_background.assert_called_once_with(self.asset.uid)
+        assert self.cache.get_groups_by_field(
+            self.user, list(get_survey_fields(self.asset).values())[:1]
+        ) is None
+
+        self.cache.build()
+        assert self.cache.refresh()['count'] == 3
@@ -0,0 +1,88 @@
+# coding: utf-8
+import threading
+
+import responses
+from django.conf import settings
+from django.test import TestCase, override_settings
+
+from kpi.deployment_backends.kc_access import http_client
+from kpi.deployment_backends.kc_access.http_client import (
+    KOBOCAT_REQUEST_LATENCY,
+    get_kobocat_adapter,
+    get_kobocat_session,
+    kobocat_request,
+)
+
+
+class KobocatHttpClientTestCase(TestCase):
+
+    URL = f'{settings.KOBOCAT_INTERNAL_URL}/api/v1/user'
+
+    def setUp(self):
+        # Start each test with fresh connections and sessions
+        http_client._adapter = None
+        http_client._local = threading.local()
+
+    def test_session_is_shared_within_thread(self):
+        self.assertIs(get_kobocat_session(), get_kobocat_session())
+
+    def test_threads_share_connections_only(self):
+        sessions = []
+        thread = threading.Thread(
+            target=lambda: sessions.append(get_kobocat_session())
+        )
+        thread.start()
+        thread.join()
+        self.assertIsNot(sessions[0], get_kobocat_session())
+        self.assertIs(
+            sessions[0].get_adapter(self.URL),
+            get_kobocat_session().get_adapter(self.URL),
+        )
+
+    def test_session_is_renewed_after_fork(self):
+        session = get_kobocat_session()
+        adapter = get_kobocat_adapter()
+        http_client._adapter_pid = -1
+        self.assertIsNot(get_kobocat_adapter(), adapter)
+        self.assertIsNot(get_kobocat_session(), session)
+
+    @responses.activate
+    def test_cookies_are_not_stored(self):
+        responses.add(
+            responses.GET,
+            self.URL,
+            json={},
+            status=200,
+            headers={'Set-Cookie': 'sessionid=someuser; Path=/'},
+        )
+        kobocat_request('GET', self.URL)
+        kobocat_request('GET', self.URL)
+        self.assertEqual(len(get_kobocat_session().cookies), 0)
+        self.assertNotIn('Cookie', responses.calls[1].request.headers)
+
+    @override_settings(KOBOCAT_HTTP_POOL_SIZE=4, KOBOCAT_HTTP_MAX_RETRIES=2)
+    def test_adapter_settings(self):
+        adapter = get_kobocat_session().get_adapter(self.URL)
+        self.assertEqual(adapter._pool_maxsize, 4)
+        self.assertEqual(adapter.max_retries.total, 2)
+        self.assertNotIn('POST', adapter.max_retries.allowed_methods)
+        self.assertIn('GET', adapter.max_retries.allowed_methods)
+
+    @responses.activate
+    def test_default_timeout_and_latency(self):
+        responses.add(responses.GET, self.URL, json={}, status=200)
+
+        def _get_latency_sum():
+            return KOBOCAT_REQUEST_LATENCY.labels('GET', 200)._sum.get()
+
+        latency_before = _get_latency_sum()
+        response = kobocat_request('GET', self.URL)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            responses.calls[0].request.req_kwargs['timeout'],
+            (
+                settings.KOBOCAT_HTTP_CONNECT_TIMEOUT,
+                settings.KOBOCAT_HTTP_READ_TIMEOUT,
+            ),
+        )
+        self.assertGreater(_get_latency_sum(), latency_before)
@@ -1,12 +1,19 @@
 # coding: utf-8
+import os
+import shutil
+import tempfile
+import unittest
 from copy import deepcopy
 from collections import OrderedDict
+from unittest.mock import patch
 
 from django.contrib.auth.models import User
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from mongomock import MongoClient as MockMongoClient
 
 from formpack import FormPack
-from kobo.apps.reports import report_data
+from kobo.apps.reports import columnar_cache, report_data
+from kobo.apps.reports.aggregation import get_survey_fields
 from kpi.models import Asset
 
 F1 = {'survey': [{'$kuid': 'Uf89NP4VX', 'type': 'start', 'name': 'start'},
@@ -249,6 +256,171 @@ class MockDataReports(TestCase):
             'percentages': (25.0, 25.0, 25.0, 25.0),
         })
 
+    def test_aggregated_stats_match_formpack(self):
+        field_names = ['Select_one', 'Select_Many', 'Text', 'Number', 'Decimal']
+        with override_settings(REPORTS_USE_MONGO_AGGREGATION=False):
+            expected = report_data.data_by_identifiers(
+                self.asset, field_names=field_names, user=self.user
+            )
+        values = report_data.data_by_identifiers(
+            self.asset, field_names=field_names, user=self.user
+        )
+        self.assertEqual(
+            [v['name'] for v in values], [v['name'] for v in expected]
+        )
+        for value, expected_value in zip(values, expected):
+            self.assertEqual(value['row'], expected_value['row'])
+            self.assertEqual(value['data'].keys(), expected_value['data'].keys())
+            for key, expected_stat in expected_value['data'].items():
+                if isinstance(expected_stat, float):
+                    self.assertAlmostEqual(value['data'][key], expected_stat)
+                else:
+                    self.assertEqual(value['data'][key], expected_stat)
+
+    def test_aggregated_stats_of_moved_question_match_formpack(self):
+        # Move `Select_one` into a group in a new version of the form
+        content = deepcopy(F1)
+        survey = content['survey']
+        index = next(
+            i for i, row in enumerate(survey) if row.get('name') == 'Select_one'
+        )
+        survey[index:index + 1] = [
+            {'type': 'begin_group', 'name': 'group', '$kuid': 'g1'},
+            survey[index],
+            {'type': 'end_group', '$kuid': '/g1'},
+        ]
+        self.asset.content = content
+        self.asset.save()
+        self.asset.deploy(backend='mock', active=True)
+        self.asset.save()
+        submission = OrderedDict(
+            (key, SUBMISSION_DATA[key][2]) for key in SUBMISSION_DATA
+        )
+        submission['group/Select_one'] = submission.pop('Select_one')
+        submission['__version__'] = self.asset.latest_deployed_version.uid
+        self.asset.deployment.mock_submissions([submission], flush_db=False)
+
+        survey_fields = get_survey_fields(self.asset)
+        assert survey_fields['Select_one'].changed_across_versions
+        assert survey_fields['Select_one'].root_xpaths == [
+            'group', 'Select_one'
+        ]
+
+        field_names = ['Select_one']
+        with override_settings(REPORTS_USE_MONGO_AGGREGATION=False):
+            expected = report_data.data_by_identifiers(
+                self.asset, field_names=field_names, user=self.user
+            )
+        values = report_data.data_by_identifiers(
+            self.asset, field_names=field_names, user=self.user
+        )
+        self.assertEqual(values, expected)
+        self.assertEqual(values[0]['data']['total_count'], 5)
+        self.assertEqual(values[0]['data']['not_provided'], 0)
+
+    def test_aggregated_stats_split_by_match_formpack(self):
+        field_names = ['Select_Many', 'Date']
+        with override_settings(REPORTS_USE_MONGO_AGGREGATION=False):
+            expected = report_data.data_by_identifiers(
+                self.asset,
+                field_names=field_names,
+                split_by='Select_one',
+                lang='Arabic',
+                user=self.user,
+            )
+        values = report_data.data_by_identifiers(
+            self.asset,
+            field_names=field_names,
+            split_by='Select_one',
+            lang='Arabic',
+            user=self.user,
+        )
+        self.assertEqual(values, expected)
+
+    @unittest.skipIf(
+        columnar_cache.duckdb is None,
+        '`pyarrow` and `duckdb` are not installed',
+    )
+    def test_columnar_cache_stats_match_formpack(self):
+        field_names = ['Select_one', 'Select_Many', 'Number', 'Decimal']
+        with override_settings(REPORTS_USE_MONGO_AGGREGATION=False):
+            expected = report_data.data_by_identifiers(
+                self.asset, field_names=field_names, user=self.user
+            )
+        root = tempfile.mkdtemp()
+        try:
+            with override_settings(
+                ANALYTICS_CACHE_ENABLED=True, ANALYTICS_CACHE_ROOT=root
+            ):
+                values = report_data.data_by_identifiers(
+                    self.asset, field_names=field_names, user=self.user
+                )
+                assert os.listdir(root)
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
+        self.assertEqual(
+            [v['name'] for v in values], [v['name'] for v in expected]
+        )
+        for value, expected_value in zip(values, expected):
+            for key, expected_stat in expected_value['data'].items():
+                if isinstance(expected_stat, float):
+                    self.assertAlmostEqual(value['data'][key], expected_stat)
+                else:
+                    self.assertEqual(value['data'][key], expected_stat)
+
+    @override_settings(REPORTS_CACHE_TIMEOUT=60)
+    def test_cached_report_data_refreshed_with_submissions(self):
+        field_names = ['Select_one']
+        with patch.object(
+            report_data,
+            'data_by_identifiers',
+            wraps=report_data.data_by_identifiers,
+        ) as data_by_identifiers:
+            values = report_data.cached_data_by_identifiers(
+                self.asset, field_names=field_names, user=self.user
+            )
+            self.assertEqual(values[0]['data']['total_count'], 4)
+            self.assertEqual(
+                report_data.cached_data_by_identifiers(
+                    self.asset, field_names=field_names, user=self.user
+                ),
+                values,
+            )
+            self.assertEqual(data_by_identifiers.call_count, 1)
+
+            submission = OrderedDict(
+                (key, SUBMISSION_DATA[key][0]) for key in SUBMISSION_DATA
+            )
+            submission['__version__'] = self.asset.latest_deployed_version.uid
+            self.asset.deployment.mock_submissions([submission], flush_db=False)
+
+            # Stale statistics are returned while they are refreshed in the
+            # background (synchronously in tests)
+            self.assertEqual(
+                report_data.cached_data_by_identifiers(
+                    self.asset, field_names=field_names, user=self.user
+                ),
+                values,
+            )
+            self.assertEqual(data_by_identifiers.call_count, 2)
+            values = report_data.cached_data_by_identifiers(
+                self.asset, field_names=field_names, user=self.user
+            )
+            self.assertEqual(values[0]['data']['total_count'], 5)
+            self.assertEqual(data_by_identifiers.call_count, 2)
+
+    @override_settings(REPORTS_CACHE_TIMEOUT=60)
+    def test_cached_report_data_read_from_primary(self):
+        # A secondary which has not replicated any submission yet
+        lagging_db = MockMongoClient('mongodb://fakehost/lagging')[
+            'formhub_test'
+        ]
+        with override_settings(MONGO_ANALYTICS_DB=lagging_db):
+            values = report_data.cached_data_by_identifiers(
+                self.asset, field_names=['Select_one'], user=self.user
+            )
+        self.assertEqual(values[0]['data']['total_count'], 4)
+
     def test_has_report_styles(self):
         self.assertTrue(self.asset.report_styles is not None)
 
@@ -1,7 +1,14 @@
 # coding: utf-8
+import csv
+import gzip
+import io
 import os
+import shutil
+import time
+import unittest
 import zipfile
 from collections import defaultdict
+from copy import deepcopy
 try:
     from zoneinfo import ZoneInfo
 except ImportError:
@@ -13,7 +20,8 @@ import openpyxl
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.urls import reverse
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from mongomock import MongoClient as MockMongoClient
 
 from kobo.apps.reports import report_data
 from kpi.constants import (
@@ -23,8 +31,10 @@ from kpi.constants import (
     PERM_VIEW_SUBMISSIONS,
 )
 from kpi.models import Asset, ExportTask
+from kpi.tasks import export_in_background
 from kpi.utils.object_permission import get_anonymous_user
 from kpi.utils.mongo_helper import drop_mock_only
+from kpi.utils.parquet_export import pa, pq
 
 
 class MockDataExportsBase(TestCase):
@@ -486,6 +496,25 @@ class MockDataExports(MockDataExportsBase):
                 ]
                 assert result_row == expected_row
 
+    def _get_exported_ids(self, export_task: ExportTask) -> list:
+        rows = list(
+            csv.reader(
+                io.TextIOWrapper(export_task.result.open('rb'), newline=''),
+                delimiter=';',
+            )
+        )
+        id_index = rows[0].index('_id')
+        return [row[id_index] for row in rows[1:] if row[id_index].isdigit()]
+
+    def _run_export(self, task_data: dict) -> ExportTask:
+        export_task = ExportTask()
+        export_task.user = self.user
+        export_task.data = deepcopy(task_data)
+        export_task.save()
+        export_task.run()
+        assert export_task.status == ExportTask.COMPLETE
+        return export_task
+
     def test_csv_export_default_options(self):
         version_uid = self.asset.latest_deployed_version.uid
         expected_lines = [
@@ -840,6 +869,288 @@ class MockDataExports(MockDataExportsBase):
         }
         self.run_xls_export_test(expected_data, asset=asset, repeat_group=True)
 
+    @override_settings(EXPORT_UPLOAD_CHUNK_SIZE=1024)
+    def test_xls_export_is_copied_to_storage_by_chunks(self):
+        export_task = ExportTask()
+        export_task.user = self.user
+        export_task.data = {
+            'source': reverse('asset-detail', args=[self.asset.uid]),
+            'type': 'xls',
+        }
+        messages = defaultdict(list)
+        with mock.patch(
+            'kpi.models.import_export_task.shutil.copyfileobj',
+            wraps=shutil.copyfileobj,
+        ) as patched_copyfileobj:
+            export_task._run_task(messages)
+
+        assert not messages
+        patched_copyfileobj.assert_called_once()
+        assert patched_copyfileobj.call_args.args[2] == 1024
+        assert export_task.result.size > 1024
+        book = openpyxl.load_workbook(export_task.result)
+        assert book[self.asset.name].max_row == 5
+
+    @unittest.skipIf(pq is None, '`pyarrow` is not installed')
+    def test_parquet_export(self):
+        export_task = ExportTask()
+        export_task.user = self.user
+        export_task.data = {
+            'source': reverse('asset-detail', args=[self.asset.uid]),
+            'type': 'parquet',
+            'lang': 'English',
+        }
+        messages = defaultdict(list)
+        export_task._run_task(messages)
+        assert not messages
+        assert export_task.result.name.endswith('.parquet')
+
+        with export_task.result.open('rb') as f:
+            table = pq.read_table(f)
+        assert table.column_names == [
+            'start',
+            'end',
+            'What kind of symmetry do you have?',
+            'What kind of symmetry do you have?/Spherical',
+            'What kind of symmetry do you have?/Radial',
+            'What kind of symmetry do you have?/Bilateral',
+            'How many segments does your body have?',
+            'Do you have body fluids that occupy intracellular space?',
+            'Do you descend from an ancestral unicellular organism?',
+            '_id',
+            '_uuid',
+            '_submission_time',
+            '_validation_status',
+            '_notes',
+            '_status',
+            '_submitted_by',
+            '__version__',
+            '_tags',
+            '_index',
+        ]
+        assert table.schema.field('_id').type == pa.int64()
+        assert table.column('_id').to_pylist() == [61, 62, 63]
+        assert table.column(
+            'How many segments does your body have?'
+        ).to_pylist() == [6, 3, 2]
+        assert table.column('start').to_pylist()[0] == datetime.datetime(
+            2017, 10, 23, 9, 40, 39, tzinfo=ZoneInfo('UTC')
+        )
+        assert table.column('_submission_time').to_pylist()[0] == (
+            datetime.datetime(2017, 10, 23, 9, 41, 19, tzinfo=ZoneInfo('UTC'))
+        )
+        assert table.column('_submitted_by').to_pylist() == [
+            None,
+            None,
+            'anotheruser',
+        ]
+
+    @unittest.skipIf(pq is None, '`pyarrow` is not installed')
+    def test_parquet_export_repeat_groups(self):
+        asset = self.assets['Simple repeat group']
+        export_task = ExportTask()
+        export_task.user = self.user
+        export_task.data = {
+            'source': reverse('asset-detail', args=[asset.uid]),
+            'type': 'parquet',
+        }
+        messages = defaultdict(list)
+        export_task._run_task(messages)
+        assert not messages
+        assert export_task.result.name.endswith('.zip')
+
+        result_zip = zipfile.ZipFile(export_task.result, 'r')
+        assert result_zip.namelist() == [
+            'Simple repeat group.parquet',
+            'person.parquet',
+        ]
+        table = pq.read_table(
+            io.BytesIO(result_zip.read('Simple repeat group.parquet'))
+        )
+        assert table.column('_id').to_pylist() == [9999]
+        assert table.column('_index').to_pylist() == [1]
+        table = pq.read_table(io.BytesIO(result_zip.read('person.parquet')))
+        assert table.num_rows == 2
+        assert table.column('name').to_pylist() == ['Julius Caesar', 'Augustus']
+        assert table.column('age').to_pylist() == [55, 75]
+        assert table.column('_parent_index').to_pylist() == [1, 1]
+        assert table.column('_submission__id').to_pylist() == [9999, 9999]
+
+    def test_compressed_csv_export(self):
+        task_data = {
+            'source': reverse('asset-detail', args=[self.asset.uid]),
+            'type': 'csv',
+        }
+        export_task = self._run_export(task_data)
+        with export_task.result.open('rb') as f:
+            expected_content = f.read()
+
+        gzip_export_task = self._run_export(
+            {**task_data, 'compression': 'gzip'}
+        )
+        assert gzip_export_task.result.name.endswith('.csv.gz')
+        with gzip_export_task.result.open('rb') as f:
+            assert gzip.decompress(f.read()) == expected_content
+
+        zip_export_task = self._run_export({**task_data, 'compression': 'zip'})
+        assert zip_export_task.result.name.endswith('.csv.zip')
+        with zip_export_task.result.open('rb') as f:
+            with zipfile.ZipFile(f) as zip_:
+                [filename] = zip_.namelist()
+                assert filename.endswith('.csv')
+                assert zip_.read(filename) == expected_content
+
+    def test_incremental_csv_export(self):
+        task_data = {
+            'source': reverse('asset-detail', args=[self.asset.uid]),
+            'type': 'csv',
+            'incremental': True,
+        }
+        # Nothing to start from, all submissions are exported
+        export_task = self._run_export(task_data)
+        assert self._get_exported_ids(export_task) == ['61', '62', '63']
+        assert export_task.data['last_submission_id'] == 63
+        assert 'incremental_since' not in export_task.data
+        export_task.date_created -= datetime.timedelta(hours=1)
+        export_task.save()
+
+        # Add a submission and validate an existing one
+        submission = deepcopy(self.forms[self.form_names[0]]['submissions'][0])
+        submission.update(
+            {'_id': 64, '_uuid': 'a7b4d1f7-3fd4-4a8e-9e5e-f9a8dc5b10b6'}
+        )
+        self.asset.deployment.mock_submissions([submission], flush_db=False)
+        settings.MONGO_DB.instances.update_one(
+            {'_id': 62},
+            {
+                '$set': {
+                    '_validation_status': {
+                        'uid': 'validation_status_approved',
+                        'timestamp': int(time.time()) - 60,
+                    }
+                }
+            },
+        )
+
+        export_task = self._run_export(task_data)
+        assert self._get_exported_ids(export_task) == ['62', '64']
+        assert export_task.data['last_submission_id'] == 64
+        assert export_task.data['incremental_since']['last_submission_id'] == 63
+
+        # Nothing has changed since
+        export_task = self._run_export(task_data)
+        assert self._get_exported_ids(export_task) == []
+        assert export_task.data['last_submission_id'] == 64
+
+        # Exports with other settings are not taken into account
+        export_task = self._run_export({**task_data, 'lang': '_xml'})
+        assert self._get_exported_ids(export_task) == ['61', '62', '63', '64']
+
+    def test_incremental_csv_export_merge(self):
+        task_data = {
+            'source': reverse('asset-detail', args=[self.asset.uid]),
+            'type': 'csv',
+            'incremental': True,
+            'incremental_merge': True,
+        }
+        full_export_task = self._run_export(task_data)
+        full_export_task.date_created -= datetime.timedelta(hours=1)
+        full_export_task.save()
+        settings.MONGO_DB.instances.update_one(
+            {'_id': 61},
+            {
+                '$set': {
+                    '_validation_status': {
+                        'uid': 'validation_status_approved',
+                        'timestamp': int(time.time()) - 60,
+                    }
+                }
+            },
+        )
+        settings.MONGO_DB.instances.delete_one({'_id': 63})
+
+        export_task = self._run_export(task_data)
+        assert 'incremental_since' in export_task.data
+        # Unmodified submissions are copied from the previous export, the
+        # modified one comes last, the deleted one is gone
+        assert self._get_exported_ids(export_task) == ['62', '61']
+        full_lines = list(full_export_task.result)
+        lines = list(export_task.result)
+        # Headers and tags
+        assert lines[:2] == full_lines[:2]
+        assert lines[2] == full_lines[3]
+
+    @override_settings(EXPORT_SHARD_SIZE=1, EXPORT_REUSE_ENABLED=False)
+    def test_sharded_csv_export(self):
+        task_data = {
+            'source': reverse('asset-detail', args=[self.asset.uid]),
+            'type': 'csv',
+        }
+        export_task = self._run_export(task_data)
+        sharded_export_task = ExportTask.objects.create(
+            user=self.user, data=deepcopy(task_data)
+        )
+        export_in_background(export_task_uid=sharded_export_task.uid)
+
+        sharded_export_task.refresh_from_db()
+        assert sharded_export_task.status == ExportTask.COMPLETE
+        shards = sharded_export_task.data['shards']
+        assert [(shard['lower_id'], shard['upper_id']) for shard in shards] == [
+            (None, 62),
+            (62, 63),
+            (63, None),
+        ]
+        assert all(shard['status'] == ExportTask.COMPLETE for shard in shards)
+        assert [shard['processed'] for shard in shards] == [1, 1, 1]
+        # Temporary files are removed
+        assert not any('file' in shard for shard in shards)
+        assert sharded_export_task.data['last_submission_id'] == 63
+        assert (
+            sharded_export_task.last_submission_time
+            == export_task.last_submission_time
+        )
+        # `_index` is numbered across shards
+        assert list(sharded_export_task.result) == list(export_task.result)
+
+    @override_settings(EXPORT_SHARD_SIZE=1, EXPORT_REUSE_ENABLED=False)
+    def test_sharded_xls_export_repeat_groups(self):
+        asset = self.assets['Simple repeat group']
+        submission = deepcopy(self.forms['Simple repeat group']['submissions'][0])
+        submission.update(
+            {'_id': 10000, '_uuid': '0b4b9e3a-3b0b-4a8e-9b9a-1e1ab7d2c1f5'}
+        )
+        asset.deployment.mock_submissions([submission], flush_db=False)
+        task_data = {
+            'source': reverse('asset-detail', args=[asset.uid]),
+            'type': 'xls',
+        }
+        export_task = self._run_export(task_data)
+        sharded_export_task = ExportTask.objects.create(
+            user=self.user, data=deepcopy(task_data)
+        )
+        export_in_background(export_task_uid=sharded_export_task.uid)
+
+        sharded_export_task.refresh_from_db()
+        assert sharded_export_task.status == ExportTask.COMPLETE
+        assert len(sharded_export_task.data['shards']) == 2
+
+        book = openpyxl.load_workbook(export_task.result)
+        sharded_book = openpyxl.load_workbook(sharded_export_task.result)
+        assert sharded_book.sheetnames == book.sheetnames
+        for sheet_name in book.sheetnames:
+            assert list(sharded_book[sheet_name].values) == list(
+                book[sheet_name].values
+            )
+        person_rows = list(sharded_book['person'].values)
+        header = person_rows[0]
+        assert [
+            (
+                row[header.index('_index')],
+                row[header.index('_parent_index')],
+            )
+            for row in person_rows[1:]
+        ] == [(1, 1), (2, 1), (3, 2), (4, 2)]
+
     def test_export_spss_labels(self):
         export_task = ExportTask()
         export_task.user = self.user
@@ -932,6 +1243,101 @@ class MockDataExports(MockDataExportsBase):
                 '\r\n'.join(content_lines)
             )
 
+    def test_export_is_reused_across_users_with_the_same_access(self):
+        task_data = {
+            'source': reverse('asset-detail', args=[self.asset.uid]),
+            'type': 'csv',
+        }
+        viewer = User.objects.create_user(username='viewer', password='viewer')
+        self.asset.assign_perm(viewer, PERM_VIEW_SUBMISSIONS)
+
+        def _run_export_as(user, data):
+            export_task = ExportTask.objects.create(
+                user=user, data=deepcopy(data)
+            )
+            export_task.run()
+            assert export_task.status == ExportTask.COMPLETE
+            return export_task
+
+        export_task = _run_export_as(self.user, task_data)
+        assert 'reused_export' not in export_task.data
+
+        # Same settings (defaults are implied) and same access: the file is
+        # reused
+        reused_export_task = _run_export_as(
+            viewer, {**task_data, 'multiple_select': 'both'}
+        )
+        assert reused_export_task.data['reused_export'] == export_task.uid
+        assert reused_export_task.result.name == export_task.result.name
+        assert (
+            reused_export_task.data['last_submission_id']
+            == export_task.data['last_submission_id']
+        )
+
+        # The file is stored under the username of the first user, but
+        # `viewer` can download it through their own export
+        self.client.force_login(viewer)
+        response = self.client.get(reused_export_task.result.url)
+        assert response.status_code == 200
+        with export_task.result.open('rb') as f:
+            assert b''.join(response.streaming_content) == f.read()
+
+        # Partial access
+        partial_export_task = _run_export_as(self.anotheruser, task_data)
+        assert 'reused_export' not in partial_export_task.data
+        assert self._get_exported_ids(partial_export_task) == ['63']
+        # Exports of others stay private to users who have not exported the
+        # same content
+        self.client.force_login(self.anotheruser)
+        response = self.client.get(export_task.result.url)
+        assert response.status_code == 403
+
+        # Other settings
+        xml_export_task = _run_export_as(viewer, {**task_data, 'lang': '_xml'})
+        assert 'reused_export' not in xml_export_task.data
+
+        # New submission
+        submission = deepcopy(self.forms[self.form_names[0]]['submissions'][0])
+        submission.update(
+            {'_id': 64, '_uuid': 'a7b4d1f7-3fd4-4a8e-9e5e-f9a8dc5b10b6'}
+        )
+        self.asset.deployment.mock_submissions([submission], flush_db=False)
+        new_export_task = _run_export_as(viewer, task_data)
+        assert 'reused_export' not in new_export_task.data
+        assert self._get_exported_ids(new_export_task) == [
+            '61', '62', '63', '64'
+        ]
+
+        # The file is kept as long as an export uses it
+        storage = export_task.result.storage
+        filename = export_task.result.name
+        export_task.delete()
+        assert storage.exists(filename)
+        reused_export_task.delete()
+        assert not storage.exists(filename)
+
+    def test_content_keyed_exports_are_read_from_the_primary(self):
+        task_data = {
+            'source': reverse('asset-detail', args=[self.asset.uid]),
+            'type': 'csv',
+        }
+        # A secondary which has not replicated any submission yet
+        lagging_db = MockMongoClient('mongodb://fakehost/lagging')[
+            'formhub_test'
+        ]
+
+        with override_settings(MONGO_ANALYTICS_DB=lagging_db):
+            export_task = self._run_export(task_data)
+            assert export_task.content_key
+            assert self._get_exported_ids(export_task) == ['61', '62', '63']
+
+            # Without reuse, the result is not found by its content key and
+            # is read like any heavy workload
+            with override_settings(EXPORT_REUSE_ENABLED=False):
+                export_task = self._run_export(task_data)
+            assert not export_task.content_key
+            assert self._get_exported_ids(export_task) == []
+
     def test_remove_excess_exports(self):
         task_data = {
             'source': reverse('asset-detail', args=[self.asset.uid]),
@@ -961,7 +1367,11 @@ class MockDataExports(MockDataExportsBase):
         # Identify which exports should be kept
         export_tasks_to_keep = created_export_tasks.order_by('-date_created')[
             :settings.MAXIMUM_EXPORTS_PER_USER_PER_FORM]
-        # Call `run()` once more since it invokes the cleanup logic
+        # Call `run()` once more since it invokes the cleanup logic. Its
+        # content must differ from the first export, which would be reused
+        # otherwise
+        export_task.data = {**task_data, 'lang': '_xml'}
+        export_task.save()
         export_task.run()
         self.assertEqual(export_task.status, ExportTask.COMPLETE)
         # Verify the cleanup
@@ -1015,6 +1425,99 @@ class MockDataExports(MockDataExportsBase):
             ).order_by('pk').values_list('status', flat=True),
         )
 
+    def test_log_and_mark_stuck_exports_as_errored_spares_slow_exports(self):
+        task_data = {
+            'source': reverse('asset-detail', args=[self.asset.uid]),
+            'type': 'csv',
+        }
+        # Both exports are old enough to be stuck, but the second one is still
+        # recording its progress
+        progress_dates = [
+            datetime.datetime.now(datetime.timezone.utc)
+            - datetime.timedelta(seconds=settings.EXPORT_STALLED_TIMEOUT + 1),
+            datetime.datetime.now(datetime.timezone.utc),
+        ]
+        for progress_date in progress_dates:
+            export_task = ExportTask.objects.create(
+                user=self.user,
+                data={
+                    **task_data,
+                    'progress': {
+                        'processed': 1,
+                        'date_modified': progress_date.isoformat(),
+                    },
+                },
+                status=ExportTask.PROCESSING,
+            )
+            export_task.date_created -= datetime.timedelta(days=1)
+            export_task.save()
+
+        ExportTask.log_and_mark_stuck_as_errored(
+            self.user, task_data['source']
+        )
+        self.assertSequenceEqual(
+            [ExportTask.ERROR, ExportTask.PROCESSING],
+            ExportTask.objects.filter(
+                user=self.user, data__source=task_data['source']
+            ).order_by('pk').values_list('status', flat=True),
+        )
+
+    @override_settings(EXPORT_PROGRESS_INTERVAL=0)
+    def test_export_records_progress(self):
+        task_data = {
+            'source': reverse('asset-detail', args=[self.asset.uid]),
+            'type': 'csv',
+        }
+        # Short exports do not count the submissions beforehand
+        with mock.patch.object(
+            type(self.asset.deployment), 'calculated_submission_count'
+        ) as calculated_submission_count:
+            export_task = self._run_export(task_data)
+        calculated_submission_count.assert_not_called()
+        progress = ExportTask.objects.get(pk=export_task.pk).data['progress']
+        assert progress['processed'] == 3
+        assert progress['total'] == 3
+        assert progress['bytes_written'] == export_task.result.size
+        assert progress['date_modified']
+
+        with override_settings(EXPORT_PROGRESS_INTERVAL=0):
+            export_task = self._run_export({**task_data, 'lang': '_xml'})
+        progress = ExportTask.objects.get(pk=export_task.pk).data['progress']
+        assert progress['processed'] == 3
+        assert progress['total'] == 3
+
+    def test_cancel_export(self):
+        task_data = {
+            'source': reverse('asset-detail', args=[self.asset.uid]),
+            'type': 'csv',
+        }
+        # Cancelled while waiting in the queue
+        export_task = ExportTask.objects.create(
+            user=self.user, data=deepcopy(task_data)
+        )
+        assert export_task.cancel()
+        assert export_task.status == ExportTask.ERROR
+        export_in_background(export_task_uid=export_task.uid)
+        export_task.refresh_from_db()
+        assert export_task.status == ExportTask.ERROR
+        assert not export_task.result
+        # Finished exports cannot be cancelled
+        assert not export_task.cancel()
+
+        # Cancelled while being processed: the export stops the next time it
+        # records its progress
+        export_task = ExportTask.objects.create(
+            user=self.user, data=deepcopy(task_data)
+        )
+        ExportTask.objects.filter(pk=export_task.pk).update(
+            data={**task_data, 'cancel_requested': True}
+        )
+        export_task.run()
+        export_task.refresh_from_db()
+        assert export_task.status == ExportTask.ERROR
+        assert export_task.messages['error_type'] == 'Cancelled'
+        assert not export_task.result
+
     def test_export_long_form_title(self):
         what_a_title = (
             'the quick brown fox jumped over the lazy dog and jackdaws love '
@@ -0,0 +1,114 @@
+# coding: utf-8
+from datetime import date
+
+from django.conf import settings
+from django.test import TestCase
+
+from kpi.utils.mongo_helper import MongoHelper, drop_mock_only
+
+
+class MongoDailyCountsTestCase(TestCase):
+
+    USERFORM_ID = 'someuser_abc'
+
+    def setUp(self):
+        self._drop_daily_counts()
+        settings.MONGO_DB.instances.delete_many(
+            {'_userform_id': self.USERFORM_ID}
+        )
+        self._add_submissions(
+            [
+                ('2023-06-01T08:00:00', 'alice'),
+                ('2023-06-01T17:00:00', 'bob'),
+                ('2023-06-02T09:00:00', 'alice'),
+            ]
+        )
+
+    def tearDown(self):
+        self._drop_daily_counts()
+        settings.MONGO_DB.instances.delete_many(
+            {'_userform_id': self.USERFORM_ID}
+        )
+
+    def test_counts_are_refreshed_incrementally(self):
+        assert MongoHelper.get_daily_counts(self.USERFORM_ID, version='1') == {
+            '2023-06-01': 2,
+            '2023-06-02': 1,
+        }
+
+        self._add_submissions([('2023-06-03T10:00:00', 'bob')])
+        # Same version, stored counts are not refreshed
+        assert MongoHelper.get_daily_counts(self.USERFORM_ID, version='1') == {
+            '2023-06-01': 2,
+            '2023-06-02': 1,
+        }
+        assert MongoHelper.get_daily_counts(self.USERFORM_ID, version='2') == {
+            '2023-06-01': 2,
+            '2023-06-02': 1,
+            '2023-06-03': 1,
+        }
+        state = settings.MONGO_DB[
+            MongoHelper.DAILY_COUNTS_STATE_COLLECTION
+        ].find_one({'_id': self.USERFORM_ID})
+        assert state['total'] == 4
+        # Like KoBoCAT's integers, generated `ObjectId`s are increasing
+        last_submission = settings.MONGO_DB.instances.find_one(
+            {'_userform_id': self.USERFORM_ID}, sort=[('_id', -1)]
+        )
+        assert state['last_id'] == last_submission['_id']
+
+    def test_submissions_received_within_the_same_second_are_counted(self):
+        assert MongoHelper.get_daily_counts(self.USERFORM_ID, version='1') == {
+            '2023-06-01': 2,
+            '2023-06-02': 1,
+        }
+        self._add_submissions([('2023-06-02T09:00:00', 'bob')])
+        assert MongoHelper.get_daily_counts(self.USERFORM_ID, version='2') == {
+            '2023-06-01': 2,
+            '2023-06-02': 2,
+        }
+
+    def test_counts_with_timeframe_and_permission_filters(self):
+        timeframe = (date(2023, 6, 2), date(2023, 6, 30))
+        assert MongoHelper.get_daily_counts(self.USERFORM_ID, timeframe) == {
+            '2023-06-02': 1,
+        }
+
+        permission_filters = [{'_submitted_by': 'bob'}]
+        assert MongoHelper.are_daily_counts_filterable(permission_filters)
+        assert MongoHelper.get_daily_counts(
+            self.USERFORM_ID, permission_filters=permission_filters
+        ) == {'2023-06-01': 1}
+        assert not MongoHelper.are_daily_counts_filterable(
+            [{'_submitted_by': 'bob', 'q1': 'yes'}]
+        )
+
+    def test_counts_are_rebuilt_after_deletion(self):
+        assert MongoHelper.get_daily_counts(self.USERFORM_ID) == {
+            '2023-06-01': 2,
+            '2023-06-02': 1,
+        }
+        settings.MONGO_DB.instances.delete_one(
+            {'_userform_id': self.USERFORM_ID, '_submitted_by': 'bob'}
+        )
+        assert MongoHelper.get_daily_counts(self.USERFORM_ID) == {
+            '2023-06-01': 1,
+            '2023-06-02': 1,
+        }
+
+    @drop_mock_only
+    def _drop_daily_counts(self):
+        settings.MONGO_DB[MongoHelper.DAILY_COUNTS_COLLECTION].drop()
+        settings.MONGO_DB[MongoHelper.DAILY_COUNTS_STATE_COLLECTION].drop()
+
+    def _add_submissions(self, submissions: list):
+        settings.MONGO_DB.instances.insert_many(
+            [
+                {
+                    '_userform_id': self.USERFORM_ID,
+                    '_submission_time': submission_time,
+                    '_submitted_by': submitted_by,
+                }
+                for submission_time, submitted_by in submissions
+            ]
+        )
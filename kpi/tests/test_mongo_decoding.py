@@ -1,4 +1,6 @@
 # coding: utf-8
+from copy import deepcopy
+
 from django.conf import settings
 from django.test import TestCase
 
@@ -153,3 +155,30 @@ class MongoBase64Decoding(TestCase):
         decoded = list(get_instances_from_mongo())
         expected_results = decoded_results
         self.assertEqual(decoded, expected_results)
+
+    def test_key_codec_matches_to_readable_dict(self):
+        encoded_result = {
+            '_id': 190,
+            'dotLg==dotLg==dot': 'lorem',
+            'JA==dollar': 'ipsum',
+            'dottyLg==dotLg==group': [
+                {'dottyLg==dotLg==group/dottyLg==dotLg==inLg==aLg==group': 'a'},
+                {'dottyLg==dotLg==group/dottyLg==dotLg==inLg==aLg==group': 'b'},
+            ],
+            '_validation_status': {'by_whom': 'someuser'},
+            'regular': '1.3',
+        }
+        key_codec = MongoHelper.get_key_codec('someuser_afgNxNby4VxHJ4STM2LmVz')
+        self.assertIs(
+            key_codec, MongoHelper.get_key_codec('someuser_afgNxNby4VxHJ4STM2LmVz')
+        )
+        expected_result = MongoHelper.to_readable_dict(deepcopy(encoded_result))
+        # Run twice to decode with both the regular expressions and the
+        # already decoded keys
+        for _ in range(2):
+            self.assertEqual(
+                key_codec.to_readable_dict(deepcopy(encoded_result)),
+                expected_result,
+            )
+        self.assertEqual(key_codec.decode('dotLg==dotLg==dot'), 'dot.dot.dot')
+        self.assertEqual(key_codec.decode('regular'), 'regular')
@@ -0,0 +1,68 @@
+# coding: utf-8
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, override_settings
+
+from kpi.utils.mongo_helper import MongoHelper, drop_mock_only
+
+
+class MongoIndexesTestCase(TestCase):
+
+    def setUp(self):
+        # Discard the sorts recorded by other tests
+        MongoHelper.flush_query_shapes()
+        self._drop_indexes_and_query_shapes()
+
+    def tearDown(self):
+        self._drop_indexes_and_query_shapes()
+
+    def test_sync_creates_missing_indexes(self):
+        assert len(MongoHelper.get_missing_indexes()) == len(
+            MongoHelper.REQUIRED_INDEXES
+        )
+        with self.assertRaises(CommandError):
+            call_command('sync_mongo_indexes', check=True, verbosity=0)
+
+        call_command('sync_mongo_indexes', verbosity=0)
+        assert MongoHelper.get_missing_indexes() == []
+        call_command('sync_mongo_indexes', check=True, verbosity=0)
+
+    @override_settings(MONGO_QUERY_SHAPES_FLUSH_INTERVAL=60)
+    def test_recommended_indexes_from_sorts(self):
+        for _ in range(3):
+            MongoHelper.record_query_shape('someuser_abc', 'q1')
+        MongoHelper.record_query_shape('someuser_abc', 'q2')
+        # Sorting by a field covered by required indexes is not recorded
+        MongoHelper.record_query_shape('someuser_abc', '_submission_time')
+        # Sorts are only counted in memory until they are flushed
+        assert MongoHelper.get_recommended_indexes(min_count=1) == []
+        MongoHelper.flush_query_shapes()
+
+        recommended_indexes = MongoHelper.get_recommended_indexes(min_count=1)
+        assert [
+            (index['keys'], count) for index, count in recommended_indexes
+        ] == [
+            ([('q1', 1), ('_id', 1)], 3),
+            ([('q2', 1), ('_id', 1)], 1),
+        ]
+        assert recommended_indexes[0][0]['partialFilterExpression'] == {
+            '_userform_id': 'someuser_abc'
+        }
+
+        call_command(
+            'sync_mongo_indexes',
+            create_recommended=True,
+            min_count=2,
+            verbosity=0,
+        )
+        assert len(MongoHelper.get_query_shape_index_names()) == 1
+        # Only the index for `q2`, not frequent enough, is still recommended
+        recommended_indexes = MongoHelper.get_recommended_indexes(min_count=1)
+        assert len(recommended_indexes) == 1
+        assert recommended_indexes[0][0]['keys'] == [('q2', 1), ('_id', 1)]
+
+    @drop_mock_only
+    def _drop_indexes_and_query_shapes(self):
+        settings.MONGO_DB.instances.drop_indexes()
+        settings.MONGO_DB[MongoHelper.QUERY_SHAPES_COLLECTION].drop()
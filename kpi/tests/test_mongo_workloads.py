@@ -0,0 +1,42 @@
+# coding: utf-8
+from django.conf import settings
+from django.test import SimpleTestCase, override_settings
+from mongomock import MongoClient as MockMongoClient
+
+from kpi.utils.mongo_helper import MongoHelper
+
+ANALYTICS_DB = MockMongoClient('mongodb://fakehost/analytics')['formhub_test']
+
+
+@override_settings(
+    MONGO_ANALYTICS_DB=ANALYTICS_DB,
+    MONGO_QUERY_TIMEOUT=10,
+    MONGO_ANALYTICS_QUERY_TIMEOUT=600,
+)
+class MongoWorkloadsTestCase(SimpleTestCase):
+
+    def test_interactive_reads_use_default_client(self):
+        assert MongoHelper.get_instances_collection().database is (
+            settings.MONGO_DB
+        )
+        assert MongoHelper.get_max_time_ms() == 10 * 1000
+
+    def test_analytics_reads_use_dedicated_client(self):
+        with MongoHelper.analytics_workload():
+            assert MongoHelper.get_instances_collection().database is (
+                ANALYTICS_DB
+            )
+            assert MongoHelper.get_max_time_ms() == 600 * 1000
+
+        # Back to the default client once the workload is over
+        assert MongoHelper.get_instances_collection().database is (
+            settings.MONGO_DB
+        )
+
+    def test_analytics_workload_as_decorator(self):
+        @MongoHelper.analytics_workload()
+        def _get_database():
+            return MongoHelper.get_instances_collection().database
+
+        assert _get_database() is ANALYTICS_DB
+        assert _get_database() is ANALYTICS_DB
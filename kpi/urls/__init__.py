@@ -1,5 +1,4 @@
 # coding: utf-8
-import private_storage.urls
 from django.conf import settings
 from django.urls import include, re_path, path
 from django.views.i18n import JavaScriptCatalog
@@ -18,6 +17,7 @@ from kobo.apps.accounts.mfa.views import (
 from kpi.views import authorized_application_authenticate_user
 from kpi.views import home, browser_tests, design_system, modern_browsers
 from kpi.views.environment import EnvironmentView
+from kpi.views.private_storage import CompressedExportPrivateStorageView
 from kpi.views.current_user import CurrentUserViewSet
 from kpi.views.token import TokenView
 
@@ -70,7 +70,12 @@ urlpatterns = [
     path('environment/', EnvironmentView.as_view(), name='environment'),
     re_path(r'^configurationfile/(?P<slug>[^/]+)/?',
             ConfigurationFile.content_view, name='configurationfile'),
-    re_path(r'^private-media/', include(private_storage.urls)),
+    # Replaces `private_storage.urls`
+    re_path(
+        r'^private-media/(?P<path>.*)$',
+        CompressedExportPrivateStorageView.as_view(),
+        name='serve_private_file',
+    ),
     # Statistics for superusers
     re_path(r'^superuser_stats/', include(('kobo.apps.superuser_stats.urls', 'superuser_stats'))),
     path('app_info/', OCAppInfoView.as_view(), name='app_info'),
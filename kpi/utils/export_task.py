@@ -1,7 +1,83 @@
 # coding: utf-8
+import datetime
+import json
+
+from formpack.constants import VALID_EXPORT_TYPES as FORMPACK_EXPORT_TYPES
+
+# Export settings handled by KPI, see `ExportTaskBase`
+EXPORT_SETTING_COMPRESSION = 'compression'
+EXPORT_SETTING_INCREMENTAL = 'incremental'
+EXPORT_SETTING_INCREMENTAL_MERGE = 'incremental_merge'
+
+# Text exports can be compressed as they are written
+COMPRESSIBLE_EXPORT_TYPES = ['csv', 'geojson']
+VALID_EXPORT_COMPRESSIONS = ['gzip', 'zip']
+
+# Parquet exports are written by KPI, see `ParquetExportWriter`
+VALID_EXPORT_TYPES = [*FORMPACK_EXPORT_TYPES, 'parquet']
+
+# Types of the values of formpack rows which JSON does not support, see
+# `dumps_export_chunk()`
+_CHUNK_VALUE_TYPES = {
+    '$datetime': datetime.datetime,
+    '$date': datetime.date,
+    '$time': datetime.time,
+}
+
+
+def dumps_export_chunk(chunk: dict) -> str:
+    """
+    Serialize a chunk of rows yielded by
+    `formpack.reporting.Export.parse_submissions()` to a single line of JSON,
+    preserving the type of date and time values
+    """
+
+    def _default(value):
+        # `datetime` is a subclass of `date`, it must be checked first
+        for key, type_ in _CHUNK_VALUE_TYPES.items():
+            if isinstance(value, type_):
+                return {key: value.isoformat()}
+        raise TypeError(
+            f'Object of type {type(value).__name__} is not JSON serializable'
+        )
+
+    return json.dumps(chunk, default=_default)
+
+
+def loads_export_chunk(line: str) -> dict:
+    """
+    Deserialize a chunk of rows serialized by `dumps_export_chunk()`
+    """
+
+    def _object_hook(obj: dict):
+        if len(obj) == 1:
+            key, value = next(iter(obj.items()))
+            if key in _CHUNK_VALUE_TYPES:
+                return _CHUNK_VALUE_TYPES[key].fromisoformat(value)
+        return obj
+
+    return json.loads(line, object_hook=_object_hook)
+
+
+class WriteOnlyFile:
+    """
+    Expose only the `write()` and `flush()` methods of a file, for `zipfile`
+    to stream the members of an archive (followed by data descriptors)
+    instead of seeking back to rewrite their headers, which files of remote
+    storages do not support
+    """
+
+    def __init__(self, file):
+        self._file = file
+
+    def write(self, data: bytes) -> int:
+        return self._file.write(data)
+
+    def flush(self):
+        self._file.flush()
+
 
 def format_exception_values(values: list, sep: str = 'or') -> str:
     return "{} {} '{}'".format(
         ', '.join([f"'{v}'" for v in values[:-1]]), sep, values[-1]
     )
-
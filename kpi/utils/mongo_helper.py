@@ -1,15 +1,43 @@
 # coding: utf-8
 from __future__ import annotations
 
+import base64
+import binascii
+import json
+import math
 import re
-from typing import Union
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import date
+from functools import lru_cache
+from typing import Any, Optional, Union
 
+from bson import json_util
 from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError, PyMongoError
 
 from kobo.celery import celery_app
 from kpi.constants import NESTED_MONGO_RESERVED_ATTRIBUTES
+from kpi.utils.hash import calculate_hash
+from kpi.utils.log import logging
 from kpi.utils.strings import base64_encodestring
 
+# Whether submissions are read for a heavy workload, see
+# `MongoHelper.analytics_workload()`
+_analytics_workload = ContextVar('mongo_analytics_workload', default=False)
+
+# Sorts counted since the last write to MongoDB, see
+# `MongoHelper.record_query_shape()`
+_query_shapes = Counter()
+_query_shapes_lock = threading.Lock()
+_query_shapes_flushed_at = time.monotonic()
+
 
 def drop_mock_only(func):
     """
@@ -66,8 +94,122 @@ class MongoHelper:
 
     # Match KoBoCAT's variables of ParsedInstance class
     USERFORM_ID = '_userform_id'
+    # First geopoint of submissions, as `[latitude, longitude]`
+    GEOLOCATION = '_geolocation'
     DEFAULT_BATCHSIZE = 1000
 
+    COUNT_CACHE_KEY_PREFIX = 'mongo_count'
+    KEY_CODEC_CACHE_SIZE = 256
+
+    # Compound indexes submission queries rely on. Every query filters on
+    # `_userform_id`, see `_get_cursor_and_count()`
+    REQUIRED_INDEXES = [
+        [(USERFORM_ID, 1), ('_id', 1)],
+        [(USERFORM_ID, 1), ('_submission_time', 1)],
+        [(USERFORM_ID, 1), ('_submitted_by', 1)],
+        [(USERFORM_ID, 1), ('_uuid', 1)],
+        [(USERFORM_ID, 1), ('_validation_status.uid', 1)],
+        # Bounding boxes of `get_geo_clusters_pipeline()`
+        [(USERFORM_ID, 1), (f'{GEOLOCATION}.0', 1), (f'{GEOLOCATION}.1', 1)],
+    ]
+    # Collection where the fields submissions are sorted by are recorded.
+    # See `record_query_shape()`
+    QUERY_SHAPES_COLLECTION = 'kpi_query_shapes'
+    QUERY_SHAPE_INDEX_PREFIX = 'kpi_sort_'
+    # Collections where the number of submissions per day and submitter of
+    # each form, and how far they have been counted, are stored.
+    # See `refresh_daily_counts()`
+    DAILY_COUNTS_COLLECTION = 'kpi_daily_submission_counts'
+    DAILY_COUNTS_STATE_COLLECTION = 'kpi_daily_submission_counts_state'
+    # Number of cells per side of a map tile, see `get_geo_clusters_pipeline()`
+    GEO_CLUSTER_CELLS_PER_TILE = 8
+
+    @classmethod
+    def aggregate(
+        cls,
+        mongo_userform_id: str,
+        pipeline: list,
+        query: Optional[dict] = None,
+        submission_ids: Optional[list] = None,
+        permission_filters: Optional[list] = None,
+        **kwargs,
+    ) -> list:
+        """
+        Run the aggregation `pipeline` on the submissions of
+        `mongo_userform_id` which match `query`, `submission_ids` and
+        `permission_filters`, and return its results.
+        Field names used in `pipeline` must already be safe for Mongo.
+        """
+        match_query = cls.get_query(
+            mongo_userform_id,
+            query or {},
+            submission_ids or [],
+            permission_filters,
+        )
+        return list(
+            cls.get_instances_collection().aggregate(
+                [{'$match': match_query}] + pipeline,
+                allowDiskUse=True,
+                maxTimeMS=cls.get_max_time_ms(),
+            )
+        )
+
+    @classmethod
+    @contextmanager
+    def analytics_workload(cls):
+        """
+        Read submissions with the client dedicated to heavy workloads (e.g.
+        exports, reports) within this context, i.e. from secondaries if
+        possible, with their own connection pool and timeout. Can also be used
+        as a decorator.
+
+        Interactive requests keep reading from the primary.
+        """
+        token = _analytics_workload.set(True)
+        try:
+            yield
+        finally:
+            _analytics_workload.reset(token)
+
+    @classmethod
+    def are_daily_counts_filterable(cls, permission_filters: list) -> bool:
+        """
+        Return whether `permission_filters` only narrow down submissions by
+        submitter, and thus can be applied to stored daily counts.
+        """
+        def _is_filterable(filter_):
+            if isinstance(filter_, list):
+                return all(_is_filterable(f) for f in filter_)
+            if not isinstance(filter_, dict):
+                return False
+            for key, value in filter_.items():
+                if key in (cls.AND_OPERATOR, cls.OR_OPERATOR):
+                    if not _is_filterable(value):
+                        return False
+                elif key != '_submitted_by':
+                    return False
+            return True
+
+        return _is_filterable(permission_filters)
+
+    @classmethod
+    def create_indexes(cls, indexes: list[dict]) -> list[str]:
+        """
+        Create `indexes` on the submission collection and return their names.
+        Each index is a dict of the arguments of `Collection.create_index()`,
+        e.g. `{'keys': [('_userform_id', 1), ('_id', 1)]}`.
+        """
+        names = []
+        for index in indexes:
+            options = dict(index)
+            keys = options.pop('keys')
+            names.append(
+                settings.MONGO_DB.instances.create_index(
+                    keys, background=True, **options
+                )
+            )
+        return names
+
     @classmethod
     def decode(cls, key):
         """
@@ -81,6 +223,34 @@ class MongoHelper:
             key = re.sub(pattern, repl, key)
         return key
 
+    @classmethod
+    def decode_cursor(cls, cursor: str) -> dict:
+        """
+        Decode an opaque keyset pagination cursor built by `encode_cursor()`.
+        An empty cursor stands for the first page and is decoded as an empty
+        dict.
+
+        Raise a `ValueError` if `cursor` cannot be decoded.
+        """
+        if not cursor:
+            return {}
+
+        try:
+            decoded_cursor = json_util.loads(
+                base64.urlsafe_b64decode(cursor.encode()).decode()
+            )
+        except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError):
+            raise ValueError('Invalid cursor')
+
+        if (
+            not isinstance(decoded_cursor, dict)
+            or '_id' not in decoded_cursor
+            or not isinstance(decoded_cursor.get('sort'), list)
+        ):
+            raise ValueError('Invalid cursor')
+
+        return decoded_cursor
+
     @classmethod
     def delete(cls, mongo_userform_id: str, submission_ids: list):
         query = {
@@ -101,6 +271,35 @@ class MongoHelper:
             key = re.sub(pattern, repl, key)
         return key
 
+    @classmethod
+    def encode_cursor(cls, submission: dict, sort: Optional[dict] = None) -> str:
+        """
+        Build an opaque keyset pagination cursor which points right after
+        `submission`, i.e. the last (readable) submission of a page.
+
+        The cursor contains the `_id` of the submission and, when results are
+        sorted by another field, the value of that field.
+        """
+        sort_key, sort_dir = cls.get_sort_key_and_direction(sort)
+        payload = {
+            '_id': submission['_id'],
+            'sort': [sort_key, sort_dir],
+        }
+        if sort_key != '_id':
+            if sort_key in submission:
+                value = submission[sort_key]
+            else:
+                # Dotted reserved attributes (e.g. `_validation_status.uid`)
+                # are nested dicts in submissions
+                value = submission
+                for part in sort_key.split('.'):
+                    value = value.get(part) if isinstance(value, dict) else None
+            payload['value'] = value
+
+        return base64.urlsafe_b64encode(
+            json_util.dumps(payload).encode()
+        ).decode()
+
     @classmethod
     def get_count(
         cls,
@@ -108,16 +307,144 @@ class MongoHelper:
         query=None,
         submission_ids=None,
         permission_filters=None,
+        count_cache_version=None,
     ):
         _, total_count = cls._get_cursor_and_count(
             mongo_userform_id,
             fields={'_id': 1},
             query=query,
             submission_ids=submission_ids,
-            permission_filters=permission_filters)
+            permission_filters=permission_filters,
+            count_cache_version=count_cache_version,
+        )
 
         return total_count
 
+    @classmethod
+    def get_daily_counts(
+        cls,
+        mongo_userform_id: str,
+        timeframe: Optional[tuple[date, date]] = None,
+        permission_filters: Optional[list] = None,
+        version: Optional[str] = None,
+    ) -> dict:
+        """
+        Return the number of submissions of `mongo_userform_id` per day
+        (`YYYY-MM-DD`) within `timeframe` (all days if omitted), from the
+        stored daily counts. `permission_filters`, if any, must only filter
+        on `_submitted_by` (see `are_daily_counts_filterable()`).
+        `version` is passed to `refresh_daily_counts()`.
+        """
+        cls.refresh_daily_counts(mongo_userform_id, version)
+
+        query = {cls.USERFORM_ID: mongo_userform_id}
+        if timeframe:
+            query['date'] = {
+                '$gte': str(timeframe[0]),
+                '$lte': str(timeframe[1]),
+            }
+        if permission_filters is not None:
+            query = cls.get_permission_filters_query(query, permission_filters)
+
+        documents = settings.MONGO_DB[cls.DAILY_COUNTS_COLLECTION].aggregate(
+            [
+                {'$match': query},
+                {'$group': {'_id': '$date', 'count': {'$sum': '$count'}}},
+            ],
+            maxTimeMS=cls.get_max_time_ms(),
+        )
+        return {doc['_id']: doc['count'] for doc in documents if doc['count']}
+
+    @classmethod
+    def get_geo_clusters_pipeline(
+        cls, bbox: tuple[float, float, float, float], zoom: int
+    ) -> list:
+        """
+        Return an aggregation pipeline which groups the submissions located
+        within `bbox` (min. longitude, min. latitude, max. longitude,
+        max. latitude) by cells of a grid matching the map `zoom` level.
+
+        Each result contains the number of submissions of its cell and their
+        average location. The id of the submission is also returned for cells
+        which contain only one.
+        """
+        min_lon, min_lat, max_lon, max_lat = bbox
+        # Each map tile is split in `GEO_CLUSTER_CELLS_PER_TILE` cells per side
+        cell_size = 360 / (2 ** zoom * cls.GEO_CLUSTER_CELLS_PER_TILE)
+        lat_key = f'{cls.GEOLOCATION}.0'
+        lon_key = f'{cls.GEOLOCATION}.1'
+        latitude = {'$arrayElemAt': [f'${cls.GEOLOCATION}', 0]}
+        longitude = {'$arrayElemAt': [f'${cls.GEOLOCATION}', 1]}
+
+        match_query = {lat_key: {'$gte': min_lat, '$lte': max_lat}}
+        if min_lon <= max_lon:
+            match_query[lon_key] = {'$gte': min_lon, '$lte': max_lon}
+        else:
+            # Bounding box crosses the antimeridian
+            match_query[cls.OR_OPERATOR] = [
+                {lon_key: {'$gte': min_lon}},
+                {lon_key: {'$lte': max_lon}},
+            ]
+
+        return [
+            {'$match': match_query},
+            {
+                '$group': {
+                    '_id': {
+                        'lat': {'$floor': {'$divide': [latitude, cell_size]}},
+                        'lon': {'$floor': {'$divide': [longitude, cell_size]}},
+                    },
+                    'count': {'$sum': 1},
+                    'latitude': {'$avg': latitude},
+                    'longitude': {'$avg': longitude},
+                    'submission_id': {'$first': '$_id'},
+                }
+            },
+            {'$sort': {'count': -1}},
+        ]
+
+    @classmethod
+    def get_id_boundaries(
+        cls, mongo_userform_id: str, range_size: int, max_ranges: int
+    ) -> list[int]:
+        """
+        Return the `_id`s which split the submissions of `mongo_userform_id`,
+        ordered by `_id`, into ranges of at least `range_size` submissions
+        (but at most `max_ranges` ranges). Each range starts at a boundary
+        (included) and ends at the next one (excluded); the first and last
+        ones are unbounded. An empty list means a single range.
+        """
+        collection = cls.get_instances_collection()
+        query = {cls.USERFORM_ID: mongo_userform_id}
+        count = collection.count_documents(
+            query, maxTimeMS=cls.get_max_time_ms()
+        )
+        range_count = min(max_ranges, math.ceil(count / range_size))
+        if range_count <= 1:
+            return []
+
+        range_size = math.ceil(count / range_count)
+        boundaries = []
+        for _ in range(range_count - 1):
+            range_query = query
+            if boundaries:
+                range_query = {**query, '_id': {'$gte': boundaries[-1]}}
+            documents = list(
+                collection.find(
+                    range_query,
+                    {'_id': 1},
+                    max_time_ms=cls.get_max_time_ms(),
+                )
+                .sort('_id', 1)
+                .skip(range_size)
+                .limit(1)
+            )
+            if not documents:
+                break
+            boundaries.append(documents[0]['_id'])
+
+        return boundaries
+
     @classmethod
     def get_instances(
         cls,
@@ -130,42 +457,198 @@ class MongoHelper:
         submission_ids=None,
         permission_filters=None,
         skip_count=False,
+        cursor=None,
+        count_cache_version=None,
     ):
-        cursor, total_count = cls._get_cursor_and_count(
+        """
+        Return a Mongo cursor of the matching submissions and their count.
+        See `_count()` about `count_cache_version`.
+
+        Results are paginated with `start` and `limit` unless `cursor` (a dict
+        returned by `decode_cursor()`) is provided. In that case, documents are
+        not skipped but filtered on the `(sort key, _id)` pair of the last
+        document of the previous page (aka keyset pagination), which keeps the
+        cost of deep pages constant.
+        """
+        sort_key = None
+        sort_dir = 1
+        if len(sort) == 1:
+            safe_sort = MongoHelper.to_safe_dict(dict(sort), reading=True)
+            sort_key = list(safe_sort.keys())[0]
+            sort_dir = int(safe_sort[sort_key])  # -1 for desc, 1 for asc
+
+        keyset_filter = None
+        if cursor is not None:
+            keyset_filter = cls._get_keyset_filter(cursor, sort_key, sort_dir)
+
+        mongo_cursor, total_count = cls._get_cursor_and_count(
             mongo_userform_id,
             fields=fields,
             query=query,
             submission_ids=submission_ids,
             permission_filters=permission_filters,
             skip_count=skip_count,
+            keyset_filter=keyset_filter,
+            count_cache_version=count_cache_version,
         )
 
-        cursor.skip(start)
+        if cursor is None:
+            mongo_cursor.skip(start)
+
         if limit is not None:
-            cursor.limit(limit)
+            mongo_cursor.limit(limit)
 
-        if len(sort) == 1:
-            sort = MongoHelper.to_safe_dict(sort, reading=True)
-            sort_key = list(sort.keys())[0]
-            sort_dir = int(sort[sort_key])  # -1 for desc, 1 for asc
-            cursor.sort(sort_key, sort_dir)
+        if cursor is not None:
+            # `_id` is the tie-breaker which makes the order deterministic
+            sort_fields = [('_id', sort_dir)]
+            if sort_key and sort_key != '_id':
+                sort_fields.insert(0, (sort_key, sort_dir))
+            mongo_cursor.sort(sort_fields)
+        elif sort_key:
+            mongo_cursor.sort(sort_key, sort_dir)
+
+        if sort_key:
+            cls.record_query_shape(mongo_userform_id, sort_key)
 
         # set batch size
-        cursor.batch_size = cls.DEFAULT_BATCHSIZE
+        mongo_cursor.batch_size = cls.DEFAULT_BATCHSIZE
 
-        return cursor, total_count
+        return mongo_cursor, total_count
+
+    @staticmethod
+    def get_instances_collection() -> 'pymongo.collection.Collection':
+        """
+        Return the collection submissions are read from, according to the
+        current workload. See `analytics_workload()`
+        """
+        if _analytics_workload.get():
+            return settings.MONGO_ANALYTICS_DB.instances
+        return settings.MONGO_DB.instances
+
+    @staticmethod
+    @lru_cache(maxsize=KEY_CODEC_CACHE_SIZE)
+    def get_key_codec(mongo_userform_id: str) -> MongoKeyCodec:
+        """
+        Return the key codec of the form `mongo_userform_id`. It is kept
+        across calls to decode each distinct key of a form only once.
+        """
+        return MongoKeyCodec()
+
+    @classmethod
+    def get_missing_indexes(cls) -> list[dict]:
+        """
+        Return the indexes of `REQUIRED_INDEXES` which do not exist on the
+        submission collection, in a format accepted by `create_indexes()`.
+        """
+        existing_keys = [
+            [(key, int(direction)) for key, direction in index['key']]
+            for index in settings.MONGO_DB.instances.index_information().values()
+        ]
+        return [
+            {'keys': keys}
+            for keys in cls.REQUIRED_INDEXES
+            if keys not in existing_keys
+        ]
+
+    @classmethod
+    def get_query(
+        cls,
+        mongo_userform_id: str,
+        query: dict,
+        submission_ids: list,
+        permission_filters: Optional[list],
+    ) -> dict:
+        """
+        Return the Mongo query (safe for Mongo) matching the submissions of
+        `mongo_userform_id` which also match `query`, `submission_ids` and
+        `permission_filters`
+        """
+        if len(submission_ids) > 0:
+            query.update({
+                '_id': {cls.IN_OPERATOR: submission_ids}
+            })
+
+        query.update({cls.USERFORM_ID: mongo_userform_id})
+
+        # Narrow down query
+        if permission_filters is not None:
+            query = cls.get_permission_filters_query(query, permission_filters)
+
+        return cls.to_safe_dict(query, reading=True)
+
+    @classmethod
+    def get_recommended_indexes(cls, min_count: int) -> list[tuple[dict, int]]:
+        """
+        Return the indexes to create for the fields submissions of a form have
+        been sorted by at least `min_count` times (see
+        `record_query_shape()`), most frequent first, with the number of
+        queries which sorted by these fields. Indexes are in a format
+        accepted by `create_indexes()`.
+
+        Indexes are partial, i.e. restricted to the submissions of the form,
+        to keep them small. MongoDB < 5.0 refuses to create two indexes which
+        only differ by their filter, e.g. for a field with the same name in
+        two forms.
+        """
+        existing_names = settings.MONGO_DB.instances.index_information().keys()
+        recommended_indexes = []
+        query_shapes = (
+            settings.MONGO_DB[cls.QUERY_SHAPES_COLLECTION]
+            .find({'count': {'$gte': min_count}})
+            .sort('count', -1)
+        )
+        for query_shape in query_shapes:
+            mongo_userform_id = query_shape['_id']['userform_id']
+            sort_key = query_shape['_id']['sort']
+            name = cls._get_query_shape_index_name(mongo_userform_id, sort_key)
+            if name in existing_names:
+                continue
+            index = {
+                'keys': [(sort_key, 1), ('_id', 1)],
+                'name': name,
+                'partialFilterExpression': {
+                    cls.USERFORM_ID: mongo_userform_id
+                },
+            }
+            recommended_indexes.append((index, query_shape['count']))
+
+        return recommended_indexes
+
+    @classmethod
+    def get_query_shape_index_names(cls) -> list[str]:
+        """
+        Return the names of the indexes created from recorded query shapes
+        """
+        return [
+            name
+            for name in settings.MONGO_DB.instances.index_information().keys()
+            if name.startswith(cls.QUERY_SHAPE_INDEX_PREFIX)
+        ]
 
     @staticmethod
     def get_max_time_ms():
         """
         Return the appropriate query timeout in milliseconds
         """
-        if celery_app.current_worker_task:
+        if _analytics_workload.get():
+            max_time_secs = settings.MONGO_ANALYTICS_QUERY_TIMEOUT
+        elif celery_app.current_worker_task:
             max_time_secs = settings.MONGO_CELERY_QUERY_TIMEOUT
         else:
             max_time_secs = settings.MONGO_QUERY_TIMEOUT
         return max_time_secs * 1000
 
+    @staticmethod
+    def get_sort_key_and_direction(sort: Optional[dict]) -> tuple[str, int]:
+        """
+        Return the (readable) field name and the direction used to sort
+        results. Only one field is supported; `_id` is used by default.
+        """
+        if sort and len(sort) == 1:
+            sort_key, sort_dir = list(sort.items())[0]
+            return sort_key, -1 if int(sort_dir) < 0 else 1
+        return '_id', 1
+
     @classmethod
     def is_attribute_invalid(cls, key: str) -> str:
         """
@@ -175,6 +658,201 @@ class MongoHelper:
             key.startswith('$') or key.count('.') > 0
         )
 
+    @classmethod
+    def flush_query_shapes(cls):
+        """
+        Add the sorts recorded by this process since the last flush to the
+        stored counts (see `record_query_shape()`)
+        """
+        global _query_shapes, _query_shapes_flushed_at
+
+        with _query_shapes_lock:
+            query_shapes = _query_shapes
+            _query_shapes = Counter()
+            _query_shapes_flushed_at = time.monotonic()
+
+        if not query_shapes:
+            return
+
+        now = timezone.now()
+        try:
+            settings.MONGO_DB[cls.QUERY_SHAPES_COLLECTION].bulk_write(
+                [
+                    UpdateOne(
+                        {'_id': {'userform_id': userform_id, 'sort': sort_key}},
+                        {
+                            '$inc': {'count': count},
+                            '$set': {'last_seen': now},
+                        },
+                        upsert=True,
+                    )
+                    for (userform_id, sort_key), count in query_shapes.items()
+                ],
+                ordered=False,
+            )
+        except PyMongoError as e:
+            # Recording is only an optimization hint, never fail the query
+            logging.warning(f'Could not record query shapes: {e}')
+
+    @classmethod
+    def record_query_shape(cls, mongo_userform_id: str, sort_key: str):
+        """
+        Count how many times submissions of a form are sorted by `sort_key`
+        (safe for Mongo), to recommend indexes. See `get_recommended_indexes()`.
+        Fields covered by `REQUIRED_INDEXES` are not recorded.
+
+        Sorts are counted in memory and written to MongoDB at most every
+        `MONGO_QUERY_SHAPES_FLUSH_INTERVAL` seconds, see
+        `flush_query_shapes()`.
+        """
+        if not settings.MONGO_RECORD_QUERY_SHAPES:
+            return
+
+        if any(sort_key == keys[1][0] for keys in cls.REQUIRED_INDEXES):
+            return
+
+        with _query_shapes_lock:
+            _query_shapes[(mongo_userform_id, sort_key)] += 1
+            must_flush = (
+                time.monotonic() - _query_shapes_flushed_at
+                >= settings.MONGO_QUERY_SHAPES_FLUSH_INTERVAL
+            )
+        if must_flush:
+            cls.flush_query_shapes()
+
+    @classmethod
+    def refresh_daily_counts(
+        cls, mongo_userform_id: str, version: Optional[str] = None
+    ):
+        """
+        Count the submissions of `mongo_userform_id` added after the last
+        refresh (i.e. whose `_id` is greater than the last `_id` already
+        counted), per day and submitter, and add them to the stored daily
+        counts.
+
+        If `version` (see `BaseDeploymentBackend.submission_count_cache_version`)
+        did not change since the last refresh, nothing is counted. If the
+        stored total does not match the number of submissions up to the last
+        `_id` counted (e.g. some have been deleted), counts are rebuilt from
+        scratch. Stored counts are replaced, never deleted beforehand.
+        """
+        counts_collection = settings.MONGO_DB[cls.DAILY_COUNTS_COLLECTION]
+        state_collection = settings.MONGO_DB[cls.DAILY_COUNTS_STATE_COLLECTION]
+        state = state_collection.find_one({'_id': mongo_userform_id}) or {}
+
+        if version is not None and state.get('version') == version:
+            return
+
+        last_id = state.get('last_id')
+        documents, new_last_id = cls._aggregate_daily_counts(
+            mongo_userform_id, last_id
+        )
+        total = state.get('total', 0) + sum(doc['count'] for doc in documents)
+
+        # Compare with the submissions of the same snapshot, i.e. up to the
+        # last `_id` counted: submissions received meanwhile do not count
+        snapshot_query = {cls.USERFORM_ID: mongo_userform_id}
+        if new_last_id is not None:
+            snapshot_query['_id'] = {'$lte': new_last_id}
+        rebuild = total != settings.MONGO_DB.instances.count_documents(
+            snapshot_query, maxTimeMS=cls.get_max_time_ms()
+        )
+        if rebuild:
+            # Submissions have been deleted (or missed)
+            documents, new_last_id = cls._aggregate_daily_counts(
+                mongo_userform_id
+            )
+            total = sum(doc['count'] for doc in documents)
+
+        # Claim this refresh, unless a concurrent one already counted these
+        # submissions
+        try:
+            claimed = state_collection.update_one(
+                {'_id': mongo_userform_id, 'last_id': last_id},
+                {
+                    '$set': {
+                        'last_id': new_last_id,
+                        'total': total,
+                        'version': version,
+                    },
+                },
+                upsert=not state,
+            )
+        except DuplicateKeyError:
+            return
+        if not claimed.matched_count and not claimed.upserted_id:
+            return
+
+        count_ids = []
+        for doc in documents:
+            count_id = {
+                'userform_id': mongo_userform_id,
+                'date': doc['_id']['date'],
+                'submitted_by': doc['_id']['submitted_by'],
+            }
+            count_ids.append(count_id)
+            update = {
+                '$set': {
+                    cls.USERFORM_ID: mongo_userform_id,
+                    'date': doc['_id']['date'],
+                    '_submitted_by': doc['_id']['submitted_by'],
+                },
+            }
+            if rebuild:
+                update['$set']['count'] = doc['count']
+            else:
+                update['$inc'] = {'count': doc['count']}
+            counts_collection.update_one({'_id': count_id}, update, upsert=True)
+
+        if rebuild:
+            # Days (or submitters) left without any submissions
+            counts_collection.delete_many(
+                {
+                    cls.USERFORM_ID: mongo_userform_id,
+                    '_id': {'$nin': count_ids},
+                }
+            )
+
+    @classmethod
+    def _aggregate_daily_counts(
+        cls, mongo_userform_id: str, after_id=None
+    ) -> tuple[list, Any]:
+        """
+        Return the number of submissions of `mongo_userform_id` whose `_id` is
+        greater than `after_id` (all of them if `None`) per day and submitter,
+        and the greatest `_id` counted (`after_id` if none)
+        """
+        query = {cls.USERFORM_ID: mongo_userform_id}
+        if after_id is not None:
+            query['_id'] = {'$gt': after_id}
+
+        documents = list(
+            settings.MONGO_DB.instances.aggregate(
+                [
+                    {'$match': query},
+                    {
+                        '$group': {
+                            '_id': {
+                                # `_submission_time` is stored as a string,
+                                # e.g. `2023-06-01T12:00:00`
+                                'date': {'$substr': ['$_submission_time', 0, 10]},
+                                'submitted_by': {
+                                    '$ifNull': ['$_submitted_by', None]
+                                },
+                            },
+                            'count': {'$sum': 1},
+                            'last_id': {'$max': '$_id'},
+                        }
+                    },
+                ],
+                allowDiskUse=True,
+                maxTimeMS=cls.get_max_time_ms(),
+            )
+        )
+        if not documents:
+            return documents, after_id
+        return documents, max(doc['last_id'] for doc in documents)
+
     @classmethod
     def to_readable_dict(cls, d: dict) -> dict:
         """
@@ -342,20 +1020,13 @@ class MongoHelper:
         submission_ids=None,
         permission_filters=None,
         skip_count=False,
+        keyset_filter=None,
+        count_cache_version=None,
     ):
 
-        if len(submission_ids) > 0:
-            query.update({
-                '_id': {cls.IN_OPERATOR: submission_ids}
-            })
-
-        query.update({cls.USERFORM_ID: mongo_userform_id})
-
-        # Narrow down query
-        if permission_filters is not None:
-            query = cls.get_permission_filters_query(query, permission_filters)
-
-        query = cls.to_safe_dict(query, reading=True)
+        query = cls.get_query(
+            mongo_userform_id, query, submission_ids, permission_filters
+        )
 
         if len(fields) > 0:
             # Retrieve only specified fields from Mongo. Remove
@@ -368,15 +1039,98 @@ class MongoHelper:
             # Retrieve all fields except `cls.USERFORM_ID`
             fields_to_select = {cls.USERFORM_ID: 0}
 
-        cursor = settings.MONGO_DB.instances.find(
-            query, fields_to_select, max_time_ms=cls.get_max_time_ms()
+        # The keyset filter only narrows down the current page, the count must
+        # still reflect all the matching submissions
+        find_query = query
+        if keyset_filter:
+            find_query = {cls.AND_OPERATOR: [query, keyset_filter]}
+
+        cursor = cls.get_instances_collection().find(
+            find_query, fields_to_select, max_time_ms=cls.get_max_time_ms()
         )
         count = None
         if not skip_count:
-            count = settings.MONGO_DB.instances.count_documents(
+            count = cls._count(query, count_cache_version)
+        return cursor, count
+
+    @classmethod
+    def _count(cls, query: dict, count_cache_version: Optional[str] = None) -> int:
+        """
+        Count the documents matching `query`.
+
+        If `count_cache_version` is provided, the result is cached. The key is
+        built from `query`, which already contains the form id and the
+        partial permission filters, and from `count_cache_version`. The caller
+        must change the version whenever the number of submissions of the form
+        may have changed (e.g. new submission, deletion) to invalidate the
+        cached counts.
+        """
+        if count_cache_version is None:
+            return cls.get_instances_collection().count_documents(
                 query, maxTimeMS=cls.get_max_time_ms()
             )
-        return cursor, count
+
+        normalized_query = json_util.dumps(
+            [query, count_cache_version], sort_keys=True
+        )
+        cache_key = (
+            f'{cls.COUNT_CACHE_KEY_PREFIX}:'
+            f'{calculate_hash(normalized_query, algorithm="sha1")}'
+        )
+        count = cache.get(cache_key)
+        if count is None:
+            count = cls.get_instances_collection().count_documents(
+                query, maxTimeMS=cls.get_max_time_ms()
+            )
+            cache.set(cache_key, count, settings.MONGO_COUNT_CACHE_TIMEOUT)
+
+        return count
+
+    @classmethod
+    def _get_query_shape_index_name(
+        cls, mongo_userform_id: str, sort_key: str
+    ) -> str:
+        return cls.QUERY_SHAPE_INDEX_PREFIX + calculate_hash(
+            f'{mongo_userform_id}|{sort_key}'
+        )
+
+    @classmethod
+    def _get_keyset_filter(
+        cls, cursor: dict, sort_key: Optional[str], sort_dir: int
+    ) -> Optional[dict]:
+        """
+        Build the Mongo filter which matches documents located after the one
+        `cursor` points to, according to the sort order.
+
+        `sort_key` must already be safe for Mongo (see `to_safe_dict()`).
+        """
+        if not cursor:
+            # First page
+            return None
+
+        last_id = cursor['_id']
+        id_operator = '$gt' if sort_dir > 0 else '$lt'
+        if not sort_key or sort_key == '_id':
+            return {'_id': {id_operator: last_id}}
+
+        last_value = cursor.get('value')
+        same_value = {sort_key: last_value, '_id': {id_operator: last_id}}
+        # Mongo puts `null` (and missing) values first in ascending order and
+        # last in descending order. Values of other BSON types than
+        # `last_value` are not matched by `$gt`/`$lt` (type bracketing), which
+        # is fine as long as a field always stores the same type.
+        if last_value is None:
+            if sort_dir > 0:
+                return {
+                    cls.OR_OPERATOR: [same_value, {sort_key: {'$ne': None}}]
+                }
+            return same_value
+
+        conditions = [{sort_key: {id_operator: last_value}}, same_value]
+        if sort_dir < 0:
+            conditions.append({sort_key: None})
+
+        return {cls.OR_OPERATOR: conditions}
 
     @classmethod
     def _is_attribute_encoded(cls, key):
@@ -401,3 +1155,63 @@ class MongoHelper:
             if key.startswith("{}.".format(reserved_attribute)):
                 return True
         return False
+
+
+class MongoKeyCodec:
+    """
+    Decode the keys of the submissions of one form.
+
+    `MongoHelper.to_readable_dict()` runs regular expressions on every key of
+    every submission. The keys of the submissions of a form come from a small
+    set (its questions, groups and metadata), thus the codec decodes each
+    distinct key once and only does dictionary lookups afterwards.
+
+    Use `MongoHelper.get_key_codec()` to get the codec of a form.
+    """
+
+    def __init__(self):
+        # Map keys as stored in Mongo to their readable representations, or to
+        # `None` when they are not encoded
+        self._readable_keys = {}
+
+    def decode(self, key: str) -> str:
+        readable_key = self._get_readable_key(key)
+        return key if readable_key is None else readable_key
+
+    def to_readable_dict(self, d: dict) -> dict:
+        """
+        Same as `MongoHelper.to_readable_dict()`, `d` is updated in place.
+        """
+        readable_keys = self._readable_keys
+        for key, value in list(d.items()):
+            value_type = type(value)
+            if value_type == list:
+                # Repeat groups
+                for item in value:
+                    if type(item) == dict:
+                        self.to_readable_dict(item)
+            elif value_type == dict:
+                self.to_readable_dict(value)
+
+            try:
+                readable_key = readable_keys[key]
+            except KeyError:
+                readable_key = self._get_readable_key(key)
+
+            if readable_key is not None:
+                del d[key]
+                d[readable_key] = value
+
+        return d
+
+    def _get_readable_key(self, key: str) -> Optional[str]:
+        try:
+            return self._readable_keys[key]
+        except KeyError:
+            pass
+
+        readable_key = None
+        if MongoHelper._is_attribute_encoded(key):
+            readable_key = MongoHelper.decode(key)
+        self._readable_keys[key] = readable_key
+        return readable_key
@@ -0,0 +1,40 @@
+# coding: utf-8
+from django.core.checks import Warning
+from django.utils.translation import gettext as t
+from pymongo.errors import PyMongoError
+
+from kpi.utils.mongo_helper import MongoHelper
+
+
+def check_mongo_indexes(app_configs, **kwargs):
+    """
+    For use with django.core.checks.register().
+    Warn if indexes submission queries rely on are missing in MongoDB.
+    """
+    try:
+        missing_indexes = MongoHelper.get_missing_indexes()
+    except PyMongoError as e:
+        return [
+            Warning(
+                t('MongoDB indexes could not be verified'),
+                hint=str(e),
+                id='KPI.W001',
+            )
+        ]
+
+    if not missing_indexes:
+        return []
+
+    return [
+        Warning(
+            t('Indexes are missing in MongoDB: ##indexes##').replace(
+                '##indexes##',
+                ', '.join(str(index['keys']) for index in missing_indexes),
+            ),
+            hint=t(
+                'Submission queries may scan the whole collection. '
+                'Run `./manage.py sync_mongo_indexes` to create them.'
+            ),
+            id='KPI.W002',
+        )
+    ]
@@ -0,0 +1,246 @@
+# coding: utf-8
+from __future__ import annotations
+
+import datetime
+import os
+import re
+import shutil
+import tempfile
+import zipfile
+from collections import Counter
+from typing import Iterable, Union
+
+import dateutil.parser
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+
+class ParquetExportWriter:
+    """
+    Write the rows of a formpack `Export` to Parquet, with typed columns.
+
+    Each section of the export (the main table, then one per repeat group)
+    is written to its own Parquet file, linked with `_index`/`_parent_index`
+    like the sheets of XLSX exports. Several files are bundled in a ZIP
+    archive. Rows are written by row groups of `row_group_size`, which bounds
+    the memory used whatever the number of submissions.
+    """
+
+    # formpack data types of the questions whose columns are typed, all
+    # others are text
+    COLUMN_TYPES = {
+        'integer': 'integer',
+        'decimal': 'decimal',
+        'range': 'decimal',
+        'date': 'date',
+        'dateTime': 'datetime',
+        'datetime': 'datetime',
+        'start': 'datetime',
+        'end': 'datetime',
+    }
+    # Columns added by formpack and KPI
+    META_COLUMN_TYPES = {
+        '_id': 'integer',
+        '_index': 'integer',
+        '_parent_index': 'integer',
+        '_submission__id': 'integer',
+        '_submission_time': 'datetime',
+        '_submission__submission_time': 'datetime',
+    }
+
+    def __init__(self, export: 'formpack.reporting.Export', row_group_size: int):
+        if pa is None:
+            raise NotImplementedError(
+                '`pyarrow` is required to export to Parquet'
+            )
+        self.export = export
+        self.row_group_size = row_group_size
+        # Number of values which could not be converted to the type of their
+        # column (and were left empty), by column
+        self.invalid_values = Counter()
+
+    @staticmethod
+    def get_extension(export: 'formpack.reporting.Export') -> str:
+        return 'zip' if len(export.labels) > 1 else 'parquet'
+
+    def write(self, submission_stream: Iterable, output_file):
+        """
+        Write the export of `submission_stream` to the file-like object
+        `output_file`
+        """
+        self.write_chunks(
+            self.export.parse_submissions(submission_stream), output_file
+        )
+
+    def write_chunks(self, chunks: Iterable[dict], output_file):
+        """
+        Write `chunks`, rows already formatted by
+        `formpack.reporting.Export.parse_submissions()`, to the file-like
+        object `output_file`
+        """
+        with tempfile.TemporaryDirectory(prefix='export_parquet') as directory:
+            filenames = {}
+            schemas = {}
+            column_types = {}
+            writers = {}
+            buffers = {}
+            try:
+                for section_name in self.export.labels:
+                    filenames[section_name] = self._get_filename(
+                        section_name, filenames.values()
+                    )
+                    column_types[section_name] = self._get_column_types(
+                        section_name
+                    )
+                    schemas[section_name] = self._get_schema(
+                        section_name, column_types[section_name]
+                    )
+                    writers[section_name] = pq.ParquetWriter(
+                        os.path.join(directory, filenames[section_name]),
+                        schemas[section_name],
+                    )
+                    buffers[section_name] = []
+
+                for chunk in chunks:
+                    for section_name, rows in chunk.items():
+                        if section_name not in buffers:
+                            continue
+                        buffers[section_name].extend(rows)
+                        if len(buffers[section_name]) >= self.row_group_size:
+                            self._write_row_group(
+                                writers[section_name],
+                                schemas[section_name],
+                                column_types[section_name],
+                                buffers[section_name],
+                            )
+                            buffers[section_name] = []
+
+                for section_name, rows in buffers.items():
+                    if rows:
+                        self._write_row_group(
+                            writers[section_name],
+                            schemas[section_name],
+                            column_types[section_name],
+                            rows,
+                        )
+            finally:
+                for writer in writers.values():
+                    writer.close()
+
+            if len(filenames) == 1:
+                filename = next(iter(filenames.values()))
+                with open(os.path.join(directory, filename), 'rb') as f:
+                    shutil.copyfileobj(f, output_file)
+                return
+
+            # Parquet files are already compressed
+            with zipfile.ZipFile(output_file, 'w', zipfile.ZIP_STORED) as zip_:
+                for filename in filenames.values():
+                    zip_.write(os.path.join(directory, filename), filename)
+
+    def _convert(self, value, column_type: str, column_name: str):
+        if value is None or value == '':
+            return None
+
+        try:
+            if column_type == 'integer':
+                return int(value)
+            if column_type == 'decimal':
+                return float(value)
+            if column_type == 'date':
+                if isinstance(value, datetime.date):
+                    return value
+                return datetime.date.fromisoformat(str(value)[:10])
+            if column_type == 'datetime':
+                if not isinstance(value, datetime.datetime):
+                    value = dateutil.parser.isoparse(str(value))
+                # Submission times are stored in UTC without any offset
+                if value.tzinfo is None:
+                    value = value.replace(tzinfo=datetime.timezone.utc)
+                return value
+        except (TypeError, ValueError, OverflowError):
+            self.invalid_values[column_name] += 1
+            return None
+
+        return value if isinstance(value, str) else str(value)
+
+    def _get_column_types(self, section_name: str) -> list[str]:
+        types_by_name = dict(self.META_COLUMN_TYPES)
+        for field in self.export.formpack.get_fields_for_versions(
+            self.export.versions
+        ):
+            column_type = self.COLUMN_TYPES.get(field.data_type)
+            if column_type:
+                types_by_name[field.name] = column_type
+                types_by_name[field.path] = column_type
+
+        return [
+            types_by_name.get(name, 'text')
+            for name in self.export.sections[section_name]
+        ]
+
+    @staticmethod
+    def _get_filename(section_name: str, existing_filenames: Iterable) -> str:
+        basename = re.sub(r'[^\w\-. ]', '_', section_name).strip() or 'data'
+        filename = f'{basename}.parquet'
+        suffix = 1
+        while filename in existing_filenames:
+            suffix += 1
+            filename = f'{basename} ({suffix}).parquet'
+        return filename
+
+    def _get_schema(self, section_name: str, column_types: list) -> 'pa.Schema':
+        arrow_types = {
+            'integer': pa.int64(),
+            'decimal': pa.float64(),
+            'date': pa.date32(),
+            'datetime': pa.timestamp('us', tz='UTC'),
+            'text': pa.string(),
+        }
+        # Column names are the headers of the export and must be unique
+        occurrences = Counter()
+        fields = []
+        for name, label, column_type in zip(
+            self.export.sections[section_name],
+            self.export.labels[section_name],
+            column_types,
+        ):
+            column_name = label or name
+            occurrences[column_name] += 1
+            if occurrences[column_name] > 1:
+                column_name = f'{column_name} ({occurrences[column_name]})'
+            fields.append(pa.field(column_name, arrow_types[column_type]))
+
+        return pa.schema(fields)
+
+    def _write_row_group(
+        self,
+        writer: 'pq.ParquetWriter',
+        schema: 'pa.Schema',
+        column_types: list,
+        rows: list[Union[list, tuple]],
+    ):
+        columns = [
+            [
+                self._convert(
+                    row[index] if index < len(row) else None,
+                    column_type,
+                    schema.field(index).name,
+                )
+                for row in rows
+            ]
+            for index, column_type in enumerate(column_types)
+        ]
+        writer.write_table(
+            pa.Table.from_arrays(
+                [
+                    pa.array(column, type=schema.field(index).type)
+                    for index, column in enumerate(columns)
+                ],
+                schema=schema,
+            ),
+            row_group_size=self.row_group_size,
+        )
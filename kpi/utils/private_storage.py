@@ -42,4 +42,18 @@ def superuser_or_username_matches_prefix(private_file):
     ):
         return True
 
-    return False
+    # Exports can reuse the file of another user's export with the same
+    # content (see `ExportTaskBase._get_reusable_export()`)
+    return _is_export_result_of_user(private_file.relative_name, user)
+
+
+def _is_export_result_of_user(name, user):
+    from kpi.models.import_export_task import (
+        ExportTask,
+        SynchronousExport,
+    )  # avoid circular imports
+
+    return any(
+        model.objects.filter(user=user, result=name).exists()
+        for model in (ExportTask, SynchronousExport)
+    )
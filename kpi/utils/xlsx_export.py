@@ -0,0 +1,91 @@
+# coding: utf-8
+from __future__ import annotations
+
+import datetime
+from typing import Iterable
+
+import xlsxwriter
+from formpack.utils.string import unique_name_for_xls
+
+
+class XlsxExportWriter:
+    """
+    Write rows already formatted by
+    `formpack.reporting.Export.parse_submissions()` to XLSX, with the layout
+    of `formpack.reporting.Export.to_xlsx()`: one sheet per section, created
+    when its first rows are written, starting with the labels (and tags) of
+    its columns.
+
+    Used to merge the rows exported by the shards of an export, which are
+    not submissions anymore.
+    """
+
+    DATE_FORMAT = 'yyyy-mm-dd'
+    DATETIME_FORMAT = 'yyyy-mm-dd hh:mm:ss'
+    TIME_FORMAT = 'hh:mm:ss'
+
+    def __init__(self, export: 'formpack.reporting.Export'):
+        self.export = export
+
+    def write(self, chunks: Iterable[dict], filename: str):
+        """
+        Write `chunks` to the XLSX file `filename`
+        """
+        # Sheets are written row by row, only the current row is kept in
+        # memory
+        workbook = xlsxwriter.Workbook(
+            filename, {'constant_memory': True, 'remove_timezone': True}
+        )
+        workbook.use_zip64()
+        formats = {
+            datetime.datetime: workbook.add_format(
+                {'num_format': self.DATETIME_FORMAT}
+            ),
+            datetime.date: workbook.add_format(
+                {'num_format': self.DATE_FORMAT}
+            ),
+            datetime.time: workbook.add_format(
+                {'num_format': self.TIME_FORMAT}
+            ),
+        }
+        sheets = {}
+        row_positions = {}
+
+        def _append_row(section_name, values):
+            sheet = sheets[section_name]
+            row_index = row_positions[section_name]
+            for column_index, value in enumerate(values):
+                # `datetime` is a subclass of `date`, it must be checked first
+                for type_, format_ in formats.items():
+                    if isinstance(value, type_):
+                        sheet.write_datetime(
+                            row_index, column_index, value, format_
+                        )
+                        break
+                else:
+                    sheet.write(row_index, column_index, value)
+            row_positions[section_name] += 1
+
+        try:
+            for chunk in chunks:
+                for section_name, rows in chunk.items():
+                    if section_name not in sheets:
+                        sheet_name = unique_name_for_xls(
+                            section_name,
+                            [sheet.name for sheet in sheets.values()],
+                        )
+                        sheets[section_name] = workbook.add_worksheet(
+                            sheet_name
+                        )
+                        row_positions[section_name] = 0
+                        _append_row(
+                            section_name, self.export.labels[section_name]
+                        )
+                        if self.export.tag_cols_for_header:
+                            _append_row(
+                                section_name, self.export.tags[section_name]
+                            )
+                    for row in rows:
+                        _append_row(section_name, row)
+        finally:
+            workbook.close()
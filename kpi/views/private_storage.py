@@ -0,0 +1,47 @@
+# coding: utf-8
+import posixpath
+import re
+from urllib.parse import quote
+
+from django.utils.cache import patch_vary_headers
+from private_storage.views import PrivateStorageView
+
+# Same as `django.middleware.gzip.GZipMiddleware`
+ACCEPTS_GZIP_RE = re.compile(r'\bgzip\b')
+
+
+class CompressedExportPrivateStorageView(PrivateStorageView):
+    """
+    Serve private files. Gzip-compressed CSV and GeoJSON exports are served
+    with a `Content-Encoding: gzip` header to the clients which accept it,
+    which decompress them transparently, and as plain `.gz` files otherwise
+    """
+
+    # Content type of the uncompressed files, by extension
+    GZIP_CONTENT_TYPES = {
+        '.csv.gz': 'text/csv; charset=utf-8',
+        '.geojson.gz': 'application/geo+json',
+    }
+
+    def serve_file(self, private_file):
+        response = super().serve_file(private_file)
+
+        for extension, content_type in self.GZIP_CONTENT_TYPES.items():
+            if private_file.relative_name.endswith(extension):
+                break
+        else:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        accept_encoding = self.request.META.get('HTTP_ACCEPT_ENCODING', '')
+        if not ACCEPTS_GZIP_RE.search(accept_encoding):
+            return response
+
+        # Clients save the decompressed content, without `.gz`
+        filename = posixpath.basename(private_file.relative_name)[:-3]
+        response['Content-Type'] = content_type
+        response['Content-Encoding'] = 'gzip'
+        response['Content-Disposition'] = (
+            f"attachment; filename*=UTF-8''{quote(filename)}"
+        )
+        return response
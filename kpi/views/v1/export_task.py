@@ -1,7 +1,9 @@
 # coding: utf-8
 from django.db.models import TextField
 from django.db.models.functions import Cast
+from django.utils.translation import gettext as t
 from rest_framework import exceptions, serializers, status
+from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.reverse import reverse
 
@@ -97,6 +99,7 @@ class ExportTaskViewSet(NoUpdateModelViewSet):
     * "type" (required) specifies the export format. Valid export formats include:
         * "csv",
         * "geojson",
+        * "parquet",
         * "spss_labels", or
         * "xls"
     * "fields" (optional) is an array of column names to be included in the export (including their group hierarchy). Valid inputs include:
@@ -117,6 +120,17 @@ class ExportTaskViewSet(NoUpdateModelViewSet):
     >       curl -X GET https://[kpi]/exports/ehZUwRctkop9QfJgvDmkdh/
 
 
+    ### Cancels current export task
+
+    <pre class="prettyprint">
+    <b>POST</b> /exports/<code>{uid}</code>/cancel/
+    </pre>
+
+    > Example
+    >
+    >       curl -X POST https://[kpi]/exports/ehZUwRctkop9QfJgvDmkdh/cancel/
+
+
     ### Deletes current export task
 
     <pre class="prettyprint">
@@ -215,3 +229,13 @@ class ExportTaskViewSet(NoUpdateModelViewSet):
                 request=request),
             'status': ExportTask.PROCESSING
         }, status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['POST'])
+    def cancel(self, request, *args, **kwargs):
+        export_task = self.get_object()
+        if not export_task.cancel():
+            raise serializers.ValidationError(
+                t('Only exports which are not finished can be cancelled')
+            )
+        serializer = self.get_serializer(export_task)
+        return Response(serializer.data)
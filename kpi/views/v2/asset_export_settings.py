@@ -2,6 +2,8 @@
 import re
 
 from django.http import FileResponse, HttpResponse, HttpResponseRedirect
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
 from django.utils.translation import gettext as t
 from rest_framework import (
     renderers,
@@ -99,10 +101,13 @@ class AssetExportSettingsViewSet(AssetNestedObjectViewsetMixin,
         * "type" (required) specifies the export format. Valid export formats include:
             * "csv",
             * "geojson",
+            * "parquet",
             * "spss_labels", or
             * "xls"
         * "xls_types_as_text" (optional) is a boolean value that defaults to "false" and only affects "xls" export types.
         * "include_media_url" (optional) is a boolean value that defaults to "false" and only affects "xls" and "csv" export types.
+        * "incremental" (optional) is a boolean value that defaults to "false". When "true", only the submissions received or modified (edited, validated) since the previous successful export with the same settings are exported.
+        * "incremental_merge" (optional) is a boolean value that defaults to "false" and only affects incremental "csv" exports. When "true", these submissions are merged into the file of the previous export to produce a full export.
         * "submission_ids" (optional) is an array of submission ids that will filter exported submissions to only the specified array of ids. Valid inputs include:
             * An array containing integer values
             * An empty array (no filtering)
@@ -183,6 +188,16 @@ class AssetExportSettingsViewSet(AssetNestedObjectViewsetMixin,
     asynchronous exports, which are available at
     `/api/v2/assets/{asset_uid}/exports/`.
 
+    The last export generated with the same settings is returned as long as
+    neither the settings, the deployed form nor the submissions have changed.
+    Responses include `ETag` and `Last-Modified` headers, and conditional
+    requests (`If-None-Match`, `If-Modified-Since`) for an unchanged export
+    receive `304 Not Modified`.
+
+    When the submissions have changed, the export is generated again before
+    being returned, unless `?stale_ok=true` is passed: the previous export is
+    then returned right away, while a new one is generated in the background.
+
 
     ### CURRENT ENDPOINT
     """
@@ -235,9 +250,13 @@ class AssetExportSettingsViewSet(AssetNestedObjectViewsetMixin,
         # were originally created for a different format
         settings_obj.export_settings['type'] = format_type
 
+        stale_ok = (
+            request.query_params.get('stale_ok', 'false').lower() == 'true'
+        )
         export = SynchronousExport.generate_or_return_existing(
            user=user,
            asset_export_settings=settings_obj,
+           stale_ok=stale_ok,
         )
         if export.status != export.COMPLETE:
             # The problem has already been logged by `ImportExportTask.run()`,
@@ -249,15 +268,32 @@ class AssetExportSettingsViewSet(AssetNestedObjectViewsetMixin,
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR,
             )
 
-        bad_user_agent = False
-        user_agent = request.META.get('HTTP_USER_AGENT')
-        if user_agent:
-            for ua_pattern in BAD_USER_AGENTS:
-                if re.match(ua_pattern, user_agent):
-                    bad_user_agent = True
-                    break
-        if bad_user_agent:
-            return FileResponse(export.result.file)
-
-        file_location = serializers.FileField().to_representation(export.result)
-        return HttpResponseRedirect(file_location)
+        # The content key changes with the settings, the deployed form and
+        # the submissions, see `ExportTaskBase._get_content_key()`
+        etag = export.content_key
+        if etag:
+            etag = f'"{etag}"'
+        last_modified = int(export.date_created.timestamp())
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            bad_user_agent = False
+            user_agent = request.META.get('HTTP_USER_AGENT')
+            if user_agent:
+                for ua_pattern in BAD_USER_AGENTS:
+                    if re.match(ua_pattern, user_agent):
+                        bad_user_agent = True
+                        break
+            if bad_user_agent:
+                response = FileResponse(export.result.file)
+            else:
+                file_location = serializers.FileField().to_representation(
+                    export.result
+                )
+                response = HttpResponseRedirect(file_location)
+
+        if etag:
+            response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        return response
@@ -6,7 +6,7 @@ from xml.etree import ElementTree as ET
 
 import requests
 from django.conf import settings
-from django.http import Http404
+from django.http import Http404, StreamingHttpResponse
 from django.utils.translation import gettext_lazy as t
 from pymongo.errors import OperationFailure
 from rest_framework import (
@@ -33,7 +33,7 @@ from kpi.constants import (
     PERM_VIEW_SUBMISSIONS,
 )
 from kpi.exceptions import ObjectDeploymentDoesNotExist
-from kpi.models import Asset
+from kpi.models import Asset, SubmissionBulkUpdateTask
 from kpi.paginators import DataPagination
 from kpi.permissions import (
     DuplicateSubmissionPermission,
@@ -43,12 +43,19 @@ from kpi.permissions import (
     ViewSubmissionPermission,
 )
 from kpi.renderers import (
+    StreamingJSONRenderer,
     SubmissionGeoJsonRenderer,
     SubmissionXMLRenderer,
 )
+from kpi.serializers.v2.data import DataBulkActionsValidator
+from kpi.serializers.v2.submission_bulk_update_task import (
+    SubmissionBulkUpdateTaskSerializer,
+)
+from kpi.tasks import bulk_update_submissions_in_background
 from kpi.utils.log import logging
+from kpi.utils.mongo_helper import MongoHelper
+from kpi.utils.object_permission import get_database_user
 from kpi.utils.viewset_mixins import AssetNestedObjectViewsetMixin
-from kpi.serializers.v2.data import DataBulkActionsValidator
 
 
 class DataViewSet(AssetNestedObjectViewsetMixin, NestedViewSetMixin,
@@ -90,6 +97,16 @@ class DataViewSet(AssetNestedObjectViewsetMixin, NestedViewSetMixin,
     >
     >       curl -X GET https://[kpi]/api/v2/assets/aSAvYreNzVEkrWg5Gdcvg/data/?start=0&limit=10
 
+    For large projects, prefer the `cursor` parameter to `start`. Pass an empty
+    `cursor` to get the first page, then follow the `next` link of each
+    response. It contains an opaque cursor pointing right after the last
+    result of the page, which makes every page as fast as the first one.
+    `previous` is always `null` with this pagination.
+
+    > Example: Walk through all the results, ten by ten, sorted by `_submission_time`
+    >
+    >       curl -X GET 'https://[kpi]/api/v2/assets/aSAvYreNzVEkrWg5Gdcvg/data/?cursor=&limit=10&sort={"_submission_time":1}'
+
     ## Query submitted data
     Provides a list of submitted data for a specific form. Use `query`
     parameter to apply form data specific, see
@@ -98,7 +115,20 @@ class DataViewSet(AssetNestedObjectViewsetMixin, NestedViewSetMixin,
 
     For more details see
     <a href="https://github.com/SEL-Columbia/formhub/wiki/Formhub-Access-Points-(API)#api-parameters">API Parameters</a>.
-    <span class='label label-warning'>API parameter `count` is not implemented</span>
+
+    ## Estimated count
+
+    By default, `count` is the exact number of matching submissions. Pass
+    `count=estimate` to read it from the submission counter of the form
+    instead, which is much faster on large forms. The counter may be slightly
+    off (e.g. while submissions are being processed). It is only used when
+    results are not filtered by `query` or by partial permissions; otherwise,
+    the number of matching submissions is counted (and cached until the form
+    receives or loses submissions).
+
+    > Example
+    >
+    >       curl -X GET 'https://[kpi]/api/v2/assets/aSAvYreNzVEkrWg5Gdcvg/data/?count=estimate'
 
 
     <pre class="prettyprint">
@@ -110,6 +140,19 @@ class DataViewSet(AssetNestedObjectViewsetMixin, NestedViewSetMixin,
     >       curl -X GET 'https://[kpi]/api/v2/assets/aSAvYreNzVEkrWg5Gdcvg/data/?query={"__version__": "vWvkKzNE8xCtfApJvabfjG"}'
     >       curl -X GET 'https://[kpi]/api/v2/assets/aSAvYreNzVEkrWg5Gdcvg/data/?query={"_submission_time": {"$gt": "2019-09-01T01:02:03"}}'
 
+    ## Streaming
+
+    Pass `stream=true` to receive the response in chunks, as submissions are
+    read from the database, instead of once it has been entirely built. It
+    lowers the memory usage and the time to first byte for large results.
+    Only `json` and `geojson` formats support it. Because the status code is
+    sent before all the submissions are read, an error occurring in the middle
+    of the response truncates it.
+
+    > Example
+    >
+    >       curl -X GET 'https://[kpi]/api/v2/assets/aSAvYreNzVEkrWg5Gdcvg/data/?format=geojson&stream=true'
+
     ## About the GeoJSON format
 
     Requesting the `geojson` format returns a `FeatureCollection` where each
@@ -125,6 +168,37 @@ class DataViewSet(AssetNestedObjectViewsetMixin, NestedViewSetMixin,
     * `geotrace` to `LineString`;
     * `geoshape` to `Polygon`.
 
+    ## Map clusters
+
+    Submissions located by their first geopoint within a bounding box can be
+    counted per cell of a grid which depends on the zoom level of the map,
+    instead of downloading all of them as GeoJSON.
+
+    <pre class="prettyprint">
+    <b>GET</b> /api/v2/assets/<code>{asset_uid}</code>/data/geo_clusters/?bbox=<code>{min_lon},{min_lat},{max_lon},{max_lat}</code>&zoom=<code>{zoom}</code>
+    </pre>
+
+    `zoom` is an integer between 0 and 24. `query` can be used to narrow down
+    the submissions, like in the list endpoint. Each result gives the average
+    location of the submissions of its cell and their count, and the id of
+    the submission when there is only one.
+
+    > Example
+    >
+    >       curl -X GET 'https://[kpi]/api/v2/assets/aSAvYreNzVEkrWg5Gdcvg/data/geo_clusters/?bbox=-80,40,-70,50&zoom=6'
+
+    > Response
+    >
+    >       HTTP 200 Ok
+    >       {
+    >           "count": 3,
+    >           "zoom": 6,
+    >           "results": [
+    >               {"latitude": 45.55, "longitude": -73.55, "count": 2},
+    >               {"latitude": 43.65, "longitude": -79.38, "count": 1, "submission_id": 3}
+    >           ]
+    >       }
+
     ## CRUD
 
     * `uid` - is the unique identifier of a specific asset
@@ -294,6 +368,34 @@ class DataViewSet(AssetNestedObjectViewsetMixin, NestedViewSetMixin,
     "group_1/sub_group_1/.../sub_group_n/question_1": "new value"
     </pre>
 
+    When more than `SUBMISSION_BULK_UPDATE_ASYNC_THRESHOLD` submissions are
+    targeted, the update runs in the background and the response
+    (`202 Accepted`) describes the task instead. Poll its `url` until `status`
+    is `complete` (or `error`). `processed` counts the submissions sent so far
+    and `result` contains the same data as a synchronous bulk update.
+
+    <pre class="prettyprint">
+    <b>GET</b> /api/v2/assets/<code>{uid}</code>/data/bulk/<code>{task_uid}</code>/
+    </pre>
+
+    > Example
+    >
+    >       curl -X GET https://[kpi]/api/v2/assets/aSAvYreNzVEkrWg5Gdcvg/data/bulk/buGdhCkLhKy7LYMhnLg4Ce3/
+
+    > Response
+    >
+    >       HTTP 200 Ok
+    >       {
+    >           "url": "https://[kpi]/api/v2/assets/aSAvYreNzVEkrWg5Gdcvg/data/bulk/buGdhCkLhKy7LYMhnLg4Ce3/",
+    >           "uid": "buGdhCkLhKy7LYMhnLg4Ce3",
+    >           "status": "processing",
+    >           "messages": {},
+    >           "date_created": "2023-06-01T12:00:00.000000Z",
+    >           "count": 2000,
+    >           "processed": 850,
+    >           "result": null
+    >       }
+
 
     ### CURRENT ENDPOINT
     """
@@ -308,6 +410,22 @@ class DataViewSet(AssetNestedObjectViewsetMixin, NestedViewSetMixin,
     permission_classes = (SubmissionPermission,)
     pagination_class = DataPagination
 
+    def _bulk_update_in_background(self, data: dict, count: int) -> Response:
+        bulk_update_task = SubmissionBulkUpdateTask.objects.create(
+            user=get_database_user(self.request.user),
+            asset=self.asset,
+            data={'payload': data, 'count': count},
+        )
+        bulk_update_submissions_in_background.delay(
+            task_uid=bulk_update_task.uid
+        )
+        # The task may have already run, e.g. with `CELERY_TASK_ALWAYS_EAGER`
+        bulk_update_task.refresh_from_db()
+        serializer = SubmissionBulkUpdateTaskSerializer(
+            bulk_update_task, context=self.get_serializer_context()
+        )
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+
     def _get_deployment(self):
         """
         Returns the deployment for the asset specified by the request
@@ -336,6 +454,25 @@ class DataViewSet(AssetNestedObjectViewsetMixin, NestedViewSetMixin,
 
         bulk_actions_validator = DataBulkActionsValidator(**kwargs)
         bulk_actions_validator.is_valid(raise_exception=True)
+
+        if request.method == 'PATCH':
+            data = bulk_actions_validator.data
+            count = len(data['submission_ids']) or (
+                deployment.calculated_submission_count(
+                    request.user, query=data['query']
+                )
+            )
+            if count > settings.SUBMISSION_BULK_UPDATE_ASYNC_THRESHOLD:
+                # Refuse right away rather than queuing a task which would
+                # fail later
+                deployment.validate_access_with_partial_perms(
+                    user=request.user,
+                    perm=PERM_CHANGE_SUBMISSIONS,
+                    submission_ids=data['submission_ids'],
+                    query=data['query'],
+                )
+                return self._bulk_update_in_background(data, count)
+
         audit_logs = []
         if request.method == 'DELETE':
             # Prepare audit logs
@@ -377,6 +514,27 @@ class DataViewSet(AssetNestedObjectViewsetMixin, NestedViewSetMixin,
 
         return Response(**json_response)
 
+    @action(
+        detail=False,
+        methods=['GET'],
+        url_path=r'bulk/(?P<task_uid>[^/.]+)',
+        renderer_classes=[renderers.JSONRenderer],
+    )
+    def bulk_task(self, request, task_uid, *args, **kwargs):
+        try:
+            bulk_update_task = SubmissionBulkUpdateTask.objects.get(
+                uid=task_uid,
+                asset=self.asset,
+                user=get_database_user(request.user),
+            )
+        except SubmissionBulkUpdateTask.DoesNotExist:
+            raise Http404
+
+        serializer = SubmissionBulkUpdateTaskSerializer(
+            bulk_update_task, context=self.get_serializer_context()
+        )
+        return Response(serializer.data)
+
     def destroy(self, request, pk, *args, **kwargs):
         deployment = self._get_deployment()
         # Coerce to int because back end only finds matches with same type
@@ -442,6 +600,40 @@ class DataViewSet(AssetNestedObjectViewsetMixin, NestedViewSetMixin,
         submission_id = positive_int(pk)
         return self._get_enketo_link(request, submission_id, 'view')
 
+    @action(
+        detail=False,
+        methods=['GET'],
+        renderer_classes=[renderers.JSONRenderer],
+        url_path='geo_clusters',
+    )
+    def geo_clusters(self, request, *args, **kwargs):
+        deployment = self._get_deployment()
+        bbox, zoom = self._get_geo_clusters_params(request)
+        clusters = deployment.aggregate_submissions(
+            request.user,
+            MongoHelper.get_geo_clusters_pipeline(bbox, zoom),
+            query=request.GET.get('query', {}),
+        )
+
+        results = []
+        for cluster in clusters:
+            result = {
+                'latitude': cluster['latitude'],
+                'longitude': cluster['longitude'],
+                'count': cluster['count'],
+            }
+            if cluster['count'] == 1:
+                result['submission_id'] = cluster['submission_id']
+            results.append(result)
+
+        return Response(
+            {
+                'count': sum(cluster['count'] for cluster in results),
+                'zoom': zoom,
+                'results': results,
+            }
+        )
+
     def get_queryset(self):
         # This method is needed when pagination is activated and renderer is
         # `BrowsableAPIRenderer`. Because data comes from Mongo, `list()` and
@@ -452,18 +644,30 @@ class DataViewSet(AssetNestedObjectViewsetMixin, NestedViewSetMixin,
         format_type = kwargs.get('format', request.GET.get('format', 'json'))
         deployment = self._get_deployment()
         filters = self._filter_mongo_query(request)
+        stream = filters.pop('stream', 'false').lower() == 'true'
+        if stream and format_type not in ('json', 'geojson'):
+            raise serializers.ValidationError(
+                {'stream': t('This param is only supported in `JSON` and '
+                             '`GeoJSON` formats')}
+            )
 
         if format_type == 'geojson':
             # For GeoJSON, get the submissions as JSON and let
             # `SubmissionGeoJsonRenderer` handle the rest
-            return Response(
-                deployment.get_submissions(
-                    user=request.user,
-                    format_type=SUBMISSION_FORMAT_TYPE_JSON,
-                    request=request,
-                    **filters
-                )
+            submissions = deployment.get_submissions(
+                user=request.user,
+                format_type=SUBMISSION_FORMAT_TYPE_JSON,
+                request=request,
+                **filters
             )
+            if stream:
+                return StreamingHttpResponse(
+                    SubmissionGeoJsonRenderer().stream(
+                        submissions, self.get_renderer_context()
+                    ),
+                    content_type=SubmissionGeoJsonRenderer.media_type,
+                )
+            return Response(submissions)
 
         try:
             submissions = deployment.get_submissions(request.user,
@@ -477,15 +681,40 @@ class DataViewSet(AssetNestedObjectViewsetMixin, NestedViewSetMixin,
                 raise serializers.ValidationError(message)
             logging.warning(message, exc_info=True)
             raise serializers.ValidationError('Unsupported query')
-        # Create a dummy list to let the Paginator do all the calculation
-        # for pagination because it does not need the list of real objects.
-        # It avoids retrieving all the objects from MongoDB
-        dummy_submissions_list = [None] * deployment.current_submission_count
-        page = self.paginate_queryset(dummy_submissions_list)
+        # Give a range to the Paginator to let it do all the calculation for
+        # pagination because it does not need the list of real objects.
+        # It avoids retrieving all the objects from MongoDB and, unlike a list,
+        # it does not allocate memory proportional to the number of submissions
+        page = self.paginate_queryset(
+            range(deployment.current_submission_count)
+        )
         if page is not None:
-            return self.get_paginated_response(submissions)
+            if self.paginator.use_cursor:
+                # The page size is bounded by `limit`, so it can be loaded in
+                # memory to get its last submission and build the next cursor
+                submissions = list(submissions)
+                if submissions and len(submissions) == filters['limit']:
+                    sort = filters.get('sort', {})
+                    if isinstance(sort, str):
+                        sort = json.loads(sort)
+                    self.paginator.next_cursor = MongoHelper.encode_cursor(
+                        submissions[-1], sort
+                    )
+            response = self.get_paginated_response(submissions)
+        else:
+            if stream:
+                response = Response(submissions)
+            else:
+                response = Response(list(submissions))
 
-        return Response(list(submissions))
+        if stream:
+            # `response.data` still holds the (lazy) stream of submissions
+            return StreamingHttpResponse(
+                StreamingJSONRenderer().stream(response.data),
+                content_type=StreamingJSONRenderer.media_type,
+            )
+
+        return response
 
     def retrieve(self, request, pk, *args, **kwargs):
         """
@@ -497,12 +726,9 @@ class DataViewSet(AssetNestedObjectViewsetMixin, NestedViewSetMixin,
         """
         format_type = kwargs.get('format', request.GET.get('format', 'json'))
         deployment = self._get_deployment()
-        params = {
-            'user': request.user,
-            'format_type': format_type,
-            'request': request,
-        }
         filters = self._filter_mongo_query(request)
+        # Only one submission is returned
+        filters.pop('limit', None)
 
         # Unfortunately, Django expects that the URL parameter is `pk`,
         # its name cannot be changed (easily).
@@ -515,30 +741,28 @@ class DataViewSet(AssetNestedObjectViewsetMixin, NestedViewSetMixin,
             ):
                 raise Http404
 
+        if 'query' in filters:
             try:
-                query = json.loads(filters.pop('query', '{}'))
+                filters['query'] = json.loads(filters['query'])
             except json.JSONDecodeError:
                 raise serializers.ValidationError(
                     {'query': t('Value must be valid JSON.')}
                 )
-            query['_uuid'] = submission_id_or_uuid
-            filters['query'] = query
-        else:
-            params['submission_ids'] = [submission_id_or_uuid]
-
-        # Join all parameters to be passed to `deployment.get_submissions()`
-        params.update(filters)
-
-        # The `get_submissions()` is a generator in KobocatDeploymentBackend
-        # class but a list in MockDeploymentBackend. We cast the result as a list
-        # no matter what is the deployment back-end class to make it work with
-        # both. Since the number of submissions is be very small, it should not
-        # have a big impact on memory (i.e. list vs generator)
-        submissions = list(deployment.get_submissions(**params))
-        if not submissions:
+
+        # Without any other filters, the JSON of the submission is served from
+        # the cache if it has been retrieved recently. The XML is used to edit
+        # submissions and must reflect edits made in Enketo right away.
+        submission = deployment.get_submission(
+            submission_id_or_uuid,
+            user=request.user,
+            format_type=format_type,
+            request=request,
+            use_cache=format_type == SUBMISSION_FORMAT_TYPE_JSON,
+            **filters
+        )
+        if submission is None:
             raise Http404
 
-        submission = submissions[0]
         return Response(submission)
 
     @action(detail=True, methods=['POST'],
@@ -623,6 +847,39 @@ class DataViewSet(AssetNestedObjectViewsetMixin, NestedViewSetMixin,
 
         return filters
 
+    @staticmethod
+    def _get_geo_clusters_params(request: Request) -> tuple[tuple, int]:
+        try:
+            bbox = tuple(
+                float(coordinate)
+                for coordinate in request.GET.get('bbox', '').split(',')
+            )
+        except ValueError:
+            bbox = ()
+        if (
+            len(bbox) != 4
+            or not all(-180 <= lon <= 180 for lon in bbox[::2])
+            or not all(-90 <= lat <= 90 for lat in bbox[1::2])
+            or bbox[1] > bbox[3]
+        ):
+            raise serializers.ValidationError(
+                {
+                    'bbox': t(
+                        'Value must be `min_longitude,min_latitude,'
+                        'max_longitude,max_latitude`'
+                    )
+                }
+            )
+
+        try:
+            zoom = positive_int(request.GET.get('zoom', 0), cutoff=24)
+        except ValueError:
+            raise serializers.ValidationError(
+                {'zoom': t('A positive integer is required')}
+            )
+
+        return bbox, zoom
+
     def _get_enketo_link(
         self, request: Request, submission_id: int, action_: str
     ) -> Response:
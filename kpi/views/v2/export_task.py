@@ -1,8 +1,12 @@
 # coding: utf-8
+from django.utils.translation import gettext as t
 from rest_framework import (
     filters,
     renderers,
+    serializers,
 )
+from rest_framework.decorators import action
+from rest_framework.response import Response
 from rest_framework_extensions.mixins import NestedViewSetMixin
 
 from kpi.filters import SearchFilter
@@ -100,6 +104,7 @@ class ExportTaskViewSet(
     * "type" (required) specifies the export format. Valid export formats include:
         * "csv",
         * "geojson",
+        * "parquet",
         * "spss_labels", or
         * "xls"
     * "fields" (optional) is an array of column names to be included in the export (including their group hierarchy). Valid inputs include:
@@ -109,6 +114,9 @@ class ExportTaskViewSet(
     * "flatten" (optional) is a boolean value and only relevant when exporting to "geojson" format.
     * "xls_types_as_text" (optional) is a boolean value that defaults to "false" and only affects "xls" export types.
     * "include_media_url" (optional) is a boolean value that defaults to "false" and only affects "xls" and "csv" export types. This will include an additional column for media-type questions ("question_name_URL") with the URL link to the hosted file.
+    * "incremental" (optional) is a boolean value that defaults to "false". When "true", only the submissions received or modified (edited, validated) since the previous successful export with the same settings are exported.
+    * "incremental_merge" (optional) is a boolean value that defaults to "false" and only affects incremental "csv" exports. When "true", these submissions are merged into the file of the previous export to produce a full export.
+    * "compression" (optional) is either "gzip" or "zip" and only allowed for "csv" and "geojson" exports. The file of the export ("result") is compressed as it is written. Gzip-compressed files are downloaded with a `Content-Encoding: gzip` header by clients which accept it, and are thus decompressed transparently.
     * "submission_ids" (optional) is an array of submission ids that will filter exported submissions to only the specified array of ids. Valid inputs include:
         * An array containing integer values
         * An empty array (no filtering)
@@ -128,6 +136,27 @@ class ExportTaskViewSet(
     >       curl -X GET https://[kpi]/api/v2/assets/aSAvYreNzVEkrWg5Gdcvg/exports/ehZUwRctkop9QfJgvDmkdh/
 
 
+    While the export is processed, `data.progress` reports the number of
+    submissions `processed` so far, the estimated `total` (counted once the
+    export has lasted a few seconds) and the number of `bytes_written` (before
+    compression), along with the time of the last update (`date_modified`).
+
+
+    ### Cancels current export task
+
+    <pre class="prettyprint">
+    <b>POST</b> /api/v2/assets/<code>{asset_uid}</code>/exports/<code>{uid}</code>/cancel/
+    </pre>
+
+    > Example
+    >
+    >       curl -X POST https://[kpi]/api/v2/assets/aSAvYreNzVEkrWg5Gdcvg/exports/ehZUwRctkop9QfJgvDmkdh/cancel/
+
+    An export waiting to be processed is cancelled right away; an export
+    being processed stops shortly after. Its status then becomes `error`.
+    Complete or errored exports cannot be cancelled.
+
+
     ### Deletes current export task
 
     <pre class="prettyprint">
@@ -167,3 +196,12 @@ class ExportTaskViewSet(
             data__source__icontains=self.kwargs['parent_lookup_asset'],
         )
 
+    @action(detail=True, methods=['POST'])
+    def cancel(self, request, *args, **kwargs):
+        export_task = self.get_object()
+        if not export_task.cancel():
+            raise serializers.ValidationError(
+                t('Only exports which are not finished can be cancelled')
+            )
+        serializer = self.get_serializer(export_task)
+        return Response(serializer.data)
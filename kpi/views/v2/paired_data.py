@@ -18,6 +18,7 @@ from kpi.permissions import (
 from kpi.serializers.v2.paired_data import PairedDataSerializer
 from kpi.renderers import SubmissionXMLRenderer
 from kpi.utils.hash import calculate_hash
+from kpi.utils.mongo_helper import MongoHelper
 from kpi.utils.viewset_mixins import AssetNestedObjectViewsetMixin
 from kpi.utils.xml import strip_nodes, add_xml_declaration
 
@@ -185,6 +186,7 @@ class PairedDataViewset(AssetNestedObjectViewsetMixin,
             renderer_classes=[SubmissionXMLRenderer],
             filter_backends=[],
             )
+    @MongoHelper.analytics_workload()
     def external(self, request, paired_data_uid, **kwargs):
         """
         Returns an XML which contains data submitted to paired asset